@@ -1,17 +1,41 @@
 """
 Pet Adorable Life - 網站主程式
 """
+import contextvars
+import functools
+import hashlib
+import hmac
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import (
+    Flask, Response, render_template, request, jsonify, session, redirect, url_for, flash,
+    send_file, stream_with_context,
+)
 from werkzeug.security import generate_password_hash, check_password_hash
 
+import assets
+import compression
+import health
+import json_provider
+import metrics
 import model_connector
 import pet_model_config
+import profiling
+import server_timing
+import tracing
 import db
 
 app = Flask(__name__)
+metrics.init_app(app)
+tracing.init_app(app)
+profiling.init_app(app)
+server_timing.init_app(app)
+json_provider.init_app(app)
+compression.init_app(app)
+assets.init_app(app)
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB
 _secret = os.getenv("SECRET_KEY", "dev-only-insecure-key")
 if _secret == "dev-only-insecure-key":
@@ -19,7 +43,13 @@ if _secret == "dev-only-insecure-key":
     warnings.warn("SECRET_KEY is not set — using insecure default. Set SECRET_KEY in production.", stacklevel=1)
 app.secret_key = _secret
 
-_EXEMPT_ENDPOINTS = {"login", "register", "logout", "static"}
+# 健康檢查、指標與 profile 下載不需登入（後兩者另以 token 保護），也不觸發 init_db
+_PROBE_ENDPOINTS = {"healthz", "readyz", "metrics_endpoint", "debug_profile", "debug_profile_file"}
+# 設定時 /metrics 需帶 Authorization: Bearer <token>
+_METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# analysis_results 的保存天數（跨 worker 共用與近似重複圖片沿用的結果）；0 表示不清除
+_ANALYSIS_RESULT_TTL_DAYS = int(os.getenv("ANALYSIS_RESULT_TTL_DAYS", "30"))
+_EXEMPT_ENDPOINTS = {"login", "register", "logout", "static"} | _PROBE_ENDPOINTS
 
 
 def current_user_id():
@@ -27,29 +57,127 @@ def current_user_id():
     return session.get("user_id")
 
 _ALLOWED_IMAGE_EXTS = {"png", "jpg", "jpeg", "webp", "gif"}
+_MAX_BATCH_IMAGES = 20
 
 
-def _validate_image_file(file):
-    """回傳 (None, None) 表示驗證通過；否則回傳 (error_response, status_code)。"""
+def _image_file_error(file):
+    """回傳圖片檔案的錯誤訊息，驗證通過則回傳 None。"""
     if file.filename == "":
-        return jsonify({"error": "未選擇檔案"}), 400
+        return "未選擇檔案"
     ext = file.filename.rsplit(".", 1)[-1].lower() if "." in file.filename else ""
     if ext not in _ALLOWED_IMAGE_EXTS:
-        return jsonify({"error": f"不支援的格式，請使用: {', '.join(_ALLOWED_IMAGE_EXTS)}"}), 400
+        return f"不支援的格式，請使用: {', '.join(_ALLOWED_IMAGE_EXTS)}"
+    return None
+
+
+def _uploaded_files():
+    """解析 multipart 上傳；另開 span 以便和模型呼叫的時間分開。"""
+    with tracing.span("parse_upload", **{"http.request_content_length": request.content_length}) as span:
+        files = request.files
+        span.set_attribute("upload.files", len(files))
+    return files
+
+
+def _validate_image_file(file):
+    """回傳 (None, None) 表示驗證通過；否則回傳 (error_response, status_code)。"""
+    error = _image_file_error(file)
+    if error:
+        return jsonify({"error": error}), 400
     return None, None
 
 
+def _requested_fields():
+    """解析 ?fields=id,name 為欄位 tuple；未指定時回傳 None（全部欄位）。"""
+    raw = request.args.get("fields")
+    if not raw:
+        return None
+    return tuple(f.strip() for f in raw.split(",") if f.strip())
+
+
+_FIELDS_ERROR = "fields 參數包含不支援的欄位"
+# 只需確認資料存在時，不必讓圖片等大欄位離開 MySQL
+_EXISTS_ONLY = ("id",)
+
+
+def _source_digest(paths):
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+# 清單回應的欄位與序列化由這些模組決定；部署改動其中任一個時 ETag 跟著改變，
+# 否則集合版本沒變的用戶端會繼續以 304 沿用舊格式的內容
+_REPRESENTATION_VERSION = _source_digest((__file__, db.__file__, json_provider.__file__))
+
+
+def _conditional_collection(collection):
+    """清單 API 的條件式 GET：以集合版本計算 ETag，If-None-Match 相符時直接回 304，不執行清單查詢。"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            uid = current_user_id()
+            state = db.get_collection_version(collection, uid)
+            # 同一版本下 pet_id、fields 不同，內容也不同，因此查詢字串一併納入
+            etag = hashlib.sha1(
+                f"{_REPRESENTATION_VERSION}:{collection}:{uid}:{state['version']}:"
+                f"{request.query_string.decode()}".encode()
+            ).hexdigest()
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if isinstance(state["updated_at"], datetime):
+                response.last_modified = state["updated_at"]
+            # 瀏覽器仍會快取，但每次使用前都帶 If-None-Match 重新驗證
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
+
+
+# 頁面下拉選單只需要寵物的 id 與名稱
+_PET_OPTIONS = ("id", "name")
+# 頁面 HTML 每次都重新下載，日記圖片不嵌入，改由頁面向可 304 重新驗證的 /api/diaries 取得
+_DIARY_LIST_FIELDS = tuple(f for f in db.DIARY_FIELDS if f != "image_base64")
+
+
+def _page_data(sections, product_id=None):
+    """頁面初始資料，在 template 中以 JSON script 區塊嵌入，首次繪製不必再發 API 請求。"""
+    return db.get_page_data(current_user_id(), sections, product_id=product_id)
+
+
+def _analysis_models():
+    """回傳設定的模型階梯；未設定時只用 pet_model_name。"""
+    cascade = getattr(pet_model_config, "pet_model_cascade", None)
+    if cascade:
+        return list(cascade)
+    return getattr(pet_model_config, "pet_model_name", "qwen3-vl:4b")
+
+
 @app.before_request
 def _ensure_db():
     """確保資料表已建立（僅執行一次）。"""
+    if request.endpoint in _PROBE_ENDPOINTS:
+        return
     if not getattr(app, "_db_initialized", False):
         db.init_db()
         app._db_initialized = True
+        if _ANALYSIS_RESULT_TTL_DAYS > 0:
+            try:
+                db.prune_analysis_results(_ANALYSIS_RESULT_TTL_DAYS * 86400)
+            except Exception:
+                # 清除失敗不影響服務，下次啟動再試
+                app.logger.exception("Pruning analysis_results failed")
 
 
 @app.before_request
 def _require_login():
-    """所有路由都需要登入，例外：login、register、logout、static。"""
+    """所有路由都需要登入，例外：login、register、logout、static 與健康檢查。"""
     if request.endpoint in _EXEMPT_ENDPOINTS:
         return
     if not current_user_id():
@@ -58,6 +186,66 @@ def _require_login():
         return redirect(url_for("login"))
 
 
+# ========== Health checks ==========
+
+
+@app.route("/healthz")
+def healthz():
+    """存活檢查：不做任何 I/O"""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    """就緒檢查：MySQL 與 Ollama 的可用性與延遲（結果有快取）"""
+    ready, body = health.readiness()
+    return jsonify(body), 200 if ready else 503
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus 文字格式的執行期指標；需 Authorization: Bearer <METRICS_TOKEN>，未設定 token 時不開放"""
+    if not _METRICS_TOKEN:
+        return Response("not found\n", status=404, mimetype="text/plain")
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied, f"Bearer {_METRICS_TOKEN}"):
+        return Response("unauthorized\n", status=401, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _profile_unauthorized():
+    """/debug 路由需 Authorization: Bearer <PROFILE_TOKEN>；驗證失敗時回傳 401 回應。"""
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not profiling.authorized(supplied):
+        return Response("unauthorized\n", status=401, mimetype="text/plain")
+    return None
+
+
+@app.route("/debug/profile")
+def debug_profile():
+    """常駐取樣的彙整 folded stacks；?view=wall|cpu，?seconds= 為回溯秒數（預設 600）"""
+    denied = _profile_unauthorized()
+    if denied:
+        return denied
+    view = request.args.get("view", "wall")
+    if view not in profiling.VIEWS:
+        return Response("view must be wall or cpu\n", status=400, mimetype="text/plain")
+    seconds = request.args.get("seconds", 600, type=int)
+    return Response(profiling.format_folded(profiling.sampler.folded(view, seconds)), mimetype="text/plain")
+
+
+@app.route("/debug/profiles/<name>")
+def debug_profile_file(name):
+    """下載 X-Profile 請求產生的 folded stacks"""
+    denied = _profile_unauthorized()
+    if denied:
+        return denied
+    path = profiling.store.path(name)
+    if path is None:
+        return Response("not found\n", status=404, mimetype="text/plain")
+    return send_file(os.path.abspath(path), mimetype="text/plain", as_attachment=True, download_name=name)
+
+
 # ========== Auth routes ==========
 
 
@@ -125,21 +313,21 @@ def index():
 @app.route("/product/analyze")
 def product_analyze_page():
     """商品分析頁面"""
-    return render_template("product_analyze.html")
+    return render_template("product_analyze.html", bootstrap=_page_data({"pets": _PET_OPTIONS}))
 
 
 @app.route("/api/product/analyze", methods=["POST"])
 def api_product_analyze():
     """上傳商品圖片並回傳 AI 分析結果"""
-    if "image" not in request.files:
+    files = _uploaded_files()
+    if "image" not in files:
         return jsonify({"error": "未上傳圖片"}), 400
-    file = request.files["image"]
+    file = files["image"]
     err, status = _validate_image_file(file)
     if err:
         return err, status
 
-    model_name = getattr(pet_model_config, "pet_model_name", "qwen3-vl:4b")
-    result = model_connector.get_model_response_by_image(model_name, file)
+    result = model_connector.get_model_response_by_image(_analysis_models(), file, user_id=current_user_id())
     if result is None:
         return jsonify({"error": "分析失敗，請確認 Ollama 服務是否運行", "_raw": ""}), 500
     if result.get("error"):
@@ -147,16 +335,114 @@ def api_product_analyze():
     return jsonify(result)
 
 
+def _packing_model(models):
+    """回傳可一次分析多張圖片的模型，沒有則回傳 None。"""
+    candidates = [models] if isinstance(models, str) else models
+    multi = getattr(pet_model_config, "multi_image_models", None) or []
+    return next((m for m in candidates if m in multi), None)
+
+
+def _analyze_batch(uploads, models, user_id, pack):
+    """產生批次分析的 NDJSON 行；每張圖片完成即送出，不等整批結束。
+
+    uploads 為 (index, filename, error, data) 清單，error 不為 None 的項目直接回報錯誤。
+    """
+    def line(obj):
+        return app.json.dumps(obj) + "\n"
+
+    def result_line(index, filename, result):
+        if result is None:
+            return line({"index": index, "filename": filename, "error": "分析失敗，請確認 Ollama 服務是否運行"})
+        if result.get("error"):
+            return line({"index": index, "filename": filename, **result})
+        return line({"index": index, "filename": filename, "result": result})
+
+    pending = []
+    for index, filename, error, data in uploads:
+        if error:
+            yield line({"index": index, "filename": filename, "error": error})
+        else:
+            pending.append((index, filename, data))
+
+    packing_model = _packing_model(models) if pack and len(pending) > 1 else None
+    if packing_model:
+        try:
+            results = model_connector.get_model_response_by_images(
+                packing_model, [data for _, _, data in pending], user_id=user_id
+            )
+        except Exception:
+            # 合併呼叫失敗時整批改為逐張分析，不中斷已送出標頭的串流
+            app.logger.exception("Packed analysis of %d images failed", len(pending))
+            results = None
+        if results is not None:
+            # 未通過檢查的項目（None）改為逐張分析
+            retry = []
+            for (index, filename, data), result in zip(pending, results):
+                if result is None:
+                    retry.append((index, filename, data))
+                else:
+                    yield result_line(index, filename, result)
+            pending = retry
+
+    if not pending:
+        return
+    workers = min(len(pending), model_connector.scheduler.max_concurrency)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run,
+                model_connector.get_model_response_by_image, models, data, user_id=user_id,
+            ): (index, filename)
+            for index, filename, data in pending
+        }
+        try:
+            for future in as_completed(futures):
+                index, filename = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield line({"index": index, "filename": filename, "error": f"伺服器錯誤：{str(e)}"})
+                    continue
+                yield result_line(index, filename, result)
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+@app.route("/api/product/analyze/batch", methods=["POST"])
+def api_product_analyze_batch():
+    """上傳多張商品圖片並行分析，每張完成即以 NDJSON 逐行回傳。
+
+    表單欄位 images 可重複；pack=1 時若模型支援多圖輸入，會先嘗試合併成一次模型呼叫。
+    """
+    files = _uploaded_files().getlist("images")
+    if not files:
+        return jsonify({"error": "未上傳圖片"}), 400
+    if len(files) > _MAX_BATCH_IMAGES:
+        return jsonify({"error": f"一次最多上傳 {_MAX_BATCH_IMAGES} 張圖片"}), 400
+    # 串流開始前請求就已結束、上傳檔案會被關閉，所以先讀出內容（總量受 MAX_CONTENT_LENGTH 限制）
+    uploads = []
+    for index, file in enumerate(files):
+        error = _image_file_error(file)
+        uploads.append((index, file.filename, error, None if error else file.read()))
+    generator = _analyze_batch(uploads, _analysis_models(), current_user_id(), request.form.get("pack") == "1")
+    return Response(stream_with_context(generator), mimetype="application/x-ndjson")
+
+
 @app.route("/organize")
 def organize():
     """資訊整理頁面"""
-    return render_template("organize.html")
+    bootstrap = _page_data({"pets": _PET_OPTIONS, "products": None, "diaries": _DIARY_LIST_FIELDS})
+    return render_template("organize.html", bootstrap=bootstrap)
 
 
 @app.route("/organize/edit/<int:product_id>")
 def organize_edit(product_id):
     """編輯商品頁面"""
-    return render_template("organize_edit.html", product_id=product_id)
+    bootstrap = _page_data({"pets": _PET_OPTIONS}, product_id=product_id)
+    if bootstrap["product"] is None:
+        return redirect(url_for("organize"))
+    return render_template("organize_edit.html", product_id=product_id, bootstrap=bootstrap)
 
 
 # ========== Pet diary ==========
@@ -165,22 +451,22 @@ def organize_edit(product_id):
 @app.route("/diary")
 def diary():
     """寵物日記頁面"""
-    return render_template("diary.html")
+    return render_template("diary.html", bootstrap=_page_data({"pets": _PET_OPTIONS}))
 
 
 @app.route("/api/diary/analyze", methods=["POST"])
 def api_diary_analyze():
     """上傳圖片並以 image_context_prompt 分析"""
     try:
-        if "image" not in request.files:
+        files = _uploaded_files()
+        if "image" not in files:
             return jsonify({"error": "未上傳圖片"}), 400
-        file = request.files["image"]
+        file = files["image"]
         err, status = _validate_image_file(file)
         if err:
             return err, status
 
-        model_name = getattr(pet_model_config, "pet_model_name", "qwen3-vl:4b")
-        result = model_connector.get_diary_response_by_image(model_name, file)
+        result = model_connector.get_diary_response_by_image(_analysis_models(), file, user_id=current_user_id())
         if result is None:
             return jsonify({"error": "分析失敗，請確認 Ollama 服務是否運行"}), 500
         if result.get("error"):
@@ -198,9 +484,14 @@ def api_diary_analyze():
 
 
 @app.route("/api/pets", methods=["GET"])
+@_conditional_collection("pets")
 def api_get_pets():
-    """取得所有寵物"""
-    return jsonify({"pets": db.get_all_pets(user_id=current_user_id())})
+    """取得所有寵物，可用 ?fields= 指定回傳欄位"""
+    try:
+        pets = db.get_all_pets(user_id=current_user_id(), fields=_requested_fields())
+    except ValueError:
+        return jsonify({"error": _FIELDS_ERROR}), 400
+    return jsonify({"pets": pets})
 
 
 @app.route("/api/pets", methods=["POST"])
@@ -225,8 +516,11 @@ def api_add_pet():
 
 @app.route("/api/pets/<int:pet_id>", methods=["GET"])
 def api_get_pet(pet_id):
-    """取得單一寵物"""
-    pet = db.get_pet(pet_id, user_id=current_user_id())
+    """取得單一寵物，可用 ?fields= 指定回傳欄位"""
+    try:
+        pet = db.get_pet(pet_id, user_id=current_user_id(), fields=_requested_fields())
+    except ValueError:
+        return jsonify({"error": _FIELDS_ERROR}), 400
     if not pet:
         return jsonify({"error": "找不到寵物"}), 404
     return jsonify(pet)
@@ -236,7 +530,7 @@ def api_get_pet(pet_id):
 def api_update_pet(pet_id):
     """更新寵物資料"""
     uid = current_user_id()
-    if not db.get_pet(pet_id, user_id=uid):
+    if not db.get_pet(pet_id, user_id=uid, fields=_EXISTS_ONLY):
         return jsonify({"error": "找不到寵物"}), 404
     data = request.get_json() or {}
     name = (data.get("name") or "").strip()
@@ -257,7 +551,7 @@ def api_update_pet(pet_id):
 def api_delete_pet(pet_id):
     """刪除寵物"""
     uid = current_user_id()
-    if not db.get_pet(pet_id, user_id=uid):
+    if not db.get_pet(pet_id, user_id=uid, fields=_EXISTS_ONLY):
         return jsonify({"error": "找不到寵物"}), 404
     db.remove_pet(pet_id, user_id=uid)
     return "", 204
@@ -266,17 +560,22 @@ def api_delete_pet(pet_id):
 @app.route("/pets")
 def pets_page():
     """寵物管理頁面"""
-    return render_template("pets.html")
+    return render_template("pets.html", bootstrap=_page_data({"pets": None}))
 
 
 # ========== Products API ==========
 
 
 @app.route("/api/products", methods=["GET"])
+@_conditional_collection("products")
 def api_get_products():
-    """取得所有商品"""
+    """取得所有商品，可用 ?fields= 指定回傳欄位"""
     pet_id = request.args.get("pet_id", type=int)
-    return jsonify({"products": db.get_all_products(pet_id=pet_id, user_id=current_user_id())})
+    try:
+        products = db.get_all_products(pet_id=pet_id, user_id=current_user_id(), fields=_requested_fields())
+    except ValueError:
+        return jsonify({"error": _FIELDS_ERROR}), 400
+    return jsonify({"products": products})
 
 
 @app.route("/api/products", methods=["POST"])
@@ -296,8 +595,11 @@ def api_add_product():
 
 @app.route("/api/products/<int:product_id>", methods=["GET"])
 def api_get_product(product_id):
-    """取得單一商品"""
-    product = db.get_product(product_id, user_id=current_user_id())
+    """取得單一商品，可用 ?fields= 指定回傳欄位"""
+    try:
+        product = db.get_product(product_id, user_id=current_user_id(), fields=_requested_fields())
+    except ValueError:
+        return jsonify({"error": _FIELDS_ERROR}), 400
     if not product:
         return jsonify({"error": "找不到商品"}), 404
     return jsonify(product)
@@ -307,7 +609,7 @@ def api_get_product(product_id):
 def api_update_product(product_id):
     """更新商品"""
     uid = current_user_id()
-    if not db.get_product(product_id, user_id=uid):
+    if not db.get_product(product_id, user_id=uid, fields=_EXISTS_ONLY):
         return jsonify({"error": "找不到商品"}), 404
     data = request.get_json() or {}
     title = (data.get("title") or "").strip() or "（未命名）"
@@ -321,7 +623,7 @@ def api_update_product(product_id):
 def api_delete_product(product_id):
     """刪除商品"""
     uid = current_user_id()
-    if not db.get_product(product_id, user_id=uid):
+    if not db.get_product(product_id, user_id=uid, fields=_EXISTS_ONLY):
         return jsonify({"error": "找不到商品"}), 404
     db.remove_product(product_id, user_id=uid)
     return "", 204
@@ -341,10 +643,15 @@ def api_delete_products():
 
 
 @app.route("/api/diaries", methods=["GET"])
+@_conditional_collection("diaries")
 def api_get_diaries():
-    """取得所有日記"""
+    """取得所有日記，可用 ?fields= 指定回傳欄位"""
     pet_id = request.args.get("pet_id", type=int)
-    return jsonify({"diaries": db.get_all_diaries(pet_id=pet_id, user_id=current_user_id())})
+    try:
+        diaries = db.get_all_diaries(pet_id=pet_id, user_id=current_user_id(), fields=_requested_fields())
+    except ValueError:
+        return jsonify({"error": _FIELDS_ERROR}), 400
+    return jsonify({"diaries": diaries})
 
 
 @app.route("/api/diaries", methods=["POST"])
@@ -371,7 +678,7 @@ def api_add_diary():
 def api_delete_diary(diary_id):
     """刪除單筆日記"""
     uid = current_user_id()
-    if not db.get_diary(diary_id, user_id=uid):
+    if not db.get_diary(diary_id, user_id=uid, fields=_EXISTS_ONLY):
         return jsonify({"error": "找不到日記"}), 404
     db.remove_diaries([diary_id], user_id=uid)
     return "", 204
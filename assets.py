@@ -0,0 +1,101 @@
+"""
+static 檔案指紋：url_for('static', filename='css/style.css') 產生 css/style.<hash>.css。
+
+指紋網址的內容永遠不變，因此以 Cache-Control: public, max-age=31536000, immutable 送出，
+重複載入頁面時瀏覽器不必再發出任何 static 請求；檔案內容改變時網址跟著改變。
+manifest 在第一次使用時計算（debug 模式下檔案變動會重新計算），
+未帶指紋的網址照舊可用，但每次都需重新驗證。
+"""
+import hashlib
+import os
+import threading
+
+import compression
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+_HASH_LENGTH = 10
+# 建置產物不另外加指紋，由 compression.send_static 依原檔名找到
+_SKIP_SUFFIXES = tuple(compression.SUFFIXES.values()) + (".tmp",)
+
+
+def _fingerprinted(filename, digest):
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{digest[:_HASH_LENGTH]}{ext}"
+
+
+class Manifest:
+    """static 原檔名與指紋檔名的雙向對照表。"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self._lock = threading.Lock()
+        self._files = None  # filename -> fingerprinted
+        self._reverse = {}
+        self._stamp = None
+
+    def _scan(self):
+        """回傳 {相對路徑: mtime}。"""
+        stamps = {}
+        for root, _dirs, files in os.walk(self.static_folder):
+            for name in files:
+                if name.endswith(_SKIP_SUFFIXES):
+                    continue
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.static_folder).replace(os.sep, "/")
+                stamps[rel] = os.path.getmtime(path)
+        return stamps
+
+    def _build(self, stamps):
+        files = {}
+        for rel in stamps:
+            with open(os.path.join(self.static_folder, rel), "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            files[rel] = _fingerprinted(rel, digest)
+        self._files = files
+        self._reverse = {v: k for k, v in files.items()}
+        self._stamp = stamps
+
+    def load(self, check_changes=False):
+        """第一次呼叫時計算；check_changes 時若檔案有增減或修改則重新計算。"""
+        if self._files is not None and not check_changes:
+            return
+        with self._lock:
+            if self._files is None:
+                self._build(self._scan())
+            elif check_changes:
+                stamps = self._scan()
+                if stamps != self._stamp:
+                    self._build(stamps)
+
+    def url_filename(self, filename):
+        """原檔名 → 指紋檔名；不在 static 目錄中的檔名原樣回傳。"""
+        return self._files.get(filename, filename)
+
+    def resolve(self, filename):
+        """指紋檔名 → 原檔名；不是目前的指紋檔名時回傳 None。"""
+        return self._reverse.get(filename)
+
+
+def init_app(app):
+    """讓 url_for('static') 產生指紋網址，並以 immutable 快取送出。"""
+    manifest = Manifest(app.static_folder)
+    app.extensions["asset_manifest"] = manifest
+
+    @app.url_defaults
+    def _fingerprint_static(endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            manifest.load(check_changes=app.debug)
+            values["filename"] = manifest.url_filename(values["filename"])
+
+    def static(filename):
+        manifest.load(check_changes=app.debug)
+        original = manifest.resolve(filename)
+        if original is None:
+            return compression.send_static(
+                app.static_folder, filename, app.get_send_file_max_age(filename)
+            )
+        response = compression.send_static(app.static_folder, original, IMMUTABLE_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions["static"] = static
@@ -0,0 +1,163 @@
+"""
+熱點函式的 micro-benchmark（pytest-benchmark）。
+
+    pytest benchmarks/bench_hot_paths.py --benchmark-autosave
+    pytest benchmarks/bench_hot_paths.py --benchmark-compare --benchmark-compare-fail=mean:10%
+    pytest-benchmark compare --group-by=name
+
+--benchmark-autosave 將結果（含 git commit、機器資訊）存到 .benchmarks/，
+--benchmark-compare 與上一次存檔比較，因此可在切換 commit 前後各跑一次比較差異。
+只想確認能執行時加 --benchmark-disable（每個函式只跑一次）。
+
+涵蓋：db 的列轉 dict（_format_pet、get_all_products / get_all_diaries 的 list comprehension）、
+_get_image_base64、_parse_model_response 與兩個 JSON 擷取函式（模型實際會回的幾種格式）、
+大型清單的 jsonify，以及 check_password_hash。
+"""
+import base64
+import datetime
+import io
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import db
+import model_connector
+from app import app as flask_app
+from tests.helpers import make_conn
+
+_NOW = datetime.datetime(2026, 3, 1, 12, 0, 0)
+_SUMMARY = "這款飼料以新鮮雞肉為主要蛋白質來源，不含人工色素與防腐劑，適合室內飼養的成貓。" * 4
+_DESCRIBE = "今天小黑在公園追著球跑了好幾圈，看起來非常開心，回家後就在沙發上睡著了。" * 2
+_IMAGE = "data:image/jpeg;base64," + base64.b64encode(os.urandom(120 * 1024)).decode()
+
+_PRODUCT_JSON = json.dumps({
+    "title": "Orijen 全齡貓無穀飼料",
+    "summary": "以新鮮放養雞肉與野生魚類製成的無穀配方，適合各年齡層的貓咪。\n\n"
+               "- 85% 優質動物性原料\n- 不含穀物與馬鈴薯\n- 富含 Omega-3 與 Omega-6\n"
+               "- 冷凍乾燥肝臟塗層提升適口性\n- 加拿大製造",
+}, ensure_ascii=False)
+
+# 模型實際回傳 response 欄位的幾種樣子：純 JSON、前後帶說明文字、markdown code fence
+MODEL_OUTPUTS = {
+    "plain": _PRODUCT_JSON,
+    "prose": "好的，以下是根據圖片整理的商品資訊：\n" + _PRODUCT_JSON + "\n如需調整格式請告訴我。",
+    "fenced": "```json\n" + _PRODUCT_JSON + "\n```",
+    "diary": json.dumps({
+        "describe_text": _DESCRIBE * 3, "main_emotion": "開心",
+    }, ensure_ascii=False),
+}
+
+
+def _product_rows(n):
+    return [{"id": i, "title": f"商品 {i}", "summary": _SUMMARY, "pet_id": i % 3 or None, "user_id": 1,
+             "created_at": _NOW, "updated_at": _NOW} for i in range(n)]
+
+
+def _diary_rows(n):
+    return [{"id": i, "title": f"日記 {i}", "describe_text": _DESCRIBE, "main_emotion": "開心", "memo": None,
+             "image_base64": _IMAGE, "pet_id": 1, "user_id": 1, "created_at": _NOW, "updated_at": _NOW}
+            for i in range(n)]
+
+
+def _pet_rows(n):
+    return [{"id": i, "name": "小黑", "breed": "柴犬", "birthday": datetime.date(2020, 1, 1),
+             "photo_base64": _IMAGE, "user_id": 1, "created_at": _NOW, "updated_at": _NOW} for i in range(n)]
+
+
+# ========== db row formatting ==========
+
+
+@pytest.mark.benchmark(group="db-format")
+def test_format_pet(benchmark):
+    rows = _pet_rows(100)
+    benchmark(lambda: [db._format_pet(r) for r in rows])
+
+
+@pytest.mark.benchmark(group="db-format")
+@pytest.mark.parametrize("rows", [100, 1000])
+def test_get_all_products(benchmark, rows):
+    conn, _ = make_conn(fetchall=_product_rows(rows))
+    with patch("db.get_connection", return_value=conn):
+        result = benchmark(db.get_all_products, user_id=1)
+    assert len(result) == rows
+
+
+@pytest.mark.benchmark(group="db-format")
+@pytest.mark.parametrize("rows", [100, 1000])
+def test_get_all_diaries(benchmark, rows):
+    conn, _ = make_conn(fetchall=_diary_rows(rows))
+    with patch("db.get_connection", return_value=conn):
+        result = benchmark(db.get_all_diaries, user_id=1)
+    assert len(result) == rows
+
+
+# ========== model_connector ==========
+
+
+@pytest.mark.benchmark(group="image-base64")
+@pytest.mark.parametrize("kb", [50, 1024, 8 * 1024])
+def test_get_image_base64_bytes(benchmark, kb):
+    data = os.urandom(kb * 1024)
+    benchmark(model_connector._get_image_base64, data)
+
+
+@pytest.mark.benchmark(group="image-base64")
+@pytest.mark.parametrize("kb", [50, 1024, 8 * 1024])
+def test_get_image_base64_file(benchmark, kb):
+    f = io.BytesIO(os.urandom(kb * 1024))
+
+    def run():
+        f.seek(0)
+        return model_connector._get_image_base64(f)
+
+    benchmark(run)
+
+
+@pytest.mark.benchmark(group="model-parse")
+@pytest.mark.parametrize("kind", sorted(MODEL_OUTPUTS))
+def test_parse_model_response(benchmark, kind):
+    response = MagicMock()
+    response.json.return_value = {"model": "qwen3-vl:8b", "response": MODEL_OUTPUTS[kind], "done": True}
+    parsed = benchmark(model_connector._parse_model_response, response, True)
+    assert parsed
+
+
+@pytest.mark.benchmark(group="model-extract")
+@pytest.mark.parametrize("kind", sorted(MODEL_OUTPUTS))
+def test_extract_json_by_regex(benchmark, kind):
+    json.loads(benchmark(model_connector._extract_json_by_regex, MODEL_OUTPUTS[kind]))
+
+
+@pytest.mark.benchmark(group="model-extract")
+@pytest.mark.parametrize("kind", sorted(MODEL_OUTPUTS))
+def test_extract_json_object(benchmark, kind):
+    json.loads(benchmark(model_connector._extract_json_object, MODEL_OUTPUTS[kind]))
+
+
+# ========== app ==========
+
+
+@pytest.mark.benchmark(group="jsonify")
+@pytest.mark.parametrize("rows", [100, 1000])
+def test_jsonify_products(benchmark, rows):
+    payload = {"products": [db._format_row(r, db.PRODUCT_FIELDS) for r in _product_rows(rows)]}
+    with flask_app.app_context():
+        benchmark(lambda: flask_app.json.response(payload).get_data())
+
+
+@pytest.mark.benchmark(group="jsonify")
+@pytest.mark.parametrize("rows", [20, 200])
+def test_jsonify_diaries(benchmark, rows):
+    payload = {"diaries": [db._format_row(r, db.DIARY_FIELDS) for r in _diary_rows(rows)]}
+    with flask_app.app_context():
+        benchmark(lambda: flask_app.json.response(payload).get_data())
+
+
+@pytest.mark.benchmark(group="password")
+def test_check_password_hash(benchmark):
+    password_hash = generate_password_hash("correct horse battery staple")
+    assert benchmark.pedantic(check_password_hash, (password_hash, "correct horse battery staple"),
+                              rounds=10, iterations=1)
@@ -0,0 +1,76 @@
+"""
+比較 Flask 預設 JSON provider 與 json_provider.OrjsonProvider 的每次請求序列化成本。
+
+    python -m benchmarks.bench_json [--rows 200] [--image-kb 200]
+
+以 /api/diaries（含 base64 圖片與長描述）和 /api/pets 的回應形狀組出資料，
+在 app context 內量測 jsonify() 的平均耗時。
+"""
+import argparse
+import base64
+import datetime
+import os
+import timeit
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+
+_TEXT = "今天小黑在公園追著球跑了好幾圈，看起來非常開心，回家後就在沙發上睡著了。" * 8
+
+
+def _diaries(rows, image_kb):
+    image = "data:image/jpeg;base64," + base64.b64encode(os.urandom(image_kb * 1024)).decode()
+    now = datetime.datetime(2026, 3, 1, 12, 0, 0)
+    return {"diaries": [
+        {
+            "id": i, "title": "散步日", "describe_text": _TEXT, "main_emotion": "開心", "memo": "",
+            "image_base64": image, "pet_id": 1, "user_id": 1, "created_at": now, "updated_at": now,
+        }
+        for i in range(rows)
+    ]}
+
+
+def _pets(rows, image_kb):
+    photo = "data:image/jpeg;base64," + base64.b64encode(os.urandom(image_kb * 1024)).decode()
+    now = datetime.datetime(2026, 3, 1, 12, 0, 0)
+    return {"pets": [
+        {
+            "id": i, "name": "小黑", "breed": "柴犬", "birthday": "2020-01-01", "photo_base64": photo,
+            "user_id": 1, "created_at": now, "updated_at": now,
+        }
+        for i in range(rows)
+    ]}
+
+
+def _per_call_ms(app, payload, number):
+    with app.app_context():
+        seconds = timeit.timeit(lambda: jsonify(payload).get_data(), number=number)
+    return seconds / number * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--image-kb", type=int, default=200)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    default_app = Flask("default")
+    default_app.json = DefaultJSONProvider(default_app)
+    orjson_app = Flask("orjson")
+    json_provider.init_app(orjson_app)
+
+    print(f"{'endpoint':<14} {'default':>10} {'orjson':>10} {'speedup':>8}")
+    for name, payload in (
+        ("/api/diaries", _diaries(args.rows, args.image_kb)),
+        ("/api/pets", _pets(max(args.rows // 20, 1), args.image_kb)),
+    ):
+        before = _per_call_ms(default_app, payload, args.number)
+        after = _per_call_ms(orjson_app, payload, args.number)
+        print(f"{name:<14} {before:>8.2f}ms {after:>8.2f}ms {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+以一組標註過的圖片比較模型與 prompt 的延遲與輸出品質。
+
+    python -m benchmarks.bench_models run [--images 'image/*.png'] [--models qwen3-vl:8b,qwen3-vl:4b,gemma3:27b]
+                                          [--prompt product] [--prompt product=prompts/v2.txt] [--repeat 3]
+                                          [--output model_bench.jsonl]
+    python -m benchmarks.bench_models report model_bench.jsonl [other.jsonl ...]
+
+每張圖片 × 模型 × prompt 直接呼叫 OLLAMA_URL（不經排程、快取與模型階梯），每次呼叫一行 JSONL
+附加到 --output；跑完後依 (模型, prompt) 列出延遲 p50/p90/p99、生成速度（Ollama 的
+eval_count / eval_duration）、解析失敗率、欄位完整度、品質門檻通過率與標註關鍵字命中率。
+report 可合併多次執行的紀錄重新產生比較表。
+
+--prompt 為 product 或 diary（pet_model_config 的 product_prompt / image_context_prompt），
+或 KIND=FILE 改用檔案中的 prompt（欄位要求沿用 KIND）。每個模型先以第一張圖暖機一次（不記錄），
+避免把載入模型的時間算進延遲。
+
+圖片目錄下的 labels.json 為選用的標註：{"檔名": {"prompt": "product", "keywords": ["Orijen", "Senior"]}}；
+有 prompt 的圖片只跑該類 prompt，keywords 以不分大小寫比對結果的所有文字欄位。
+"""
+import argparse
+import glob
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+import requests
+
+import model_connector
+import pet_model_config
+
+logger = logging.getLogger("bench_models")
+
+_PROMPTS = {
+    "product": ("product_prompt", model_connector.PRODUCT_RESULT_KEYS),
+    "diary": ("image_context_prompt", model_connector.DIARY_RESULT_KEYS),
+}
+
+
+def parse_prompt(spec):
+    """將 --prompt 轉為 (label, kind, prompt 文字, 必要欄位)。"""
+    kind, _, path = spec.partition("=")
+    if kind not in _PROMPTS:
+        raise ValueError(f"unknown prompt kind {kind!r} (expected {', '.join(_PROMPTS)})")
+    attr, keys = _PROMPTS[kind]
+    if not path:
+        return kind, kind, getattr(pet_model_config, attr), keys
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    return f"{kind}:{os.path.splitext(os.path.basename(path))[0]}", kind, text, keys
+
+
+def load_labels(images):
+    """讀取圖片所在目錄的 labels.json，沒有時回傳空 dict。"""
+    labels = {}
+    for directory in sorted({os.path.dirname(p) for p in images}):
+        path = os.path.join(directory, "labels.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                labels.update({os.path.join(directory, name): v for name, v in json.load(f).items()})
+    return labels
+
+
+def completeness(result, required_keys):
+    """必要欄位中為非空字串的比例。"""
+    if not isinstance(result, dict):
+        return 0.0
+    filled = sum(1 for k in required_keys if isinstance(result.get(k), str) and result[k].strip())
+    return filled / len(required_keys)
+
+
+def keyword_recall(result, keywords):
+    """標註關鍵字出現在結果文字欄位中的比例；沒有標註時回傳 None。"""
+    if not keywords:
+        return None
+    if not isinstance(result, dict):
+        return 0.0
+    text = " ".join(v for v in result.values() if isinstance(v, str)).casefold()
+    return sum(1 for k in keywords if k.casefold() in text) / len(keywords)
+
+
+def call(model, prompt, image_path, timeout):
+    """呼叫一次模型，回傳 (狀態, 秒數, Ollama 回應本文, 解析後的結果)。"""
+    body = model_connector._build_image_payload(model, prompt, image_path)
+    started = time.perf_counter()
+    try:
+        response = requests.post(model_connector.url, data=body, headers=model_connector._JSON_HEADERS,
+                                 timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        logger.warning("%s %s: %s", model, image_path, e)
+        return "network_error", time.perf_counter() - started, {}, None
+    seconds = time.perf_counter() - started
+    if response.status_code != 200:
+        logger.warning("%s %s: HTTP %s", model, image_path, response.status_code)
+        return "http_error", seconds, {}, None
+    raw = {}
+    try:
+        raw = response.json()
+        result = model_connector._parse_model_response(response, True)
+    except ValueError:
+        return "parse_error", seconds, raw if isinstance(raw, dict) else {}, None
+    return "ok", seconds, raw, result
+
+
+def run_one(model, prompt, image_path, label, timeout):
+    """呼叫一次並整理為一筆紀錄。"""
+    name, _, text, keys = prompt
+    status, seconds, raw, result = call(model, text, image_path, timeout)
+    return {
+        "ts": time.time(), "model": model, "prompt": name, "image": image_path, "status": status,
+        "seconds": round(seconds, 4),
+        "eval_count": raw.get("eval_count"), "eval_duration": raw.get("eval_duration"),
+        "prompt_eval_count": raw.get("prompt_eval_count"), "load_duration": raw.get("load_duration"),
+        "completeness": completeness(result, keys),
+        "issue": model_connector._quality_issue(result, keys) if status == "ok" else status,
+        "keyword_recall": keyword_recall(result, label.get("keywords")),
+        "result": result,
+    }
+
+
+def _percentile(values, q):
+    """最近秩（nearest-rank）百分位數。"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(records):
+    """依 (模型, prompt) 彙整，回傳依 p50 延遲排序的清單。"""
+    groups = {}
+    for r in records:
+        groups.setdefault((r["model"], r["prompt"]), []).append(r)
+    rows = []
+    for (model, prompt), rs in groups.items():
+        answered = [r for r in rs if r["status"] in ("ok", "parse_error")]
+        latencies = [r["seconds"] for r in answered] or [float("nan")]
+        timed = [r for r in answered if r.get("eval_count") and r.get("eval_duration")]
+        recalls = [r["keyword_recall"] for r in rs if r.get("keyword_recall") is not None]
+        rows.append({
+            "model": model, "prompt": prompt, "calls": len(rs), "errors": len(rs) - len(answered),
+            "p50": _percentile(latencies, 50), "p90": _percentile(latencies, 90), "p99": _percentile(latencies, 99),
+            "tokens_per_s": (sum(r["eval_count"] for r in timed) / (sum(r["eval_duration"] for r in timed) / 1e9)
+                             if timed else None),
+            "parse_failure": (sum(r["status"] == "parse_error" for r in answered) / len(answered)
+                              if answered else None),
+            "completeness": sum(r["completeness"] for r in rs) / len(rs),
+            "quality_pass": sum(r["issue"] is None for r in rs) / len(rs),
+            "keyword_recall": sum(recalls) / len(recalls) if recalls else None,
+        })
+    return sorted(rows, key=lambda g: (g["prompt"], g["p50"]))
+
+
+def _fmt(value, spec, missing="-"):
+    return missing if value is None else format(value, spec)
+
+
+def format_table(rows):
+    lines = [f"{'model':<20} {'prompt':<16} {'calls':>5} {'err':>4} {'p50 s':>7} {'p90 s':>7} {'p99 s':>7}"
+             f" {'tok/s':>7} {'parse':>7} {'fields':>7} {'pass':>6} {'labels':>7}"]
+    for g in rows:
+        lines.append(
+            f"{g['model']:<20} {g['prompt']:<16} {g['calls']:>5} {g['errors']:>4} {g['p50']:>7.2f}"
+            f" {g['p90']:>7.2f} {g['p99']:>7.2f} {_fmt(g['tokens_per_s'], '.1f'):>7}"
+            f" {_fmt(g['parse_failure'], '.0%'):>7} {g['completeness']:>7.0%} {g['quality_pass']:>6.0%}"
+            f" {_fmt(g['keyword_recall'], '.0%'):>7}"
+        )
+    return "\n".join(lines)
+
+
+def read_records(paths):
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def _default_models():
+    return ",".join(getattr(pet_model_config, "pet_model_cascade", None) or [pet_model_config.pet_model_name])
+
+
+def run(args):
+    images = sorted(glob.glob(args.images))
+    if not images:
+        print(f"No images match {args.images}")
+        return 1
+    prompts = [parse_prompt(spec) for spec in args.prompt or ["product"]]
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    labels = load_labels(images)
+    records = []
+    with open(args.output, "a", encoding="utf-8") as out:
+        for model in models:
+            if args.warmup:
+                call(model, prompts[0][2], images[0], args.timeout)
+            for prompt in prompts:
+                for image in images:
+                    label = labels.get(image, {})
+                    if label.get("prompt", prompt[1]) != prompt[1]:
+                        continue
+                    for _ in range(args.repeat):
+                        record = run_one(model, prompt, image, label, args.timeout)
+                        logger.info("%s %s %s: %s in %.2fs", model, record["prompt"], image, record["status"],
+                                    record["seconds"])
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        out.flush()
+                        records.append(record)
+    print(format_table(summarize(records)))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比較模型與 prompt 的延遲與輸出品質")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="對圖片集呼叫各模型與 prompt，記錄並列出比較表")
+    run_parser.add_argument("--images", default="image/*.png", help="圖片 glob")
+    run_parser.add_argument("--models", default=_default_models(), help="以逗號分隔的模型名稱")
+    run_parser.add_argument("--prompt", action="append", help="product、diary 或 KIND=FILE；可重複")
+    run_parser.add_argument("--repeat", type=int, default=1, help="每個組合的呼叫次數")
+    run_parser.add_argument("--timeout", type=float, default=300)
+    run_parser.add_argument("--no-warmup", dest="warmup", action="store_false")
+    run_parser.add_argument("--output", default="model_bench.jsonl")
+    report_parser = sub.add_parser("report", help="由既有紀錄重新產生比較表")
+    report_parser.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "run":
+        return run(args)
+    records = read_records(args.files)
+    if not records:
+        print("No records")
+        return 0
+    print(format_table(summarize(records)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
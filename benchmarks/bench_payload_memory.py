@@ -0,0 +1,64 @@
+"""
+量測單次圖片分析請求在組出 HTTP 本文時的峰值記憶體。
+
+    python -m benchmarks.bench_payload_memory [--sizes 1,4,16]
+
+比較舊路徑（read() → b64encode → str → requests 的 json=）與
+model_connector._build_image_payload（預先配置的 bytearray，data=）。
+兩者都經過 requests 的 PreparedRequest，所以包含 requests 自己的編碼成本。
+"""
+import argparse
+import base64
+import os
+import tracemalloc
+from io import BytesIO
+
+import requests
+
+import model_connector
+
+_URL = "http://localhost:11434/api/generate"
+
+
+def _legacy(upload):
+    image_base64 = base64.b64encode(upload.read()).decode("utf-8")
+    data = {"model": "m", "prompt": "p", "images": [image_base64], "stream": False}
+    return requests.Request("POST", _URL, json=data).prepare()
+
+
+def _prebuilt(upload):
+    body = model_connector._build_image_payload("m", "p", upload)
+    return requests.Request(
+        "POST", _URL, data=body, headers=model_connector._JSON_HEADERS
+    ).prepare()
+
+
+def _peak(build, payload):
+    upload = BytesIO(payload)
+    tracemalloc.start()
+    try:
+        prepared = build(upload)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, len(prepared.body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1,4,16", help="上傳大小（MB），以逗號分隔")
+    args = parser.parse_args(argv)
+
+    print(f"{'upload':>8} {'legacy peak':>12} {'prebuilt peak':>14} {'body':>10}")
+    for size_mb in (int(s) for s in args.sizes.split(",")):
+        payload = os.urandom(size_mb * 1024 * 1024)
+        legacy_peak, _ = _peak(_legacy, payload)
+        prebuilt_peak, body_len = _peak(_prebuilt, payload)
+        print(
+            f"{size_mb:>6}MB {legacy_peak / 2**20:>10.1f}MB {prebuilt_peak / 2**20:>12.1f}MB"
+            f" {body_len / 2**20:>8.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+產生可重現的合成資料集，供擴充性量測使用。
+
+    python -m benchmarks.seed_data [--users 1000] [--seed 42] [--products-mean 40] [--diaries-mean 25]
+                                   [--image-kb 120] [--image-ratio 0.8] [--dry-run]
+
+每位使用者的寵物、商品、日記數量依對數常態分布抽樣（--skew 控制長尾，少數重度使用者資料特別多），
+商品摘要約 --summary-chars 字中文，日記圖片為 --image-kb 左右（同樣對數常態）的 base64 data URL。
+id 由本程式依現有 MAX(id) 之後連續指定，因此不必回讀；資料以多列 INSERT 批次寫入
+（PyMySQL executemany），只在使用者之間提交，每位使用者的資料不會只寫入一半。
+同一組參數與 --seed 產生相同的資料（id 除外，取決於資料庫中已有的列）。
+
+所有使用者的密碼皆為 --password（預設 benchmark），雜湊與 werkzeug 預設的 scrypt 格式相同，
+但以 --seed 為固定 salt，因此也可重現。以同一個 --seed 重跑時，已存在的 bench_{seed}_N 使用者
+（連同其資料）會略過，只補上其餘使用者，可用來接續中斷的執行。
+"""
+import argparse
+import base64
+import datetime
+import hashlib
+import logging
+import math
+import random
+import time
+from dataclasses import dataclass
+
+import pymysql
+
+import db
+
+logger = logging.getLogger("seed_data")
+
+_PHRASES = (
+    "這款飼料以新鮮雞肉為主要蛋白質來源", "不含人工色素與防腐劑", "適合室內飼養的成貓", "添加益生菌幫助消化",
+    "顆粒大小適中容易咀嚼", "富含 Omega-3 讓毛髮更有光澤", "低敏配方適合腸胃敏感的狗狗", "每日建議餵食量請依體重調整",
+    "開封後請密封保存於陰涼處", "含有葡萄糖胺保護關節", "熱量較低適合需要控制體重的寵物", "成分表第一項為真肉",
+    "使用可回收包裝", "小包裝方便外出攜帶", "搭配濕食可增加水分攝取", "獸醫師推薦的營養比例",
+    "玩具材質為天然橡膠", "耐咬不易破損", "可放入零食增加互動樂趣", "尺寸適合中小型犬",
+)
+_DIARY_LINES = (
+    "今天小黑在公園追著球跑了好幾圈", "午睡時把肚子翻過來曬太陽", "第一次洗澡有點緊張", "看到新玩具開心地搖尾巴",
+    "下雨天只好在家裡玩拔河", "晚餐吃得特別乾淨", "帶去打預防針很勇敢", "和鄰居的狗狗成為好朋友",
+)
+_EMOTIONS = ("開心", "興奮", "放鬆", "好奇", "緊張", "想睡")
+_BREEDS = ("柴犬", "米克斯", "黃金獵犬", "貴賓", "英國短毛貓", "橘貓", "布偶貓", "柯基")
+_NAMES = ("小黑", "小白", "Lucky", "豆豆", "咪咪", "旺財", "Momo", "布丁", "奶茶", "可樂")
+_POOL_SIZE = 256
+
+
+@dataclass
+class SeedConfig:
+    users: int = 1000
+    seed: int = 42
+    pets_mean: float = 2.0
+    products_mean: float = 40.0
+    diaries_mean: float = 25.0
+    # 對數常態分布的 sigma；0 表示每位使用者數量相同
+    skew: float = 1.0
+    summary_chars: int = 300
+    image_kb: float = 120.0
+    image_ratio: float = 0.8
+    # 商品、日記未指定寵物的比例
+    unassigned_ratio: float = 0.25
+    batch_rows: int = 1000
+    password: str = "benchmark"
+
+
+def _lognormal_count(rng, mean, sigma):
+    """平均為 mean 的對數常態整數抽樣。"""
+    if mean <= 0:
+        return 0
+    if sigma <= 0:
+        return round(mean)
+    return int(rng.lognormvariate(math.log(mean) - sigma * sigma / 2, sigma) + 0.5)
+
+
+def _text_pool(rng, phrases, chars, size=_POOL_SIZE):
+    """預先組好 size 段約 chars 字的文字，產生資料列時只需抽選，不必逐列拼字串。"""
+    pool = []
+    for _ in range(size):
+        parts, length = [], 0
+        while length < chars:
+            phrase = rng.choice(phrases)
+            parts.append(phrase)
+            length += len(phrase) + 1
+        pool.append("，".join(parts) + "。")
+    return pool
+
+
+class _ImageSource:
+    """由一段固定的隨機 base64 字串切片產生圖片 data URL；長度依對數常態分布。"""
+
+    def __init__(self, rng, mean_kb, sigma=0.5):
+        self.rng = rng
+        self.mean_kb = mean_kb
+        self.sigma = sigma
+        raw_kb = max(int(mean_kb * 4), 1)
+        self._data = base64.b64encode(rng.randbytes(raw_kb * 1024)).decode()
+
+    def next(self):
+        size = _lognormal_count(self.rng, self.mean_kb * 1024, self.sigma)
+        length = min(max(size * 4 // 3 // 4 * 4, 4), len(self._data))
+        start = self.rng.randrange(0, len(self._data) - length + 1) // 4 * 4
+        return "data:image/jpeg;base64," + self._data[start:start + length]
+
+
+def password_hash(password, salt):
+    """與 werkzeug generate_password_hash 預設相同的 scrypt 雜湊，但 salt 固定，結果可重現。"""
+    n, r, p = 2**15, 8, 1
+    digest = hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=132 * n * r * p)
+    return f"scrypt:{n}:{r}:{p}${salt}${digest.hex()}"
+
+
+def _username(config, n):
+    return f"bench_{config.seed}_{n}"
+
+
+def _existing_usernames(cur, config):
+    # "_" 在 LIKE 中是萬用字元，需跳脫
+    cur.execute("SELECT username FROM users WHERE username LIKE %s", (f"bench\\_{config.seed}\\_%",))
+    return {row[0] for row in cur.fetchall()}
+
+
+def _next_ids(cur):
+    ids = {}
+    for table in ("users", "pets", "products", "pet_diaries"):
+        cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        ids[table] = cur.fetchone()[0] + 1
+    return ids
+
+
+_INSERTS = {
+    "users": "INSERT INTO users (id, username, password_hash, created_at) VALUES (%s, %s, %s, %s)",
+    "pets": "INSERT INTO pets (id, user_id, name, breed, birthday, photo_base64, created_at)"
+            " VALUES (%s, %s, %s, %s, %s, %s, %s)",
+    "products": "INSERT INTO products (id, title, summary, pet_id, user_id, created_at)"
+                " VALUES (%s, %s, %s, %s, %s, %s)",
+    "pet_diaries": "INSERT INTO pet_diaries"
+                   " (id, title, describe_text, main_emotion, memo, image_base64, pet_id, user_id, created_at)"
+                   " VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+}
+
+
+def generate(config, next_ids, skip_usernames=frozenset()):
+    """依 config 產生 (table, row) 序列；同一個 config 與 next_ids 每次結果相同。
+
+    skip_usernames 中的使用者及其資料不輸出也不佔用 id，其餘使用者的資料與未略過時相同。
+    """
+    rng = random.Random(config.seed)
+    summaries = _text_pool(rng, _PHRASES, config.summary_chars)
+    diary_texts = _text_pool(rng, _DIARY_LINES, 80)
+    images = _ImageSource(rng, config.image_kb) if config.image_kb > 0 else None
+    hashed_password = password_hash(config.password, f"bench{config.seed}")
+    epoch = datetime.datetime(2024, 1, 1)
+    span_seconds = 2 * 365 * 86400
+    ids = dict(next_ids)
+
+    def take(table):
+        if skipped:
+            return None
+        value = ids[table]
+        ids[table] += 1
+        return value
+
+    for n in range(config.users):
+        # 略過的使用者仍照常抽樣，讓之後的使用者拿到相同的亂數
+        skipped = _username(config, n) in skip_usernames
+        user_id = take("users")
+        joined = epoch + datetime.timedelta(seconds=rng.randrange(span_seconds // 2))
+        rows = [("users", (user_id, _username(config, n), hashed_password, joined))]
+        remaining = max(int((epoch + datetime.timedelta(seconds=span_seconds) - joined).total_seconds()), 1)
+
+        def created():
+            return joined + datetime.timedelta(seconds=rng.randrange(remaining))
+
+        pet_ids = []
+        for _ in range(max(_lognormal_count(rng, config.pets_mean, config.skew / 2), 1)):
+            pet_id = take("pets")
+            pet_ids.append(pet_id)
+            birthday = datetime.date(2012, 1, 1) + datetime.timedelta(days=rng.randrange(4000))
+            rows.append(("pets", (pet_id, user_id, rng.choice(_NAMES), rng.choice(_BREEDS), birthday, "",
+                                  created())))
+
+        def owner_pet():
+            return None if rng.random() < config.unassigned_ratio else rng.choice(pet_ids)
+
+        for i in range(_lognormal_count(rng, config.products_mean, config.skew)):
+            rows.append(("products", (take("products"), f"商品 {i + 1}", rng.choice(summaries), owner_pet(),
+                                      user_id, created())))
+        for i in range(_lognormal_count(rng, config.diaries_mean, config.skew)):
+            image = images.next() if images and rng.random() < config.image_ratio else ""
+            rows.append(("pet_diaries", (take("pet_diaries"), f"日記 {i + 1}", rng.choice(diary_texts),
+                                         rng.choice(_EMOTIONS), "", image, owner_pet(), user_id, created())))
+        if not skipped:
+            yield from rows
+
+
+def connect():
+    """以 MYSQL_* 設定開啟 tuple cursor 的連線；不經過 db.py 的查詢計時與慢查詢 EXPLAIN。"""
+    return pymysql.connect(**dict(db._get_db_config(), cursorclass=pymysql.cursors.Cursor))
+
+
+def seed(conn, config):
+    """寫入資料並回傳各資料表寫入的列數；conn 為 connect() 取得的連線。"""
+    with conn.cursor() as cur:
+        existing = _existing_usernames(cur, config)
+        next_ids = _next_ids(cur)
+    if existing:
+        logger.info("Skipping %s users already seeded with --seed %s", len(existing), config.seed)
+    counts = dict.fromkeys(_INSERTS, 0)
+    pending = {table: [] for table in _INSERTS}
+    uncommitted = 0
+    started = last_log = time.monotonic()
+
+    def flush(table):
+        rows = pending[table]
+        if rows:
+            with conn.cursor() as cur:
+                cur.executemany(_INSERTS[table], rows)
+            counts[table] += len(rows)
+            pending[table] = []
+
+    for table, row in generate(config, next_ids, existing):
+        # 只在使用者之間提交，中斷時不會留下只寫入一半的使用者
+        if table == "users" and uncommitted >= config.batch_rows:
+            for t in _INSERTS:
+                flush(t)
+            conn.commit()
+            uncommitted = 0
+            if time.monotonic() - last_log > 5:
+                last_log = time.monotonic()
+                logger.info("%s rows so far (%.0f rows/s)", sum(counts.values()),
+                            sum(counts.values()) / (last_log - started))
+        pending[table].append(row)
+        uncommitted += 1
+        if len(pending[table]) >= config.batch_rows:
+            # 先寫入被參照的使用者與寵物
+            for t in ("users", "pets", table):
+                flush(t)
+    for table in _INSERTS:
+        flush(table)
+    conn.commit()
+    return counts
+
+
+def main(argv=None):
+    defaults = SeedConfig()
+    parser = argparse.ArgumentParser(description="產生可重現的合成資料集（寫入 MYSQL_* 指定的資料庫）")
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--pets-mean", type=float, default=defaults.pets_mean)
+    parser.add_argument("--products-mean", type=float, default=defaults.products_mean, help="每位使用者平均商品數")
+    parser.add_argument("--diaries-mean", type=float, default=defaults.diaries_mean, help="每位使用者平均日記數")
+    parser.add_argument("--skew", type=float, default=defaults.skew, help="數量分布的對數常態 sigma（0 = 平均分配）")
+    parser.add_argument("--summary-chars", type=int, default=defaults.summary_chars)
+    parser.add_argument("--image-kb", type=float, default=defaults.image_kb, help="日記圖片平均大小（0 = 不含圖片）")
+    parser.add_argument("--image-ratio", type=float, default=defaults.image_ratio, help="含圖片的日記比例")
+    parser.add_argument("--batch-rows", type=int, default=defaults.batch_rows)
+    parser.add_argument("--password", default=defaults.password)
+    parser.add_argument("--dry-run", action="store_true", help="只計算各資料表列數，不寫入")
+    args = parser.parse_args(argv)
+    config = SeedConfig(**{k: v for k, v in vars(args).items() if k != "dry_run"})
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    started = time.monotonic()
+    if args.dry_run:
+        counts = dict.fromkeys(_INSERTS, 0)
+        for table, _ in generate(config, dict.fromkeys(_INSERTS, 1)):
+            counts[table] += 1
+    else:
+        db.init_db()
+        conn = connect()
+        try:
+            counts = seed(conn, config)
+        finally:
+            conn.close()
+    elapsed = time.monotonic() - started
+    logger.info("%s in %.1fs (%.0f rows/s)", ", ".join(f"{t}={n}" for t, n in counts.items()), elapsed,
+                sum(counts.values()) / max(elapsed, 1e-9))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+回應壓縮：依 Accept-Encoding 協商 Brotli / gzip。
+
+    python compression.py build   # 預先壓縮 static/ 下的檔案（.br / .gz）
+
+動態回應（HTML、JSON、NDJSON）在 after_request 壓縮：小於 COMPRESS_MIN_SIZE 的不壓縮；
+超過 COMPRESS_STREAM_SIZE 的改以串流分段壓縮，不會同時在記憶體中保留完整的原文與壓縮結果；
+本身就是串流的回應（如批次分析）逐段壓縮並 flush，讓每一行仍能即時送達。
+static 檔案則直接送出建置時產生的 .br / .gz，不在請求時壓縮。
+"""
+import argparse
+import logging
+import mimetypes
+import os
+import sys
+import zlib
+
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # 未安裝時只提供 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+STREAM_SIZE = int(os.getenv("COMPRESS_STREAM_SIZE", str(256 * 1024)))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+
+_CHUNK_SIZE = 64 * 1024
+_COMPRESSIBLE_MIMETYPES = frozenset({
+    "text/html", "text/css", "text/plain", "text/javascript",
+    "application/javascript", "application/json", "application/x-ndjson", "image/svg+xml",
+})
+# 預先壓縮的檔案副檔名
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+_STATIC_EXTS = (".css", ".js", ".html", ".svg", ".json", ".txt")
+
+
+def available_encodings():
+    """伺服器支援的編碼，依偏好排序。"""
+    return ("br", "gzip") if brotli else ("gzip",)
+
+
+def negotiate(accept_encodings=None):
+    """依 Accept-Encoding 選出編碼，都不接受時回傳 None。"""
+    accept = request.accept_encodings if accept_encodings is None else accept_encodings
+    for encoding in available_encodings():
+        if accept[encoding] > 0:
+            return encoding
+    return None
+
+
+def _gzip_compressor(level=GZIP_LEVEL):
+    return zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31：gzip 標頭
+
+
+class _Encoder:
+    """把 zlib / brotli 的串流介面統一為 compress / flush / finish。"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._c = _gzip_compressor()
+
+    def compress(self, data):
+        return self._c.process(data) if self.encoding == "br" else self._c.compress(data)
+
+    def flush(self):
+        return self._c.flush() if self.encoding == "br" else self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._c.finish() if self.encoding == "br" else self._c.flush()
+
+
+def _compress_iter(encoding, chunks, flush_each=False):
+    """逐段壓縮；flush_each 時每段都 flush，用於需要即時送達的串流回應。"""
+    encoder = _Encoder(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            out = encoder.compress(chunk)
+            if flush_each:
+                out += encoder.flush()
+            if out:
+                yield out
+        yield encoder.finish()
+    finally:
+        # 原本的 iterable（如 stream_with_context）靠 close() 收尾
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def _slices(body):
+    view = memoryview(body)
+    for start in range(0, len(view), _CHUNK_SIZE):
+        yield view[start:start + _CHUNK_SIZE]
+
+
+def _weaken_etag(response):
+    """壓縮後內容與未壓縮版本不同，強 ETag 改為弱 ETag。"""
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def compress_response(response):
+    """after_request：依協商結果壓縮動態回應。"""
+    if response.mimetype not in _COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate()
+    if encoding is None or "Content-Encoding" in response.headers:
+        return response
+    if response.status_code == 304:
+        _weaken_etag(response)
+        return response
+    if response.status_code < 200 or response.status_code == 204 or response.direct_passthrough:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_iter(encoding, response.response, flush_each=True)
+    else:
+        body = response.get_data()
+        if len(body) < MIN_SIZE:
+            return response
+        if len(body) > STREAM_SIZE:
+            response.response = _compress_iter(encoding, _slices(body))
+        else:
+            response.set_data(b"".join(_compress_iter(encoding, [body])))
+    if response.is_streamed:
+        response.headers.pop("Content-Length", None)
+    response.headers["Content-Encoding"] = encoding
+    _weaken_etag(response)
+    return response
+
+
+def send_static(static_folder, filename, max_age=None):
+    """送出 static 檔案；有對應的預先壓縮檔（且不比原檔舊）時直接送出壓縮檔。"""
+    encoding = negotiate()
+    original = safe_join(static_folder, filename)
+    if encoding and original and os.path.isfile(original):
+        compressed = original + SUFFIXES[encoding]
+        if os.path.isfile(compressed) and os.path.getmtime(compressed) >= os.path.getmtime(original):
+            mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            response = send_from_directory(
+                static_folder, filename + SUFFIXES[encoding], mimetype=mimetype, max_age=max_age
+            )
+            response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+            return response
+    response = send_from_directory(static_folder, filename, max_age=max_age)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def init_app(app):
+    """註冊動態回應壓縮，並讓 static 路由優先送出預先壓縮檔。"""
+    if brotli is None:
+        logger.warning("brotli is not installed, only gzip compression is available")
+    app.after_request(compress_response)
+
+    def static(filename):
+        return send_static(app.static_folder, filename, app.get_send_file_max_age(filename))
+
+    app.view_functions["static"] = static
+
+
+# ========== Build ==========
+
+
+def _write_if_smaller(path, data, size):
+    if len(data) >= size:
+        return False
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def build_static(static_folder):
+    """為 static_folder 下的文字檔產生最高壓縮等級的 .br / .gz，回傳寫入的檔案數。"""
+    written = 0
+    for root, _dirs, files in os.walk(static_folder):
+        for name in files:
+            if not name.endswith(_STATIC_EXTS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            gz = _gzip_compressor(9)
+            written += _write_if_smaller(path + SUFFIXES["gzip"], gz.compress(data) + gz.flush(), len(data))
+            if brotli:
+                written += _write_if_smaller(
+                    path + SUFFIXES["br"], brotli.compress(data, quality=11), len(data)
+                )
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="預先壓縮 static 檔案")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument(
+        "--static", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    written = build_static(args.static)
+    logger.info("Wrote %d precompressed files under %s", written, args.static)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
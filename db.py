@@ -1,10 +1,56 @@
 """
 MySQL 資料庫連線與商品 CRUD 操作
 """
+import contextvars
+import functools
+import json
 import os
+import time
 import pymysql
 from contextlib import contextmanager
-from pymysql.cursors import DictCursor
+from pymysql.cursors import DictCursor, SSDictCursor
+
+import metrics
+import server_timing
+import slow_queries
+import tracing
+
+# 目前執行中的 db.py 函式，SQL 陳述式的指標以此分類
+_current_function = contextvars.ContextVar("db_function", default="other")
+
+
+class _TimedQueries:
+    """記錄每個 SQL 陳述式的耗時、span（陳述式與影響列數）與所屬請求的查詢統計；executemany 會逐一經過 execute。
+
+    超過 slow_queries.THRESHOLD_MS 的陳述式交給 slow_queries 記錄並 EXPLAIN。
+    """
+
+    # server-side cursor 的結果尚未讀完，同一連線無法再執行 EXPLAIN
+    _explain_slow = True
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        with tracing.span("mysql.query", tracing.CLIENT, **{"db.system": "mysql", "db.statement": query}) as span:
+            try:
+                rows = super().execute(query, args)
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.DB_QUERY_DURATION.observe(elapsed, function=_current_function.get())
+                server_timing.record_query(query, elapsed)
+            span.set_attribute("db.rows", rows)
+            if slow_queries.THRESHOLD_MS > 0 and elapsed * 1000 >= slow_queries.THRESHOLD_MS:
+                slow_queries.capture(
+                    self.connection, query, args, elapsed, rows, _current_function.get(), explain=self._explain_slow
+                )
+            return rows
+
+
+class _Cursor(_TimedQueries, DictCursor):
+    pass
+
+
+class _SSCursor(_TimedQueries, SSDictCursor):
+    _explain_slow = False
 
 
 def _get_db_config():
@@ -16,14 +62,22 @@ def _get_db_config():
         "password": os.getenv("MYSQL_PASSWORD", "pet_password"),
         "database": os.getenv("MYSQL_DATABASE", "pet_adorable_life"),
         "charset": "utf8mb4",
-        "cursorclass": DictCursor,
+        "cursorclass": _Cursor,
     }
 
 
 @contextmanager
 def get_connection():
     """取得資料庫連線的 context manager。"""
-    conn = pymysql.connect(**_get_db_config())
+    started = time.perf_counter()
+    try:
+        conn = pymysql.connect(**_get_db_config())
+    except pymysql.err.MySQLError:
+        metrics.DB_CONNECT_ERRORS.inc()
+        raise
+    elapsed = time.perf_counter() - started
+    metrics.DB_CONNECT_DURATION.observe(elapsed)
+    server_timing.record_db_time(elapsed)
     try:
         yield conn
         conn.commit()
@@ -34,15 +88,82 @@ def get_connection():
         conn.close()
 
 
+def _instrumented(fn):
+    """記錄 db.py 函式的耗時、成敗與 span，並讓其中的 SQL 陳述式以函式名稱分類。"""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _current_function.set(name)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with tracing.span(f"db.{name}"):
+                result = fn(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            metrics.DB_CALL_DURATION.observe(time.perf_counter() - started, function=name)
+            metrics.DB_CALLS.inc(function=name, outcome=outcome)
+            _current_function.reset(token)
+    return wrapper
+
+
+@_instrumented
+def ping(timeout=2):
+    """以 SELECT 1 確認 MySQL 可連線；不經過 init_db，也不觸及任何資料表。"""
+    conn = pymysql.connect(**dict(_get_db_config(), connect_timeout=timeout, read_timeout=timeout))
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+    finally:
+        conn.close()
+
+
 def _guard_alter(cur, sql):
-    """執行 ALTER TABLE，忽略 Duplicate column name (1060)。"""
+    """執行 ALTER TABLE，忽略 Duplicate column name (1060) 與 Duplicate key name (1061)。"""
     try:
         cur.execute(sql)
     except pymysql.err.OperationalError as e:
-        if e.args[0] != 1060:
+        if e.args[0] not in (1060, 1061):
             raise
 
 
+PRODUCT_FIELDS = ("id", "title", "summary", "pet_id", "user_id", "created_at", "updated_at")
+DIARY_FIELDS = (
+    "id", "title", "describe_text", "main_emotion", "memo", "image_base64",
+    "pet_id", "user_id", "created_at", "updated_at",
+)
+PET_FIELDS = ("id", "name", "breed", "birthday", "photo_base64", "user_id", "created_at", "updated_at")
+
+# 這些文字欄位為 NULL 時回傳空字串
+_EMPTY_STRING_FIELDS = frozenset({
+    "title", "summary", "describe_text", "main_emotion", "memo", "image_base64", "breed", "photo_base64",
+})
+
+
+def _columns(all_fields, fields):
+    """依 fields 決定要 SELECT 的欄位（維持表格定義順序）；fields 為 None 時取全部欄位。
+
+    欄位名稱會直接組進 SQL，因此只接受 all_fields 中的名稱，其餘一律拋出 ValueError。
+    """
+    if fields is None:
+        return all_fields
+    unknown = set(fields) - set(all_fields)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    columns = tuple(f for f in all_fields if f in fields)
+    if not columns:
+        raise ValueError("No fields requested")
+    return columns
+
+
+def _format_row(r, columns):
+    """依欄位組出回傳的 dict，文字欄位的 NULL 轉為空字串。"""
+    return {c: (r.get(c) or "") if c in _EMPTY_STRING_FIELDS else r.get(c) for c in columns}
+
+
+@_instrumented
 def init_db():
     """建立所有必要的資料表並補齊缺漏欄位。"""
     with get_connection() as conn:
@@ -99,6 +220,17 @@ def init_db():
                 )
             """)
 
+            # 各使用者每個集合的版本號，寫入時遞增，供清單 API 計算 ETag
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS collection_versions (
+                    user_id INT NOT NULL,
+                    collection VARCHAR(50) NOT NULL,
+                    version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, collection)
+                )
+            """)
+
             _guard_alter(cur, "ALTER TABLE products ADD COLUMN pet_id INT AFTER summary")
             _guard_alter(cur, "ALTER TABLE pet_diaries ADD COLUMN pet_id INT AFTER main_emotion")
 
@@ -107,10 +239,49 @@ def init_db():
             _guard_alter(cur, "ALTER TABLE products ADD COLUMN user_id INT AFTER pet_id")
             _guard_alter(cur, "ALTER TABLE pet_diaries ADD COLUMN user_id INT AFTER pet_id")
 
+            # 清單查詢（依使用者、依寵物）與排序都走索引；InnoDB 次索引隱含主鍵 id，涵蓋 ORDER BY ..., id
+            _guard_alter(cur, "ALTER TABLE products ADD INDEX idx_products_user_created (user_id, created_at)")
+            _guard_alter(cur, "ALTER TABLE products ADD INDEX idx_products_user_pet (user_id, pet_id, created_at)")
+            _guard_alter(cur, "ALTER TABLE pet_diaries ADD INDEX idx_diaries_user_created (user_id, created_at)")
+            _guard_alter(cur, "ALTER TABLE pet_diaries ADD INDEX idx_diaries_user_pet (user_id, pet_id, created_at)")
+            _guard_alter(cur, "ALTER TABLE pets ADD INDEX idx_pets_user_created (user_id, created_at)")
+
+            # 模型分析結果（以請求本文 SHA-256 為 key，供跨 worker 共用）
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS analysis_results (
+                    request_key CHAR(64) PRIMARY KEY,
+                    model VARCHAR(200) NOT NULL,
+                    result LONGTEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # 感知雜湊（近似重複圖片查詢）
+            _guard_alter(cur, "ALTER TABLE analysis_results ADD COLUMN prompt_sha256 CHAR(64) AFTER model")
+            _guard_alter(cur, "ALTER TABLE analysis_results ADD COLUMN phash BIGINT UNSIGNED AFTER prompt_sha256")
+            _guard_alter(cur, "ALTER TABLE analysis_results ADD INDEX idx_analysis_prompt (prompt_sha256, created_at)")
+            # 近似重複只在同一使用者的分析結果之間比對
+            _guard_alter(cur, "ALTER TABLE analysis_results ADD COLUMN user_id INT AFTER phash")
+            _guard_alter(
+                cur,
+                "ALTER TABLE analysis_results ADD INDEX idx_analysis_user_prompt (user_id, prompt_sha256, created_at)",
+            )
+            # 依保存期限清除過期結果
+            _guard_alter(cur, "ALTER TABLE analysis_results ADD INDEX idx_analysis_created (created_at)")
+
+            # 跨 worker 進行中的分析（認領者呼叫模型，其餘 worker 輪詢 analysis_results）
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS analysis_claims (
+                    request_key CHAR(64) PRIMARY KEY,
+                    claimed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_claims_claimed (claimed_at)
+                )
+            """)
+
 
 # ========== Users ==========
 
 
+@_instrumented
 def create_user(username, password_hash):
     """新增使用者，回傳 id。"""
     with get_connection() as conn:
@@ -122,6 +293,7 @@ def create_user(username, password_hash):
             return cur.lastrowid
 
 
+@_instrumented
 def get_user_by_username(username):
     """依 username 取得使用者，不存在則回傳 None。"""
     with get_connection() as conn:
@@ -133,6 +305,7 @@ def get_user_by_username(username):
             return cur.fetchone()
 
 
+@_instrumented
 def get_user_by_id(user_id):
     """依 id 取得使用者，不存在則回傳 None。"""
     with get_connection() as conn:
@@ -144,55 +317,92 @@ def get_user_by_id(user_id):
             return cur.fetchone()
 
 
+# ========== Collection versions ==========
+
+COLLECTIONS = ("products", "diaries", "pets")
+_COLLECTION_TABLES = {"products": "products", "diaries": "pet_diaries", "pets": "pets"}
+
+
+def _bump_version(cur, collection, user_id=None, where="", params=()):
+    """在同一交易中遞增集合版本，讓清單的 ETag 失效。
+
+    指定 user_id 時只遞增該使用者；否則遞增 where 條件所涵蓋資料列的所有擁有者，
+    因此刪除時必須在 DELETE 之前呼叫。
+    """
+    if user_id is not None:
+        cur.execute(
+            "INSERT INTO collection_versions (user_id, collection, version) VALUES (%s, %s, 1)"
+            " ON DUPLICATE KEY UPDATE version = version + 1",
+            (user_id, collection),
+        )
+        return
+    table = _COLLECTION_TABLES[collection]
+    cur.execute(
+        f"INSERT INTO collection_versions (user_id, collection, version)"
+        f" SELECT owners.user_id, %s, 1 FROM"
+        f" (SELECT DISTINCT user_id FROM {table} WHERE {where} AND user_id IS NOT NULL) AS owners"
+        f" ON DUPLICATE KEY UPDATE version = collection_versions.version + 1",
+        (collection,) + tuple(params),
+    )
+
+
+@_instrumented
+def get_collection_version(collection, user_id):
+    """以主鍵取得集合版本 {"version", "updated_at"}；尚未寫入過時 version 為 0。"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT version, updated_at FROM collection_versions WHERE user_id = %s AND collection = %s",
+                (user_id, collection),
+            )
+            row = cur.fetchone()
+    return row or {"version": 0, "updated_at": None}
+
+
 # ========== Products ==========
 
 
-def get_all_products(pet_id=None, user_id=None):
-    """取得商品清單。pet_id=0 表示未指定寵物；user_id 限定擁有者。"""
+@_instrumented
+def get_all_products(pet_id=None, user_id=None, fields=None):
+    """取得商品清單。pet_id=0 表示未指定寵物；user_id 限定擁有者；fields 限定回傳欄位。"""
+    columns = _columns(PRODUCT_FIELDS, fields)
+    select = ", ".join(columns)
     with get_connection() as conn:
         with conn.cursor() as cur:
             user_clause = " AND user_id = %s" if user_id is not None else ""
             user_params = (user_id,) if user_id is not None else ()
             if pet_id == 0:
                 cur.execute(
-                    f"SELECT id, title, summary, pet_id, user_id, created_at, updated_at"
+                    f"SELECT {select}"
                     f" FROM products WHERE pet_id IS NULL{user_clause}"
                     f" ORDER BY created_at DESC, id DESC",
                     user_params,
                 )
             elif pet_id:
                 cur.execute(
-                    f"SELECT id, title, summary, pet_id, user_id, created_at, updated_at"
+                    f"SELECT {select}"
                     f" FROM products WHERE pet_id = %s{user_clause}"
                     f" ORDER BY created_at DESC, id DESC",
                     (pet_id,) + user_params,
                 )
             else:
                 cur.execute(
-                    f"SELECT id, title, summary, pet_id, user_id, created_at, updated_at"
+                    f"SELECT {select}"
                     f" FROM products WHERE 1=1{user_clause}"
                     f" ORDER BY created_at DESC, id DESC",
                     user_params,
                 )
             rows = cur.fetchall()
-    return [
-        {
-            "id": r["id"],
-            "title": r["title"],
-            "summary": r["summary"] or "",
-            "pet_id": r.get("pet_id"),
-            "user_id": r.get("user_id"),
-            "created_at": r["created_at"],
-            "updated_at": r.get("updated_at"),
-        }
-        for r in rows
-    ]
+    return [_format_row(r, columns) for r in rows]
 
 
+@_instrumented
 def add_product(title, summary, pet_id=None, user_id=None):
     """新增商品，回傳新商品的 id。"""
     with get_connection() as conn:
         with conn.cursor() as cur:
+            if user_id is not None:
+                _bump_version(cur, "products", user_id)
             cur.execute(
                 "INSERT INTO products (title, summary, pet_id, user_id) VALUES (%s, %s, %s, %s)",
                 (title, summary, pet_id or None, user_id),
@@ -200,40 +410,35 @@ def add_product(title, summary, pet_id=None, user_id=None):
             return cur.lastrowid
 
 
-def get_product(product_id, user_id=None):
+@_instrumented
+def get_product(product_id, user_id=None, fields=None):
     """依 id 取得單一商品，不存在或不屬於 user 則回傳 None。"""
+    columns = _columns(PRODUCT_FIELDS, fields)
+    select = ", ".join(columns)
     with get_connection() as conn:
         with conn.cursor() as cur:
             if user_id is not None:
                 cur.execute(
-                    "SELECT id, title, summary, pet_id, user_id, created_at, updated_at"
-                    " FROM products WHERE id = %s AND user_id = %s",
+                    f"SELECT {select} FROM products WHERE id = %s AND user_id = %s",
                     (product_id, user_id),
                 )
             else:
                 cur.execute(
-                    "SELECT id, title, summary, pet_id, user_id, created_at, updated_at"
-                    " FROM products WHERE id = %s",
+                    f"SELECT {select} FROM products WHERE id = %s",
                     (product_id,),
                 )
             row = cur.fetchone()
     if not row:
         return None
-    return {
-        "id": row["id"],
-        "title": row["title"],
-        "summary": row["summary"] or "",
-        "pet_id": row.get("pet_id"),
-        "user_id": row.get("user_id"),
-        "created_at": row["created_at"],
-        "updated_at": row.get("updated_at"),
-    }
+    return _format_row(row, columns)
 
 
+@_instrumented
 def update_product(product_id, title, summary, pet_id=None, user_id=None):
     """更新商品。"""
     with get_connection() as conn:
         with conn.cursor() as cur:
+            _bump_version(cur, "products", user_id, "id = %s", (product_id,))
             if user_id is not None:
                 cur.execute(
                     "UPDATE products SET title = %s, summary = %s, pet_id = %s"
@@ -247,10 +452,12 @@ def update_product(product_id, title, summary, pet_id=None, user_id=None):
                 )
 
 
+@_instrumented
 def remove_product(product_id, user_id=None):
     """依 id 刪除商品。"""
     with get_connection() as conn:
         with conn.cursor() as cur:
+            _bump_version(cur, "products", user_id, "id = %s", (product_id,))
             if user_id is not None:
                 cur.execute(
                     "DELETE FROM products WHERE id = %s AND user_id = %s",
@@ -260,6 +467,7 @@ def remove_product(product_id, user_id=None):
                 cur.execute("DELETE FROM products WHERE id = %s", (product_id,))
 
 
+@_instrumented
 def remove_products(product_ids, user_id=None):
     """批次刪除多個商品。"""
     if not product_ids:
@@ -267,6 +475,7 @@ def remove_products(product_ids, user_id=None):
     placeholders = ", ".join(["%s"] * len(product_ids))
     with get_connection() as conn:
         with conn.cursor() as cur:
+            _bump_version(cur, "products", user_id, f"id IN ({placeholders})", product_ids)
             if user_id is not None:
                 cur.execute(
                     f"DELETE FROM products WHERE id IN ({placeholders}) AND user_id = %s",
@@ -282,41 +491,38 @@ def remove_products(product_ids, user_id=None):
 # ========== Pets ==========
 
 
-def _format_pet(r):
-    return {
-        "id": r["id"],
-        "name": r["name"],
-        "breed": r.get("breed") or "",
-        "birthday": str(r["birthday"]) if r.get("birthday") else "",
-        "photo_base64": r.get("photo_base64") or "",
-        "user_id": r.get("user_id"),
-        "created_at": r["created_at"],
-        "updated_at": r.get("updated_at"),
-    }
+def _format_pet(r, columns=PET_FIELDS):
+    pet = _format_row(r, columns)
+    if "birthday" in pet:
+        pet["birthday"] = str(r["birthday"]) if r.get("birthday") else ""
+    return pet
 
 
-def get_all_pets(user_id=None):
+@_instrumented
+def get_all_pets(user_id=None, fields=None):
     """取得所有寵物，依建立時間升序。"""
+    columns = _columns(PET_FIELDS, fields)
+    select = ", ".join(columns)
     with get_connection() as conn:
         with conn.cursor() as cur:
             if user_id is not None:
-                cur.execute("""
-                    SELECT id, name, breed, birthday, photo_base64, user_id, created_at, updated_at
-                    FROM pets WHERE user_id = %s ORDER BY created_at ASC
-                """, (user_id,))
+                cur.execute(
+                    f"SELECT {select} FROM pets WHERE user_id = %s ORDER BY created_at ASC",
+                    (user_id,),
+                )
             else:
-                cur.execute("""
-                    SELECT id, name, breed, birthday, photo_base64, user_id, created_at, updated_at
-                    FROM pets ORDER BY created_at ASC
-                """)
+                cur.execute(f"SELECT {select} FROM pets ORDER BY created_at ASC")
             rows = cur.fetchall()
-    return [_format_pet(r) for r in rows]
+    return [_format_pet(r, columns) for r in rows]
 
 
+@_instrumented
 def add_pet(name, breed="", birthday=None, photo_base64="", user_id=None):
     """新增寵物，回傳 id。"""
     with get_connection() as conn:
         with conn.cursor() as cur:
+            if user_id is not None:
+                _bump_version(cur, "pets", user_id)
             cur.execute(
                 "INSERT INTO pets (name, breed, birthday, photo_base64, user_id)"
                 " VALUES (%s, %s, %s, %s, %s)",
@@ -325,32 +531,35 @@ def add_pet(name, breed="", birthday=None, photo_base64="", user_id=None):
             return cur.lastrowid
 
 
-def get_pet(pet_id, user_id=None):
+@_instrumented
+def get_pet(pet_id, user_id=None, fields=None):
     """依 id 取得單一寵物，不存在或不屬於 user 則回傳 None。"""
+    columns = _columns(PET_FIELDS, fields)
+    select = ", ".join(columns)
     with get_connection() as conn:
         with conn.cursor() as cur:
             if user_id is not None:
                 cur.execute(
-                    "SELECT id, name, breed, birthday, photo_base64, user_id, created_at, updated_at"
-                    " FROM pets WHERE id = %s AND user_id = %s",
+                    f"SELECT {select} FROM pets WHERE id = %s AND user_id = %s",
                     (pet_id, user_id),
                 )
             else:
                 cur.execute(
-                    "SELECT id, name, breed, birthday, photo_base64, user_id, created_at, updated_at"
-                    " FROM pets WHERE id = %s",
+                    f"SELECT {select} FROM pets WHERE id = %s",
                     (pet_id,),
                 )
             row = cur.fetchone()
-    return _format_pet(row) if row else None
+    return _format_pet(row, columns) if row else None
 
 
+@_instrumented
 def update_pet(pet_id, name, breed="", birthday=None, photo_base64=None, user_id=None):
     """更新寵物。photo_base64=None 表示不更新照片。"""
     with get_connection() as conn:
         with conn.cursor() as cur:
             uid_clause = " AND user_id = %s" if user_id is not None else ""
             uid_param = (user_id,) if user_id is not None else ()
+            _bump_version(cur, "pets", user_id, "id = %s", (pet_id,))
             if photo_base64 is not None:
                 cur.execute(
                     f"UPDATE pets SET name=%s, breed=%s, birthday=%s, photo_base64=%s"
@@ -365,10 +574,14 @@ def update_pet(pet_id, name, breed="", birthday=None, photo_base64=None, user_id
                 )
 
 
+@_instrumented
 def remove_pet(pet_id, user_id=None):
     """刪除寵物，並將相關商品與日記的 pet_id 設為 NULL。"""
     with get_connection() as conn:
         with conn.cursor() as cur:
+            _bump_version(cur, "products", user_id, "pet_id = %s", (pet_id,))
+            _bump_version(cur, "diaries", user_id, "pet_id = %s", (pet_id,))
+            _bump_version(cur, "pets", user_id, "id = %s", (pet_id,))
             if user_id is not None:
                 cur.execute(
                     "UPDATE products SET pet_id = NULL WHERE pet_id = %s AND user_id = %s",
@@ -391,58 +604,47 @@ def remove_pet(pet_id, user_id=None):
 # ========== Pet diary ==========
 
 
-def get_all_diaries(pet_id=None, user_id=None):
-    """取得日記清單。pet_id=0 表示未指定寵物；user_id 限定擁有者。"""
+@_instrumented
+def get_all_diaries(pet_id=None, user_id=None, fields=None):
+    """取得日記清單。pet_id=0 表示未指定寵物；user_id 限定擁有者；fields 限定回傳欄位。"""
+    columns = _columns(DIARY_FIELDS, fields)
+    select = ", ".join(columns)
     with get_connection() as conn:
         with conn.cursor() as cur:
             user_clause = " AND user_id = %s" if user_id is not None else ""
             user_params = (user_id,) if user_id is not None else ()
             if pet_id == 0:
                 cur.execute(
-                    f"SELECT id, title, describe_text, main_emotion, memo, image_base64,"
-                    f" pet_id, user_id, created_at, updated_at"
+                    f"SELECT {select}"
                     f" FROM pet_diaries WHERE pet_id IS NULL{user_clause}"
                     f" ORDER BY created_at DESC, id DESC",
                     user_params,
                 )
             elif pet_id:
                 cur.execute(
-                    f"SELECT id, title, describe_text, main_emotion, memo, image_base64,"
-                    f" pet_id, user_id, created_at, updated_at"
+                    f"SELECT {select}"
                     f" FROM pet_diaries WHERE pet_id = %s{user_clause}"
                     f" ORDER BY created_at DESC, id DESC",
                     (pet_id,) + user_params,
                 )
             else:
                 cur.execute(
-                    f"SELECT id, title, describe_text, main_emotion, memo, image_base64,"
-                    f" pet_id, user_id, created_at, updated_at"
+                    f"SELECT {select}"
                     f" FROM pet_diaries WHERE 1=1{user_clause}"
                     f" ORDER BY created_at DESC, id DESC",
                     user_params,
                 )
             rows = cur.fetchall()
-    return [
-        {
-            "id": r["id"],
-            "title": r.get("title") or "",
-            "describe_text": r["describe_text"] or "",
-            "main_emotion": r["main_emotion"] or "",
-            "memo": r["memo"] or "",
-            "image_base64": r.get("image_base64") or "",
-            "pet_id": r.get("pet_id"),
-            "user_id": r.get("user_id"),
-            "created_at": r["created_at"],
-            "updated_at": r.get("updated_at"),
-        }
-        for r in rows
-    ]
+    return [_format_row(r, columns) for r in rows]
 
 
+@_instrumented
 def add_diary(title, describe_text, main_emotion, memo, image_base64="", pet_id=None, user_id=None):
     """新增日記，回傳 id。"""
     with get_connection() as conn:
         with conn.cursor() as cur:
+            if user_id is not None:
+                _bump_version(cur, "diaries", user_id)
             cur.execute(
                 "INSERT INTO pet_diaries"
                 " (title, describe_text, main_emotion, memo, image_base64, pet_id, user_id)"
@@ -460,41 +662,83 @@ def add_diary(title, describe_text, main_emotion, memo, image_base64="", pet_id=
             return cur.lastrowid
 
 
-def get_diary(diary_id, user_id=None):
+@_instrumented
+def get_diary(diary_id, user_id=None, fields=None):
     """依 id 取得單一日記，不存在或不屬於 user 則回傳 None。"""
+    columns = _columns(DIARY_FIELDS, fields)
+    select = ", ".join(columns)
     with get_connection() as conn:
         with conn.cursor() as cur:
             if user_id is not None:
                 cur.execute(
-                    "SELECT id, title, describe_text, main_emotion, memo, image_base64,"
-                    " pet_id, user_id, created_at, updated_at"
-                    " FROM pet_diaries WHERE id = %s AND user_id = %s",
+                    f"SELECT {select} FROM pet_diaries WHERE id = %s AND user_id = %s",
                     (diary_id, user_id),
                 )
             else:
                 cur.execute(
-                    "SELECT id, title, describe_text, main_emotion, memo, image_base64,"
-                    " pet_id, user_id, created_at, updated_at"
-                    " FROM pet_diaries WHERE id = %s",
+                    f"SELECT {select} FROM pet_diaries WHERE id = %s",
                     (diary_id,),
                 )
             row = cur.fetchone()
     if not row:
         return None
-    return {
-        "id": row["id"],
-        "title": row.get("title") or "",
-        "describe_text": row["describe_text"] or "",
-        "main_emotion": row["main_emotion"] or "",
-        "memo": row["memo"] or "",
-        "image_base64": row.get("image_base64") or "",
-        "pet_id": row.get("pet_id"),
-        "user_id": row.get("user_id"),
-        "created_at": row["created_at"],
-        "updated_at": row.get("updated_at"),
-    }
+    return _format_row(row, columns)
+
+
+@_instrumented
+def count_diaries_with_image(after_id=0, user_id=None):
+    """計算 id > after_id 且有圖片的日記數。"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            user_clause = " AND user_id = %s" if user_id is not None else ""
+            user_params = (user_id,) if user_id is not None else ()
+            cur.execute(
+                f"SELECT COUNT(*) AS n FROM pet_diaries"
+                f" WHERE id > %s AND image_base64 <> ''{user_clause}",
+                (after_id,) + user_params,
+            )
+            return cur.fetchone()["n"]
+
 
+def iter_diaries_with_image(after_id=0, user_id=None, net_write_timeout=3600):
+    """依 id 順序逐筆產生 id > after_id 且有圖片的日記 (id, user_id, image_base64)。
 
+    使用 server-side cursor 串流讀取，不會一次把所有圖片載入記憶體；
+    迭代期間佔用一條專屬連線。呼叫端處理得慢時 MySQL 會卡在送資料，
+    因此把這條連線的 net_write_timeout 拉長，避免被伺服器中斷。
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SET SESSION net_write_timeout = %s", (net_write_timeout,))
+        with conn.cursor(_SSCursor) as cur:
+            user_clause = " AND user_id = %s" if user_id is not None else ""
+            user_params = (user_id,) if user_id is not None else ()
+            cur.execute(
+                f"SELECT id, user_id, image_base64 FROM pet_diaries"
+                f" WHERE id > %s AND image_base64 <> ''{user_clause}"
+                f" ORDER BY id",
+                (after_id,) + user_params,
+            )
+            for row in cur:
+                yield row
+
+
+@_instrumented
+def update_diary_analyses(rows):
+    """批次更新日記的分析結果。rows 為 (describe_text, main_emotion, diary_id) 清單。"""
+    if not rows:
+        return
+    ids = [row[2] for row in rows]
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            _bump_version(cur, "diaries", None, f"id IN ({', '.join(['%s'] * len(ids))})", ids)
+            cur.executemany(
+                "UPDATE pet_diaries SET describe_text = %s, main_emotion = %s WHERE id = %s",
+                rows,
+            )
+
+
+@_instrumented
 def remove_diaries(diary_ids, user_id=None):
     """批次刪除日記。"""
     if not diary_ids:
@@ -502,6 +746,7 @@ def remove_diaries(diary_ids, user_id=None):
     placeholders = ", ".join(["%s"] * len(diary_ids))
     with get_connection() as conn:
         with conn.cursor() as cur:
+            _bump_version(cur, "diaries", user_id, f"id IN ({placeholders})", diary_ids)
             if user_id is not None:
                 cur.execute(
                     f"DELETE FROM pet_diaries WHERE id IN ({placeholders}) AND user_id = %s",
@@ -512,3 +757,163 @@ def remove_diaries(diary_ids, user_id=None):
                     f"DELETE FROM pet_diaries WHERE id IN ({placeholders})",
                     diary_ids,
                 )
+
+
+# ========== Page bootstrap ==========
+
+# section 名稱 -> (資料表, 欄位, created_at 是否降冪)，排序與對應的 get_all_* 相同
+_PAGE_SECTIONS = {
+    "pets": ("pets", PET_FIELDS, "created_at ASC"),
+    "products": ("products", PRODUCT_FIELDS, "created_at DESC, id DESC"),
+    "diaries": ("pet_diaries", DIARY_FIELDS, "created_at DESC, id DESC"),
+}
+
+
+@_instrumented
+def get_page_data(user_id, sections, product_id=None):
+    """在同一條連線上取得頁面初始資料，內容與排序皆與對應的清單 API 相同。
+
+    sections 為 {"pets" | "products" | "diaries": fields}，fields 為 None 時取全部欄位；
+    指定 product_id 時另外回傳 "product"（不存在或不屬於 user 則為 None）。
+    每個 section 各自一個一般 SELECT，逐列回傳圖片欄位，不會把整個清單塞進單一值而超過 max_allowed_packet。
+    """
+    user_clause = "user_id = %s" if user_id is not None else "1=1"
+    user_params = (user_id,) if user_id is not None else ()
+    # 先驗證欄位，不合法時不必取得連線
+    columns = {name: _columns(_PAGE_SECTIONS[name][1], fields) for name, fields in sections.items()}
+    if not columns and product_id is None:
+        return {}
+    data = {}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for name, selected in columns.items():
+                table, _all_fields, order = _PAGE_SECTIONS[name]
+                cur.execute(
+                    f"SELECT {', '.join(selected)} FROM {table} WHERE {user_clause} ORDER BY {order}",
+                    user_params,
+                )
+                formatter = _format_pet if name == "pets" else _format_row
+                data[name] = [formatter(r, selected) for r in cur.fetchall()]
+            if product_id is not None:
+                cur.execute(
+                    f"SELECT {', '.join(PRODUCT_FIELDS)} FROM products WHERE id = %s AND {user_clause}",
+                    (product_id,) + user_params,
+                )
+                row = cur.fetchone()
+                data["product"] = _format_row(row, PRODUCT_FIELDS) if row else None
+    return data
+
+
+# ========== Analysis results ==========
+
+
+@_instrumented
+def claim_analysis(request_key, stale_after):
+    """認領一筆進行中的分析，成功時回傳 True。
+
+    他人已認領且未超過 stale_after 秒時回傳 False；超過時視為該 worker 已中斷，改由呼叫端接手。
+    認領只是一列資料，呼叫模型與等待期間都不佔用連線。
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            # affected rows：新增 1、接手過期的認領 2、他人仍在進行 0
+            cur.execute(
+                "INSERT INTO analysis_claims (request_key) VALUES (%s)"
+                " ON DUPLICATE KEY UPDATE claimed_at ="
+                " IF(claimed_at < NOW() - INTERVAL %s SECOND, CURRENT_TIMESTAMP, claimed_at)",
+                (request_key, stale_after),
+            )
+            return cur.rowcount > 0
+
+
+@_instrumented
+def release_analysis_claim(request_key):
+    """移除認領（無論分析成功與否）。"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM analysis_claims WHERE request_key = %s", (request_key,))
+
+
+@_instrumented
+def prune_analysis_results(max_age_seconds, batch_rows=1000):
+    """刪除超過 max_age_seconds 的分析結果與遺留的認領，回傳刪除的結果筆數。
+
+    每批最多 batch_rows 筆並各自提交，避免一次長時間鎖住資料表。
+    """
+    deleted = 0
+    while True:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM analysis_results WHERE created_at < NOW() - INTERVAL %s SECOND LIMIT %s",
+                    (max_age_seconds, batch_rows),
+                )
+                count = cur.rowcount
+        deleted += count
+        if count < batch_rows:
+            break
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM analysis_claims WHERE claimed_at < NOW() - INTERVAL %s SECOND",
+                (max_age_seconds,),
+            )
+    return deleted
+
+
+@_instrumented
+def get_analysis_result(request_key, max_age_seconds=None):
+    """取得分析結果，不存在則回傳 None。max_age_seconds 限定只取最近儲存的結果。"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if max_age_seconds is not None:
+                cur.execute(
+                    "SELECT result FROM analysis_results"
+                    " WHERE request_key = %s AND created_at >= NOW() - INTERVAL %s SECOND",
+                    (request_key, max_age_seconds),
+                )
+            else:
+                cur.execute(
+                    "SELECT result FROM analysis_results WHERE request_key = %s",
+                    (request_key,),
+                )
+            row = cur.fetchone()
+    return json.loads(row["result"]) if row else None
+
+
+@_instrumented
+def save_analysis_result(request_key, model, result, prompt_sha256=None, phash=None, user_id=None):
+    """儲存（或覆寫）一筆分析結果；phash、user_id 為 None 時保留既有的值。"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO analysis_results (request_key, model, prompt_sha256, phash, user_id, result)"
+                " VALUES (%s, %s, %s, %s, %s, %s)"
+                " ON DUPLICATE KEY UPDATE model = VALUES(model), result = VALUES(result),"
+                " prompt_sha256 = COALESCE(VALUES(prompt_sha256), prompt_sha256),"
+                " phash = COALESCE(VALUES(phash), phash), user_id = COALESCE(VALUES(user_id), user_id),"
+                " created_at = CURRENT_TIMESTAMP",
+                (request_key, model, prompt_sha256, phash, user_id, json.dumps(result, ensure_ascii=False)),
+            )
+
+
+@_instrumented
+def get_analysis_phashes(prompt_sha256, user_id, since=None):
+    """取得該使用者同一 prompt 的 (phash, request_key) 清單；since 為 Unix 時間，只取之後新增的資料。"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if since is not None:
+                cur.execute(
+                    "SELECT phash, request_key FROM analysis_results"
+                    " WHERE user_id = %s AND prompt_sha256 = %s AND phash IS NOT NULL"
+                    " AND created_at >= FROM_UNIXTIME(%s)",
+                    (user_id, prompt_sha256, since),
+                )
+            else:
+                cur.execute(
+                    "SELECT phash, request_key FROM analysis_results"
+                    " WHERE user_id = %s AND prompt_sha256 = %s AND phash IS NOT NULL",
+                    (user_id, prompt_sha256),
+                )
+            rows = cur.fetchall()
+    return [(r["phash"], r["request_key"]) for r in rows]
@@ -0,0 +1,71 @@
+"""
+存活與就緒檢查。
+
+/healthz 只代表行程還能回應，不做任何 I/O；/readyz 檢查 MySQL 與 Ollama，
+每個相依服務的結果快取 READY_CACHE_SECONDS 秒，且同一時間只有一個執行緒真正去探測，
+因此探測再頻繁也不會對後端造成負擔。Ollama 只影響分析功能，預設不可用時回報 degraded
+但仍視為就緒；READY_REQUIRE_OLLAMA=1 時改為不就緒。
+/readyz 不需登入，因此失敗原因（可能含主機名稱、帳號、URL）只寫進 log，回應固定為 "unavailable"。
+"""
+import logging
+import os
+import threading
+import time
+
+import db
+import model_connector
+
+logger = logging.getLogger(__name__)
+
+CACHE_SECONDS = float(os.getenv("READY_CACHE_SECONDS", "5"))
+PROBE_TIMEOUT = float(os.getenv("READY_PROBE_TIMEOUT", "2"))
+REQUIRE_OLLAMA = os.getenv("READY_REQUIRE_OLLAMA", "0") == "1"
+
+
+class Probe:
+    """執行單一相依服務的檢查並快取結果。"""
+
+    def __init__(self, name, check, critical=True, ttl=CACHE_SECONDS, clock=time.monotonic):
+        self.name = name
+        self.critical = critical
+        self._check = check
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._result = None
+        self._checked_at = None
+
+    def run(self):
+        """回傳 {"ok", "latency_ms", "age_seconds"[, "error"]}；快取未過期時不重新檢查。"""
+        with self._lock:
+            now = self._clock()
+            if self._result is None or now - self._checked_at >= self._ttl:
+                started = time.perf_counter()
+                try:
+                    self._check()
+                    result = {"ok": True}
+                except Exception as e:  # 探測失敗本身就是要回報的結果
+                    logger.warning("Readiness probe %s failed: %s: %s", self.name, type(e).__name__, e)
+                    result = {"ok": False, "error": "unavailable"}
+                result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                self._result, self._checked_at = result, self._clock()
+            return dict(self._result, age_seconds=round(self._clock() - self._checked_at, 1))
+
+
+_probes = (
+    Probe("mysql", lambda: db.ping(timeout=PROBE_TIMEOUT)),
+    Probe("ollama", lambda: model_connector.ping(timeout=PROBE_TIMEOUT), critical=REQUIRE_OLLAMA),
+)
+
+
+def readiness(probes=_probes):
+    """回傳 (是否就緒, body)。關鍵相依失敗為 unavailable，其餘失敗為 degraded。"""
+    checks = {p.name: p.run() for p in probes}
+    ready = all(checks[p.name]["ok"] for p in probes if p.critical)
+    if not ready:
+        status = "unavailable"
+    elif all(c["ok"] for c in checks.values()):
+        status = "ready"
+    else:
+        status = "degraded"
+    return ready, {"status": status, "checks": checks}
@@ -0,0 +1,223 @@
+"""
+圖片感知雜湊（dHash）與 Hamming 距離索引，用來找出重新拍攝、裁切或重新壓縮過的相同商品。
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from io import BytesIO
+
+import pymysql
+
+import db
+
+try:
+    from PIL import Image, UnidentifiedImageError
+except ImportError:  # Pillow 未安裝時停用近似重複查詢
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+_HASH_SIZE = 8
+# 先縮到這個邊長再轉灰階、旋轉；dHash 只需要 9x8，不必處理原始解析度
+_THUMBNAIL_SIZE = 64
+# 查詢時比對的旋轉角度，讓旋轉過的照片也能命中
+_ROTATIONS = (0, 90, 180, 270)
+
+
+def _shrink(image):
+    """縮成 _THUMBNAIL_SIZE 以內的灰階圖。JPEG 以 draft 直接用 1/2～1/8 比例解碼，
+    其他格式以 reducing_gap 先整數倍縮小，避免配置原始解析度的灰階與旋轉緩衝區。"""
+    image.draft("L", (_THUMBNAIL_SIZE, _THUMBNAIL_SIZE))
+    if image.mode not in ("L", "RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    image.thumbnail((_THUMBNAIL_SIZE, _THUMBNAIL_SIZE), Image.BILINEAR, reducing_gap=2.0)
+    return image.convert("L")
+
+
+def _open_thumbnail(image_source):
+    """開啟圖片來源並縮圖；檔案物件讀完後會回到原本位置。"""
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        return _shrink(Image.open(BytesIO(image_source)))
+    if hasattr(image_source, "read"):
+        pos = image_source.tell()
+        try:
+            return _shrink(Image.open(image_source))
+        finally:
+            image_source.seek(pos)
+    with Image.open(image_source) as image:
+        return _shrink(image)
+
+
+def _dhash(gray):
+    """對灰階圖計算 64-bit difference hash。"""
+    small = gray.resize((_HASH_SIZE + 1, _HASH_SIZE), Image.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(_HASH_SIZE):
+        offset = row * (_HASH_SIZE + 1)
+        for col in range(_HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def dhash_variants(image_source):
+    """回傳圖片在各旋轉角度下的 dHash 清單（第一個為原始方向）；無法解析時回傳 None。"""
+    if Image is None:
+        return None
+    try:
+        gray = _open_thumbnail(image_source)
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        logger.debug("Perceptual hash skipped: %s", e)
+        return None
+    return [_dhash(gray.rotate(angle, expand=True) if angle else gray) for angle in _ROTATIONS]
+
+
+def hamming(a, b):
+    """兩個雜湊值之間不同的位元數。"""
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """以 Hamming 距離建立的 BK-tree，支援在距離上限內查詢。"""
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, item):
+        node = self._root
+        if node is None:
+            self._root = (value, item, {})
+            self._size += 1
+            return
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, item, {})
+                self._size += 1
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """回傳距離不超過 max_distance 的 (distance, item)，依距離排序。"""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                found.append((distance, item))
+            # 三角不等式：只有距離落在 [d - max, d + max] 的子樹可能命中
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+def prompt_digest(prompt):
+    """prompt 的 SHA-256，作為近似重複索引的分組 key。"""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class NearDuplicateIndex:
+    """每個 (使用者, prompt) 一棵 BK-tree，內容來自 analysis_results.phash，並定期補進其他 worker 新增的資料。
+
+    只在同一使用者自己的分析結果之間比對：誤判的近似圖片頂多拿到自己先前的結果，
+    不會把其他使用者的分析交出去。沒有 user_id 的請求不查詢也不加入索引。
+    """
+
+    # 超過此數量的 (使用者, prompt) 時清空，之後依需要重新載入
+    _MAX_TREES = 10000
+
+    def __init__(self, max_distance, refresh_seconds):
+        self.max_distance = max_distance
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._trees = {}  # (user_id, prompt_sha256) -> (BKTree, set[request_key], loaded_at)
+        self._refresh_locks = {}  # (user_id, prompt_sha256) -> threading.Lock
+
+    def _fresh(self, key, now):
+        entry = self._trees.get(key)
+        if entry is not None and now - entry[2] < self.refresh_seconds:
+            return entry[0]
+        return None
+
+    def _tree(self, user_id, prompt_sha256):
+        key = (user_id, prompt_sha256)
+        with self._lock:
+            tree = self._fresh(key, time.time())
+            if tree is not None:
+                return tree
+            refresh_lock = self._refresh_locks.setdefault(key, threading.Lock())
+        # 查詢資料庫時只持有該 key 的鎖，其他使用者的查詢不必等待
+        with refresh_lock:
+            now = time.time()
+            with self._lock:
+                tree = self._fresh(key, now)
+                if tree is not None:
+                    return tree
+                entry = self._trees.get(key)
+            tree, keys, loaded_at = entry or (BKTree(), set(), None)
+            # 往回多抓一秒，避免 TIMESTAMP 秒級精度漏掉同一秒寫入的資料
+            since = loaded_at - 1 if loaded_at is not None else None
+            rows = db.get_analysis_phashes(prompt_sha256, user_id, since=since)
+            with self._lock:
+                for phash, request_key in rows:
+                    if request_key not in keys:
+                        keys.add(request_key)
+                        tree.add(phash, request_key)
+                if key not in self._trees and len(self._trees) >= self._MAX_TREES:
+                    self._trees.clear()
+                    self._refresh_locks = {key: refresh_lock}
+                self._trees[key] = (tree, keys, now)
+            return tree
+
+    def lookup(self, hashes, prompt_sha256, user_id):
+        """以各旋轉角度的雜湊查詢該使用者最近似的既有分析結果，沒有則回傳 None。"""
+        if not hashes or self.max_distance < 0 or user_id is None:
+            return None
+        try:
+            tree = self._tree(user_id, prompt_sha256)
+            matches = sorted(m for h in hashes for m in tree.search(h, self.max_distance))
+            if not matches:
+                return None
+            distance, request_key = matches[0]
+            result = db.get_analysis_result(request_key)
+        except pymysql.err.Error as e:
+            logger.warning("Near-duplicate lookup failed: %s", e)
+            return None
+        if result is not None:
+            logger.info("Reusing analysis %s (hamming distance %d)", request_key[:12], distance)
+        return result
+
+    def add(self, phash, request_key, model, prompt_sha256, result, user_id):
+        """儲存一筆分析結果並加入該使用者的索引。"""
+        if self.max_distance < 0 or user_id is None:
+            return
+        try:
+            db.save_analysis_result(request_key, model, result, prompt_sha256=prompt_sha256, phash=phash,
+                                    user_id=user_id)
+        except pymysql.err.Error as e:
+            logger.warning("Saving analysis result failed: %s", e)
+            return
+        with self._lock:
+            entry = self._trees.get((user_id, prompt_sha256))
+            if entry is not None and request_key not in entry[1]:
+                entry[1].add(request_key)
+                entry[0].add(phash, request_key)
+
+
+# 64 位元中最多幾個位元不同仍視為同一張圖；設為 -1 停用
+near_duplicates = NearDuplicateIndex(
+    max_distance=int(os.getenv("PHASH_MAX_DISTANCE", "6")),
+    refresh_seconds=int(os.getenv("PHASH_REFRESH_SECONDS", "60")),
+)
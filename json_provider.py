@@ -0,0 +1,53 @@
+"""
+以 orjson 實作的 Flask JSON provider，jsonify、request.get_json() 與 tojson 都會使用。
+
+datetime 一律輸出 ISO-8601；MySQL 取回的 naive datetime 視為 UTC 並加上 Z，
+與原本 Flask 預設（HTTP date、naive 視為 GMT）表示的是同一個時間點。
+"""
+import decimal
+import logging
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # 未安裝時沿用 Flask 預設 provider
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+_OPTIONS = (orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+def _default(o):
+    """orjson 不認得的型別：Decimal 與具 __html__ 的物件（如 Markup）轉為字串。"""
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """orjson 版 JSONProvider；response() 直接以 bytes 建立回應，省去 str → bytes 的轉換。"""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=_OPTIONS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=_OPTIONS)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    """orjson 可用時替換 app 的 JSON provider。"""
+    if orjson is None:
+        logger.warning("orjson is not installed, using Flask's default JSON provider")
+        return
+    app.json = OrjsonProvider(app)
@@ -0,0 +1,239 @@
+"""
+執行期指標，以 Prometheus 文字格式由 /metrics 輸出。
+
+涵蓋各 endpoint 的延遲與狀態碼、上傳大小、db.py 各函式的連線／查詢耗時與次數、
+Ollama 呼叫的延遲、重試與失敗，以及行程記憶體。每次記錄只是一次 dict 查找與加法
+（持有該指標自己的鎖），可以常駐於正式環境。指標存在行程記憶體中，多個 worker 時各自回報。
+"""
+import bisect
+import math
+import os
+import resource
+import threading
+import time
+
+from flask import g, request
+
+# 秒；涵蓋毫秒級查詢到數十秒的模型推論
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+    suffix = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _labels(self, key):
+        return dict(zip(self.labelnames, key))
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """只增不減的計數。"""
+
+    kind = "counter"
+    suffix = "_total"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name + "_total", self._labels(key), value
+
+
+class Histogram(_Metric):
+    """固定 bucket 的分布，輸出累積 bucket、_sum 與 _count。"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1])) for key, state in self._values.items()]
+        for key, (counts, total) in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                yield self.name + "_bucket", dict(labels, le=_format_value(bound)), cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulative
+
+
+class Registry:
+    """持有所有指標與 collector（輸出時才取值的指標）並輸出文字格式。"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """collect() 產生 (name, kind, documentation, [(labels, value), ...])。"""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            family = metric.name + metric.suffix
+            lines.append(f"# HELP {family} {metric.documentation}")
+            lines.append(f"# TYPE {family} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collect in self._collectors:
+            for name, kind, documentation, samples in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests", "HTTP requests by endpoint, method and status.", ("endpoint", "method", "status"))
+HTTP_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Time spent in the Flask handler.", ("endpoint", "method"))
+HTTP_UPLOAD_BYTES = registry.histogram(
+    "http_request_body_bytes", "Request body size of POST/PUT requests.", ("endpoint",), BYTE_BUCKETS)
+
+DB_CONNECT_DURATION = registry.histogram("db_connect_duration_seconds", "Time to open a MySQL connection.")
+DB_CONNECT_ERRORS = registry.counter("db_connect_errors", "Failed MySQL connection attempts.")
+DB_CALLS = registry.counter("db_calls", "db.py function calls by outcome.", ("function", "outcome"))
+DB_CALL_DURATION = registry.histogram(
+    "db_call_duration_seconds", "Wall time of db.py functions, connection included.", ("function",))
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "Time per SQL statement, by calling db.py function.", ("function",))
+
+MODEL_ATTEMPT_DURATION = registry.histogram(
+    "ollama_request_duration_seconds", "Time per Ollama HTTP attempt.", ("outcome",))
+MODEL_REQUEST_BYTES = registry.histogram(
+    "ollama_request_body_bytes", "Ollama request body size.", (), BYTE_BUCKETS)
+MODEL_RETRIES = registry.counter("ollama_retries", "Ollama attempts retried after a failure.")
+MODEL_FAILURES = registry.counter(
+    "ollama_failures", "Ollama calls that failed after all retries.", ("reason",))
+MODEL_CASCADE_CALLS = registry.counter(
+    "model_cascade_calls", "Model cascade tier calls by outcome: served, or the reason for escalating.",
+    ("model", "outcome"))
+MODEL_CASCADE_DURATION = registry.histogram(
+    "model_cascade_tier_duration_seconds", "Time per model cascade tier, queueing and retries included.", ("model",))
+
+
+def _page_size():
+    try:
+        return os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 4096
+
+
+def _process_metrics():
+    samples = []
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * _page_size()
+        samples.append(("process_resident_memory_bytes", "gauge", "Resident set size.", [({}, rss)]))
+    except OSError:  # 非 Linux
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss 在 Linux 為 KB
+    samples.append(("process_peak_resident_memory_bytes", "gauge", "Peak resident set size.",
+                    [({}, usage.ru_maxrss * 1024)]))
+    samples.append(("process_cpu_seconds_total", "counter", "User and system CPU time.",
+                    [({}, usage.ru_utime + usage.ru_stime)]))
+    samples.append(("process_threads", "gauge", "Live Python threads.", [({}, threading.active_count())]))
+    return samples
+
+
+registry.add_collector(_process_metrics)
+
+
+def render():
+    return registry.render()
+
+
+def _before_request():
+    g._metrics_started = time.perf_counter()
+
+
+def _after_request(response):
+    started = g.pop("_metrics_started", None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or "unmatched"
+    HTTP_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if request.method in ("POST", "PUT") and request.content_length:
+        HTTP_UPLOAD_BYTES.observe(request.content_length, endpoint=endpoint)
+    return response
+
+
+def init_app(app):
+    """記錄每個請求的耗時、狀態碼與上傳大小；須在其他 before_request 之前呼叫。"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -1,19 +1,93 @@
 import requests
 import json
 import base64
+import binascii
+import hashlib
 import logging
 import os
 import re
-from typing import Any, Dict, Optional, Union
+import threading
+import time
+from functools import partial
+from urllib.parse import urlsplit
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
 
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+import db
+import image_hash
+import metrics
 import pet_model_config
+import server_timing
+import tracing
+from model_scheduler import scheduler
+from singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
 url = os.getenv("OLLAMA_URL", "http://192.168.50.11:11434/api/generate")
 
+# 分段編碼的區塊大小；必須是 3 的倍數，各段 base64 才能直接串接而不產生中間的 padding
+_B64_CHUNK_SIZE = 3 * 64 * 1024
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# 相同圖片 + 模型 + prompt 的並行分析只呼叫一次模型（雙擊、重送）
+_analysis_flight = SingleFlight()
+# 設為 1 時另以 MySQL 的認領紀錄跨 worker 合併，並在時間窗內共用已完成的結果
+_SINGLEFLIGHT_MYSQL = os.getenv("SINGLEFLIGHT_MYSQL", "0") == "1"
+_SINGLEFLIGHT_WINDOW = int(os.getenv("SINGLEFLIGHT_WINDOW_SECONDS", "60"))
+_SINGLEFLIGHT_LOCK_TIMEOUT = int(os.getenv("SINGLEFLIGHT_LOCK_TIMEOUT", "120"))
+# 等待其他 worker 的結果時，輪詢 analysis_results 的間隔
+_SINGLEFLIGHT_POLL_SECONDS = 0.5
+
+# 各 prompt 要求模型回傳的欄位，用於模型階梯的格式驗證
+PRODUCT_RESULT_KEYS = ("title", "summary")
+DIARY_RESULT_KEYS = ("title", "describe", "main_emotion")
+
+
+def ping(timeout: float = 2.0) -> None:
+    """Check that the Ollama server answers, without loading a model.
+
+    Raises:
+        requests.exceptions.RequestException: If the server is unreachable or
+            answers with an error status.
+    """
+    parts = urlsplit(url)
+    response = requests.get(f"{parts.scheme}://{parts.netloc}/api/tags", timeout=timeout)
+    response.raise_for_status()
+
+
+def _scheduler_metrics():
+    stats = scheduler.stats()
+    return [
+        ("model_scheduler_active", "gauge", "Model calls holding a scheduler slot.", [({}, stats["active"])]),
+        ("model_scheduler_queued", "gauge", "Model calls waiting for a scheduler slot.",
+         [({"priority": p}, n) for p, n in stats["queued"].items()]),
+        ("model_scheduler_wait_seconds_total", "counter", "Time spent waiting for a scheduler slot.",
+         [({"priority": p}, v) for p, v in stats["wait_seconds_total"].items()]),
+    ]
+
+
+metrics.registry.add_collector(_scheduler_metrics)
+
+
+# Ollama 回應中的計時欄位（奈秒）與 token 數
+_OLLAMA_TIMING_FIELDS = (
+    "total_duration", "load_duration", "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+)
+
+
+def _tag_ollama_timings(span: Any, response: requests.Response) -> None:
+    """Copy Ollama's own timing breakdown onto the attempt span."""
+    try:
+        body = response.json()
+    except ValueError:
+        return
+    if isinstance(body, dict):
+        for field in _OLLAMA_TIMING_FIELDS:
+            if field in body:
+                span.set_attribute(f"ollama.{field}", body[field])
+
 
 def _parse_model_response(response: requests.Response, parse_response: bool) -> Dict[str, Any]:
     """Parse the Ollama API response body.
@@ -49,40 +123,80 @@ def _parse_model_response(response: requests.Response, parse_response: bool) ->
     return parsed
 
 
-def _call_model_with_retry(data: Dict[str, Any], parse_response: bool = False) -> Optional[Dict[str, Any]]:
+def _call_model_with_retry(data: Union[Dict[str, Any], bytes, bytearray], parse_response: bool = False) -> Optional[Dict[str, Any]]:
     """Call the model API with retry logic for transient network failures.
 
     Args:
-        data: Request payload to send to the model API.
+        data: Request payload to send to the model API. Either a dict to be
+              JSON-encoded, or an already encoded JSON body (see
+              _build_image_payload), which is sent as-is on every attempt.
         parse_response: If True, parse the nested 'response' field as JSON
                         (used for image analysis endpoints).
 
     Returns:
         Parsed dict on success, None on network failure or unparseable response.
     """
+    attempts = []
+    payload_bytes = None
+    if isinstance(data, dict):
+        post_kwargs = {"json": data}
+    else:
+        post_kwargs = {"data": data, "headers": _JSON_HEADERS}
+        payload_bytes = len(data)
+        metrics.MODEL_REQUEST_BYTES.observe(payload_bytes)
+
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=1, max=2),
         retry=retry_if_exception_type(requests.exceptions.RequestException),
+        before_sleep=lambda _state: metrics.MODEL_RETRIES.inc(),
+        reraise=True,
     )
     def _make_request() -> requests.Response:
-        response = requests.post(url, json=data)
-        if response.status_code != 200:
-            raise requests.exceptions.RequestException(
-                f"Model API failed with status {response.status_code}: {response.text}"
-            )
+        attempts.append(None)
+        started = time.perf_counter()
+        outcome = "network_error"
+        with tracing.span("ollama.generate", tracing.CLIENT, **{
+            "ollama.attempt": len(attempts), "http.request_content_length": payload_bytes,
+        }) as span:
+            try:
+                response = requests.post(url, **post_kwargs)
+                outcome = "ok" if response.status_code == 200 else "http_error"
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.MODEL_ATTEMPT_DURATION.observe(elapsed, outcome=outcome)
+                server_timing.record_model_time(elapsed)
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code != 200:
+                raise requests.exceptions.RequestException(
+                    f"Model API failed with status {response.status_code}: {response.text}"
+                )
+            if span.recording:
+                _tag_ollama_timings(span, response)
         return response
 
     try:
         response = _make_request()
         return _parse_model_response(response, parse_response)
     except requests.exceptions.RequestException as e:
+        metrics.MODEL_FAILURES.inc(reason="request")
         logger.error("Model API request failed after retries: %s", e)
         return None
     except (json.JSONDecodeError, ValueError) as e:
+        metrics.MODEL_FAILURES.inc(reason="parse")
         logger.warning("Model API response parsing failed: %s", e)
         return None
 
+def _call_model_scheduled(data: Union[Dict[str, Any], bytes, bytearray], parse_response: bool = False,
+                          user_id: Optional[int] = None, priority: str = "product") -> Optional[Dict[str, Any]]:
+    """Call the model API once the scheduler grants a slot for this user and priority."""
+    with tracing.span("model.call", **{"model.priority": priority}) as span:
+        queued = time.perf_counter()
+        with scheduler.slot(user_id, priority):
+            span.set_attribute("model.queue_seconds", round(time.perf_counter() - queued, 4))
+            return _call_model_with_retry(data, parse_response=parse_response)
+
+
 def get_model_response(model: str, prompt: str) -> Optional[str]:
     """
     Get text response from the model with retry logic.
@@ -93,7 +207,7 @@ def get_model_response(model: str, prompt: str) -> Optional[str]:
         "stream": False
     }
 
-    result = _call_model_with_retry(data)
+    result = _call_model_scheduled(data)
     if result and 'response' in result:
         return result['response']
     return None
@@ -159,26 +273,272 @@ def _get_image_base64(image_source):
     return encode_image_to_base64(image_source)
 
 
-def get_model_response_by_image(model: str, image_source: Union[str, bytes, Any], prompt: Optional[str] = None) -> Optional[Dict[str, Any]]:
+def _source_size(image_source) -> Optional[int]:
+    """回傳圖片來源剩餘的位元組數，無法得知時回傳 None。"""
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        return memoryview(image_source).nbytes
+    if hasattr(image_source, "read"):
+        try:
+            pos = image_source.tell()
+            image_source.seek(0, os.SEEK_END)
+            end = image_source.tell()
+            image_source.seek(pos)
+        except (AttributeError, OSError, ValueError):
+            return None
+        return end - pos
+    return os.path.getsize(image_source)
+
+
+def _read_full(f, view) -> int:
+    """將檔案內容讀滿 view，回傳實際讀到的位元組數（EOF 時可能較少）。"""
+    readinto = getattr(f, "readinto", None)
+    filled = 0
+    while filled < len(view):
+        if readinto is not None:
+            n = readinto(view[filled:])
+        else:
+            data = f.read(len(view) - filled)
+            n = len(data)
+            view[filled:filled + n] = data
+        if not n:
+            break
+        filled += n
+    return filled
+
+
+def _iter_file_chunks(f):
+    """以同一塊重複使用的緩衝區分段讀取檔案。"""
+    buf = memoryview(bytearray(_B64_CHUNK_SIZE))
+    while True:
+        n = _read_full(f, buf)
+        if not n:
+            return
+        yield buf[:n]
+        if n < len(buf):
+            return
+
+
+def _iter_image_chunks(image_source):
+    """依來源型態（bytes、檔案物件、檔案路徑）分段產生圖片內容，不複製整份資料。"""
+    if isinstance(image_source, (bytes, bytearray, memoryview)):
+        view = memoryview(image_source)
+        for start in range(0, view.nbytes, _B64_CHUNK_SIZE):
+            yield view[start:start + _B64_CHUNK_SIZE]
+        return
+    if hasattr(image_source, "read"):
+        yield from _iter_file_chunks(image_source)
+        return
+    if not os.path.exists(image_source):
+        raise FileNotFoundError(f"找不到圖片: {image_source}")
+    with open(image_source, "rb") as image_file:
+        yield from _iter_file_chunks(image_file)
+
+
+def _payload_head(model: str, prompt: str) -> bytes:
+    """請求本文中 images 之前的部分。"""
+    head = json.dumps({"model": model, "prompt": prompt, "stream": False})[:-1].encode("ascii")
+    return head + b', "images": ["'
+
+
+def _build_image_payload(model: str, prompt: str, image_source: Union[str, bytes, Any]) -> bytearray:
+    """組出單張圖片的 /api/generate JSON 請求本文。"""
+    return _build_images_payload(model, prompt, [image_source])
+
+
+def _build_images_payload(model: str, prompt: str, image_sources: Sequence[Union[str, bytes, Any]]) -> bytearray:
+    """組出 /api/generate 的 JSON 請求本文，images 陣列依序放入每張圖片。
+
+    base64 逐段寫入預先配置好大小的 bytearray，省去 bytes → str → JSON str → bytes
+    的整份複製；同一份本文在重試時直接重複送出。
+    """
+    with tracing.span("model.encode_payload", **{"model.images": len(image_sources)}) as span:
+        body = _encode_images_payload(model, prompt, image_sources)
+        span.set_attribute("http.request_content_length", len(body))
+    return body
+
+
+def _encode_images_payload(model: str, prompt: str, image_sources: Sequence[Union[str, bytes, Any]]) -> bytearray:
+    head = _payload_head(model, prompt)
+    separator = b'", "'
+    tail = b'"]}'
+
+    sizes = [_source_size(source) for source in image_sources]
+    encoded_len = sum(4 * ((size + 2) // 3) for size in sizes if size is not None)
+    body = bytearray(len(head) + encoded_len + len(separator) * (len(image_sources) - 1) + len(tail))
+    body[:len(head)] = head
+    pos = len(head)
+    for i, image_source in enumerate(image_sources):
+        if i:
+            body[pos:pos + len(separator)] = separator
+            pos += len(separator)
+        for chunk in _iter_image_chunks(image_source):
+            encoded = binascii.b2a_base64(chunk, newline=False)
+            # 長度相同的切片指派是原地覆寫；來源比預估長時 bytearray 會自動延伸
+            body[pos:pos + len(encoded)] = encoded
+            pos += len(encoded)
+    body[pos:] = tail
+    return body
+
+
+def _replace_payload_model(body: bytearray, old_model: str, new_model: str, prompt: str) -> bytearray:
+    """換掉請求本文中的模型名稱，沿用已編碼的圖片而不必重新讀取來源。"""
+    old_head_len = len(_payload_head(old_model, prompt))
+    new_body = bytearray(_payload_head(new_model, prompt))
+    new_body += memoryview(body)[old_head_len:]
+    return new_body
+
+
+def _quality_issue(result: Any, required_keys: Sequence[str]) -> Optional[str]:
+    """回傳結果不合格的原因（empty / schema / quality），合格則回傳 None。"""
+    if not result:
+        return "empty"
+    if not isinstance(result, dict):
+        return "schema"
+    min_chars = getattr(pet_model_config, "cascade_min_chars", None) or {}
+    for key in required_keys:
+        value = result.get(key)
+        if not isinstance(value, str) or not value.strip():
+            return "schema"
+        # 模型照抄 prompt 中的格式範例
+        if value.strip() == "str" or len(value.strip()) < min_chars.get(key, 0):
+            return "quality"
+    return None
+
+
+class _CascadeStats:
+    """模型階梯各層的呼叫次數、命中（由該層回傳結果）次數、升級原因與延遲。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers = {}
+
+    def record(self, model: str, seconds: float, issue: Optional[str], served: bool) -> None:
+        metrics.MODEL_CASCADE_CALLS.inc(model=model, outcome="served" if served else issue)
+        metrics.MODEL_CASCADE_DURATION.observe(seconds, model=model)
+        with self._lock:
+            tier = self._tiers.setdefault(
+                model, {"calls": 0, "served": 0, "escalated": {}, "latency_seconds_total": 0.0}
+            )
+            tier["calls"] += 1
+            tier["latency_seconds_total"] += seconds
+            if served:
+                tier["served"] += 1
+            else:
+                tier["escalated"][issue] = tier["escalated"].get(issue, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                model: {**tier, "escalated": dict(tier["escalated"])}
+                for model, tier in self._tiers.items()
+            }
+
+
+_cascade_stats = _CascadeStats()
+
+
+def cascade_stats() -> Dict[str, Any]:
+    """回傳模型階梯各層的統計。"""
+    return _cascade_stats.snapshot()
+
+
+def _run_cascade(models: Sequence[str], prompt: str, body: bytearray, required_keys: Sequence[str],
+                 user_id: Optional[int], priority: str) -> Tuple[Any, str, Optional[str]]:
+    """依序嘗試各層模型，直到結果通過驗證；全部不合格時回傳最後一個非空結果。
+
+    回傳 (結果, 產生結果的模型, 該層的請求 key)；key 與 _analyze_image_payload 的精確快取相同，
+    只保留雜湊而不保留前一層的請求本文。
+    """
+    best = (None, models[0], None)
+    for tier, model in enumerate(models):
+        if tier:
+            body = _replace_payload_model(body, models[tier - 1], model, prompt)
+        started = time.perf_counter()
+        result = _analyze_image_payload(model, body, user_id, priority)
+        issue = _quality_issue(result, required_keys)
+        is_last = tier == len(models) - 1
+        _cascade_stats.record(model, time.perf_counter() - started, issue, issue is None or is_last)
+        if result is not None:
+            best = (result, model, hashlib.sha256(body).hexdigest())
+        if issue is None:
+            return best
+        if not is_last:
+            logger.info("Escalating image analysis from %s (%s)", model, issue)
+    return best
+
+
+def _call_model_across_workers(request_key: str, model: str, body: bytearray,
+                              user_id: Optional[int], priority: str) -> Optional[Dict[str, Any]]:
+    """跨 worker 合併相同請求：認領者呼叫模型並寫入結果，其餘 worker 輪詢 analysis_results。
+
+    認領與輪詢都是短查詢，排隊與呼叫模型期間不佔用 MySQL 連線；
+    等待超過 SINGLEFLIGHT_LOCK_TIMEOUT 仍無結果時直接呼叫模型。
+    """
+    deadline = time.monotonic() + _SINGLEFLIGHT_LOCK_TIMEOUT
+    while True:
+        cached = db.get_analysis_result(request_key, _SINGLEFLIGHT_WINDOW)
+        if cached is not None:
+            return cached
+        if db.claim_analysis(request_key, _SINGLEFLIGHT_LOCK_TIMEOUT):
+            break
+        if time.monotonic() >= deadline:
+            logger.warning("Analysis %s still claimed by another worker, calling model directly", request_key[:12])
+            return _call_model_scheduled(body, True, user_id, priority)
+        time.sleep(_SINGLEFLIGHT_POLL_SECONDS)
+    try:
+        result = _call_model_scheduled(body, True, user_id, priority)
+        if result is not None:
+            db.save_analysis_result(request_key, model, result)
+        return result
+    finally:
+        db.release_analysis_claim(request_key)
+
+
+def _analyze_image_payload(model: str, body: bytearray, user_id: Optional[int] = None,
+                           priority: str = "product") -> Optional[Dict[str, Any]]:
+    """送出圖片分析請求；相同本文（圖片 + 模型 + prompt）的並行請求共用同一次模型呼叫。"""
+    request_key = hashlib.sha256(body).hexdigest()
+    if _SINGLEFLIGHT_MYSQL:
+        call = partial(_call_model_across_workers, request_key, model, body, user_id, priority)
+    else:
+        call = partial(_call_model_scheduled, body, True, user_id, priority)
+    result, shared = _analysis_flight.do(request_key, call)
+    if shared and isinstance(result, dict):
+        return dict(result)
+    return result
+
+
+def get_model_response_by_image(model: Union[str, Sequence[str]], image_source: Union[str, bytes, Any],
+                                prompt: Optional[str] = None, user_id: Optional[int] = None,
+                                priority: str = "product",
+                                required_keys: Sequence[str] = PRODUCT_RESULT_KEYS,
+                                reuse_near_duplicates: bool = True) -> Optional[Dict[str, Any]]:
     """
     分析圖片，回傳 AI 產生的 JSON。prompt 預設為 product_prompt。
+    model 可為模型名稱，或由快到慢的模型清單（模型階梯）：結果缺少 required_keys
+    或未達品質門檻時才改用下一個模型。user_id 與 priority 交由 model_scheduler 做公平排程。
+    reuse_near_duplicates=False 時一律重新呼叫模型（例如換模型後重新分析）。
     
     Returns:
         - dict: 解析成功的 JSON 結果
         - None: API 呼叫失敗
         - dict: 包含錯誤資訊的結構化錯誤回應
     """
-    image_base64 = _get_image_base64(image_source)
+    models = [model] if isinstance(model, str) else list(model)
     prompt = prompt or pet_model_config.product_prompt
 
-    data = {
-        "model": model,
-        "prompt": prompt,
-        "images": [image_base64],
-        "stream": False
-    }
-
-    result = _call_model_with_retry(data, parse_response=True)
+    # 同一使用者近似重複（重拍、裁切、旋轉、重新壓縮）的圖片已有同一 prompt 的結果時直接沿用
+    hashes = image_hash.dhash_variants(image_source) if user_id is not None else None
+    prompt_sha256 = image_hash.prompt_digest(prompt)
+    if reuse_near_duplicates:
+        reused = image_hash.near_duplicates.lookup(hashes, prompt_sha256, user_id)
+        if reused is not None:
+            return reused
+
+    body = _build_image_payload(models[0], prompt, image_source)
+    result, answered_by, request_key = _run_cascade(models, prompt, body, required_keys, user_id, priority)
+    if hashes and _quality_issue(result, required_keys) is None:
+        image_hash.near_duplicates.add(hashes[0], request_key, answered_by, prompt_sha256, result, user_id)
     if not result:
         return None
     
@@ -188,7 +548,9 @@ def get_model_response_by_image(model: str, image_source: Union[str, bytes, Any]
     return {"title": "解析失敗", "describe": str(result)}
 
 
-def get_diary_response_by_image(model: str, image_source: Union[str, bytes, Any]) -> Optional[Dict[str, Any]]:
+def get_diary_response_by_image(model: Union[str, Sequence[str]], image_source: Union[str, bytes, Any],
+                                user_id: Optional[int] = None, priority: str = "diary",
+                                reuse_near_duplicates: bool = True) -> Optional[Dict[str, Any]]:
     """
     分析寵物圖片，使用 image_context_prompt，回傳 describe 與 main_emotion。
     """
@@ -202,5 +564,31 @@ MUST Text count limit is 300 words.
 **the output value language is Traditional Chinese**
 Return JSON format: {"title": "str", "describe": "str", "main_emotion": "str"}
 """
-    return get_model_response_by_image(model, image_source, prompt)
+    return get_model_response_by_image(
+        model, image_source, prompt, user_id=user_id, priority=priority, required_keys=DIARY_RESULT_KEYS,
+        reuse_near_duplicates=reuse_near_duplicates,
+    )
+
 
+def get_model_response_by_images(model: str, image_sources: Sequence[Union[str, bytes, Any]],
+                                 prompt: Optional[str] = None, user_id: Optional[int] = None,
+                                 priority: str = "product",
+                                 required_keys: Sequence[str] = PRODUCT_RESULT_KEYS) -> Optional[list]:
+    """
+    將多張商品圖片放進同一次請求的 images 陣列分析（模型需支援多圖輸入）。
+    prompt 預設為 product_batch_prompt，回傳與圖片順序相同的結果清單；
+    未通過 required_keys 檢查的項目為 None，由呼叫端改為逐張分析。
+    呼叫失敗或回傳的筆數與圖片數不符時回傳 None。
+    """
+    prompt = prompt or pet_model_config.product_batch_prompt
+    body = _build_images_payload(model, prompt, image_sources)
+    result = _analyze_image_payload(model, body, user_id, priority)
+    items = result.get("items") if isinstance(result, dict) else None
+    if not isinstance(items, list) or len(items) != len(image_sources):
+        logger.warning("Packed analysis of %d images returned an unusable result", len(image_sources))
+        return None
+    checked = [item if _quality_issue(item, required_keys) is None else None for item in items]
+    rejected = sum(item is None for item in checked)
+    if rejected:
+        logger.warning("Packed analysis: %d of %d items failed validation", rejected, len(items))
+    return checked
@@ -0,0 +1,112 @@
+"""
+模型呼叫排程：行程內的並行上限、優先等級與同等級內依使用者輪替（fair queuing）。
+
+單一使用者大量上傳商品照片時，其他使用者的日記分析仍能在下一個空出的名額取得執行權。
+
+排程只在同一個行程內有效：每個 web worker 與每個 CLI（例如 reanalyze.py）各有自己的 scheduler，
+送往 Ollama 的總並行數最多為 行程數 × MODEL_MAX_CONCURRENCY，優先等級也不會跨行程比較。
+多個行程共用同一台 Ollama 時，請依行程數調低 MODEL_MAX_CONCURRENCY。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# 優先等級，由高到低：互動式日記 > 商品分析 > 批次重新分析
+PRIORITIES = ("diary", "product", "batch")
+
+
+class _Ticket:
+    __slots__ = ("enqueued_at", "granted")
+
+    def __init__(self):
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class FairScheduler:
+    """限制同時進行的模型呼叫數，並依優先等級與使用者公平分配名額。"""
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._cond = threading.Condition()
+        self._active = 0
+        # 每個優先等級一個 {user_key: deque[_Ticket]}，OrderedDict 的順序即輪替順序
+        self._queues = {p: OrderedDict() for p in PRIORITIES}
+        self._granted = {p: 0 for p in PRIORITIES}
+        self._wait_total = {p: 0.0 for p in PRIORITIES}
+        self._wait_max = {p: 0.0 for p in PRIORITIES}
+
+    @contextmanager
+    def slot(self, user_id=None, priority="product"):
+        """取得一個執行名額，離開 with 區塊時釋放。"""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: {priority}")
+        self._acquire(user_id, priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self, user_id, priority):
+        ticket = _Ticket()
+        with self._cond:
+            self._queues[priority].setdefault(user_id, deque()).append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                self._cond.wait()
+            waited = time.monotonic() - ticket.enqueued_at
+            self._granted[priority] += 1
+            self._wait_total[priority] += waited
+            self._wait_max[priority] = max(self._wait_max[priority], waited)
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        """在名額內依優先等級、同等級內依使用者輪替發出執行權（呼叫者須持有 _cond）。"""
+        granted_any = False
+        while self._active < self.max_concurrency:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.granted = True
+            self._active += 1
+            granted_any = True
+        if granted_any:
+            self._cond.notify_all()
+
+    def _next_ticket(self):
+        for priority in PRIORITIES:
+            users = self._queues[priority]
+            if not users:
+                continue
+            user_key, tickets = next(iter(users.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                users.move_to_end(user_key)
+            else:
+                del users[user_key]
+            return ticket
+        return None
+
+    def stats(self):
+        """回傳目前的排隊深度、進行中數量與各等級等待時間統計。"""
+        with self._cond:
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "queued": {
+                    p: sum(len(t) for t in self._queues[p].values()) for p in PRIORITIES
+                },
+                "granted": dict(self._granted),
+                "wait_seconds_total": dict(self._wait_total),
+                "wait_seconds_max": dict(self._wait_max),
+            }
+
+
+# 每個行程一個；MODEL_MAX_CONCURRENCY 是單一行程的上限
+scheduler = FairScheduler(os.getenv("MODEL_MAX_CONCURRENCY", "2"))
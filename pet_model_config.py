@@ -1,6 +1,20 @@
 pet_model_name = "qwen3-vl:8b"
 # pet_model_name = "gemma3:27b"
 
+# 模型階梯：由快到慢依序嘗試，前一層的輸出為空、缺欄位或品質不足時才升級到下一層。
+# 空清單表示只使用 pet_model_name。
+pet_model_cascade = []
+# pet_model_cascade = ["qwen3-vl:4b", "qwen3-vl:8b", "gemma3:27b"]
+
+# 支援在同一次請求的 images 陣列放入多張圖片的模型（批次分析時可合併送出）
+multi_image_models = ["qwen3-vl:8b", "qwen3-vl:4b", "gemma3:27b"]
+
+# 品質門檻：欄位去除空白後的最少字數，低於此值視為品質不足
+cascade_min_chars = {
+    "summary": 20,
+    "describe": 20,
+}
+
 product_prompt = """
 請取得商品 title name 和 summary，內容使用繁體中文，如果為圖片擷取的文字，與圖片相同
 
@@ -26,6 +40,27 @@ Return JSON format:
 ```
 """
 
+product_batch_prompt = """
+每張圖片各是一個商品，請依圖片順序取得每個商品的 title name 和 summary，內容使用繁體中文，如果為圖片擷取的文字，與圖片相同
+
+**summary requirement **
+MUST Text count limit is 300 words
+Include main description and 5 features point
+
+**the output value language is Traditional	Chinese**
+Return JSON format, items 的數量與順序必須和圖片相同:
+```
+{
+"items": [
+{
+"title": "str",
+"summary": "str"
+}
+]
+}
+```
+"""
+
 image_context_prompt = """
 Please describe  mind and emotions from the image
 Animal  include dog, cat or others
@@ -0,0 +1,282 @@
+"""
+單一請求的取樣分析，輸出 flame graph 工具可直接讀取的 folded stacks。
+
+設定 PROFILE_TOKEN 後，帶 `X-Profile: <token>` 標頭的請求會在
+背景執行緒每 PROFILE_INTERVAL 秒取樣一次該請求執行緒的呼叫堆疊，請求結束時寫出：
+    <id>.wall.folded  權重為經過的微秒，包含等待 MySQL、Ollama 的時間
+    <id>.cpu.folded   權重為該執行緒實際使用的 CPU 微秒
+每行格式為 `frame;frame;frame 權重`，可直接交給 flamegraph.pl、inferno 或 speedscope。
+檔案寫在 PROFILE_DIR，只保留最新 PROFILE_KEEP 組；回應標頭 X-Profile-Id 為檔名前綴，
+可由 /debug/profiles/<檔名> 下載。未設定 PROFILE_TOKEN 時完全不啟用。
+token 只接受標頭，不接受網址參數，以免寫進存取 log、proxy log 與 Referer。
+
+另有常駐的 SamplingProfiler：每個 worker 在第一個請求時啟動一條背景執行緒，每
+PROFILE_SAMPLER_INTERVAL 秒取樣所有執行緒一次，依分鐘彙整、保留 PROFILE_SAMPLER_RETENTION 秒。
+wall view 只計入正在處理請求的執行緒；cpu view 以 /proc 的每執行緒 CPU 時間為權重，
+因此閒置等待連線的執行緒不會出現。/debug/profile 輸出最近一段時間的彙整（同樣需要 token）。
+"""
+import hmac
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+# 0 表示停用常駐取樣
+SAMPLER_INTERVAL = float(os.getenv("PROFILE_SAMPLER_INTERVAL", "0.1"))
+SAMPLER_RETENTION = int(os.getenv("PROFILE_SAMPLER_RETENTION", "1800"))
+_WINDOW_SECONDS = 60
+
+VIEWS = ("wall", "cpu")
+_FILE_RE = re.compile(r"^[\w.-]+\.(wall|cpu)\.folded$")
+
+
+def frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+def folded_stack(frame):
+    """由最外層到最內層以 ; 串接的堆疊字串。"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def _cpu_clock(thread_id):
+    try:
+        return time.pthread_getcpuclockid(thread_id)
+    except (AttributeError, OSError):  # 非 POSIX
+        return None
+
+
+class RequestProfile:
+    """在背景執行緒取樣指定執行緒的堆疊，累積 wall 與 CPU 權重（微秒）。
+
+    目標執行緒須在 stop() 之前持續存在；通常由該執行緒自己呼叫 start() 與 stop()。
+    """
+
+    def __init__(self, thread_id, interval=INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.views = {view: Counter() for view in VIEWS}
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        clock = _cpu_clock(self.thread_id)
+        last_wall = time.perf_counter()
+        last_cpu = time.clock_gettime(clock) if clock is not None else None
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            cpu = time.clock_gettime(clock) if clock is not None else None
+            if frame is not None:
+                stack = folded_stack(frame)
+                self.views["wall"][stack] += round((now - last_wall) * 1e6)
+                if cpu is not None:
+                    self.views["cpu"][stack] += round((cpu - last_cpu) * 1e6)
+                self.samples += 1
+            del frame
+            last_wall, last_cpu = now, cpu
+
+
+def _thread_cpu_ns(native_id):
+    """該執行緒累計的 CPU 奈秒；無法取得（非 Linux、執行緒已結束）時回傳 None。"""
+    try:
+        with open(f"/proc/self/task/{native_id}/schedstat") as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SamplingProfiler:
+    """常駐的低頻取樣，依分鐘彙整所有執行緒的 folded stacks（權重為微秒）。"""
+
+    def __init__(self, interval=SAMPLER_INTERVAL, retention=SAMPLER_RETENTION, clock=time.time):
+        self.interval = interval
+        self.retention = retention
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._requests = set()
+        self._cpu_seen = {}
+        self._last_sample = None
+        self._thread = None
+        self._pid = None
+
+    def ensure_started(self):
+        """啟動背景執行緒；fork 後的子行程會各自重新啟動。"""
+        if self.interval <= 0 or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+
+    def request_started(self, thread_id):
+        self._requests.add(thread_id)
+
+    def request_finished(self, thread_id):
+        self._requests.discard(thread_id)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+
+    def sample(self):
+        """取樣一次所有執行緒（不含呼叫者自己）。"""
+        own = threading.get_ident()
+        native_ids = {t.ident: t.native_id for t in threading.enumerate()}
+        now = time.perf_counter()
+        elapsed_us = round((now - self._last_sample) * 1e6) if self._last_sample is not None else 0
+        self._last_sample = now
+        wall, cpu, cpu_seen = Counter(), Counter(), {}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = None
+            if thread_id in self._requests and elapsed_us:
+                stack = folded_stack(frame)
+                wall[stack] += elapsed_us
+            cpu_ns = _thread_cpu_ns(native_ids.get(thread_id))
+            if cpu_ns is not None:
+                cpu_seen[thread_id] = cpu_ns
+                previous = self._cpu_seen.get(thread_id)
+                if previous is not None and cpu_ns > previous:
+                    cpu[stack or folded_stack(frame)] += (cpu_ns - previous) // 1000
+        del frame
+        self._cpu_seen = cpu_seen
+        self._add(wall, cpu)
+
+    def _add(self, wall, cpu):
+        now = self._clock()
+        window = int(now // _WINDOW_SECONDS * _WINDOW_SECONDS)
+        with self._lock:
+            views = self._windows.get(window)
+            if views is None:
+                views = self._windows[window] = {view: Counter() for view in VIEWS}
+                for expired in [w for w in self._windows if w + _WINDOW_SECONDS < now - self.retention]:
+                    del self._windows[expired]
+            views["wall"].update(wall)
+            views["cpu"].update(cpu)
+
+    def folded(self, view, seconds=600):
+        """最近 seconds 秒（以分鐘為單位取整）內彙整的 Counter。"""
+        since = self._clock() - seconds
+        total = Counter()
+        with self._lock:
+            for window, views in self._windows.items():
+                if window + _WINDOW_SECONDS > since:
+                    total.update(views[view])
+        return total
+
+
+sampler = SamplingProfiler()
+
+
+def format_folded(counts):
+    return "".join(f"{stack} {weight}\n" for stack, weight in counts.most_common() if weight > 0)
+
+
+def write_folded(path, counts):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(format_folded(counts))
+
+
+class ProfileStore:
+    """固定數量的 profile 檔案；超過 keep 組時刪除最舊的。"""
+
+    def __init__(self, directory=PROFILE_DIR, keep=KEEP):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def save(self, profile, label):
+        """寫出各 view 的 folded 檔，回傳 profile id。"""
+        label = re.sub(r"[^\w-]", "_", label)
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{label}-{secrets.token_hex(3)}"
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            for view, counts in profile.views.items():
+                write_folded(os.path.join(self.directory, f"{profile_id}.{view}.folded"), counts)
+            self._prune()
+        return profile_id
+
+    def _prune(self):
+        groups = {}
+        for name in os.listdir(self.directory):
+            if _FILE_RE.match(name):
+                path = os.path.join(self.directory, name)
+                profile_id = name.rsplit(".", 2)[0]
+                groups[profile_id] = max(groups.get(profile_id, 0), os.path.getmtime(path))
+        for profile_id in sorted(groups, key=groups.get)[:max(len(groups) - self.keep, 0)]:
+            for view in VIEWS:
+                try:
+                    os.remove(os.path.join(self.directory, f"{profile_id}.{view}.folded"))
+                except FileNotFoundError:
+                    pass
+
+    def path(self, name):
+        """回傳可下載的檔案路徑；名稱不合法或不存在時回傳 None。"""
+        if not _FILE_RE.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+store = ProfileStore()
+
+
+def authorized(supplied):
+    return bool(TOKEN and supplied) and hmac.compare_digest(supplied.encode(), TOKEN.encode())
+
+
+def _before_request():
+    sampler.ensure_started()
+    sampler.request_started(threading.get_ident())
+    if authorized(request.headers.get("X-Profile")):
+        g._profile = RequestProfile(threading.get_ident()).start()
+
+
+def _after_request(response):
+    profile = g.pop("_profile", None)
+    if profile is not None:
+        profile.stop()
+        response.headers["X-Profile-Id"] = store.save(profile, request.endpoint or "unmatched")
+    return response
+
+
+def _teardown_request(exc):
+    sampler.request_finished(threading.get_ident())
+    profile = g.pop("_profile", None)
+    if profile is not None:  # after_request 未執行（例外中斷），只停止取樣
+        profile.stop()
+
+
+def init_app(app):
+    """啟用常駐取樣並依 X-Profile 標頭對請求取樣；須在其他 before_request 之前呼叫，才能涵蓋整個請求。"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
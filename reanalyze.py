@@ -0,0 +1,227 @@
+"""
+重新分析既有日記：更換 image_context_prompt 或 pet_model_name 後，重新產生 describe_text 與 main_emotion。
+
+    python reanalyze.py [--workers 1] [--batch-size 50] [--checkpoint .reanalyze-checkpoint.json]
+    python reanalyze.py --retry-failed
+
+日記依 id 順序以 server-side cursor 串流讀出，交給有上限的 worker pool 呼叫模型，
+結果以 executemany 批次寫回。每次寫回後更新 checkpoint，中斷後再次執行會從 checkpoint 接續；
+--restart 則從頭開始。分析失敗的 id 記在 checkpoint 的 failed，checkpoint 會越過它們，
+之後以 --retry-failed 只重試這些日記（仍失敗的會留在清單中）。
+
+本程式是獨立行程，有自己的 model_scheduler：batch 優先等級只在本行程內有效，
+不會讓出名額給 web 的線上請求，每個 worker 都會直接增加 Ollama 的負載。
+因此 --workers 預設為 1；web 服務運作中時請維持低並行數，或在離峰時段執行。
+"""
+import argparse
+import base64
+import binascii
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import db
+import model_connector
+import pet_model_config
+
+logger = logging.getLogger("reanalyze")
+
+
+def decode_image(image_base64):
+    """將儲存的 data URL（或純 base64）解碼為圖片 bytes。"""
+    if image_base64.startswith("data:"):
+        image_base64 = image_base64.split(",", 1)[1]
+    return base64.b64decode(image_base64)
+
+
+def load_checkpoint(path):
+    """讀取 checkpoint，不存在時回傳初始狀態。"""
+    if not os.path.exists(path):
+        return {"last_id": 0, "updated": 0, "failed": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    """先寫暫存檔再置換，避免中斷時留下寫一半的 checkpoint。"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _analyze_row(models, row):
+    """分析一筆日記，回傳 (diary_id, result)；圖片無法解碼或模型失敗時 result 為 None。"""
+    try:
+        image = decode_image(row["image_base64"])
+    except (binascii.Error, ValueError) as e:
+        logger.warning("Diary %s: cannot decode image: %s", row["id"], e)
+        return row["id"], None
+    result = model_connector.get_diary_response_by_image(
+        models, image, user_id=row.get("user_id"), priority="batch", reuse_near_duplicates=False
+    )
+    if not result or result.get("error"):
+        return row["id"], None
+    return row["id"], result
+
+
+# 重試時只需要這些欄位
+_RETRY_FIELDS = ("id", "user_id", "image_base64")
+
+
+class Reanalyzer:
+    """串流讀取、並行分析、批次寫回並維護 checkpoint。"""
+
+    def __init__(self, models, workers, batch_size, checkpoint_path, state):
+        self.models = models
+        self.workers = workers
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.state = state
+        self._order = deque()  # 已送出、依 id 排序
+        self._submitted = {}  # future -> diary id
+        self._advance = True
+        self._done = set()
+        self._updates = []
+        self._update_ids = []
+        self._processed = 0
+        self._started = time.monotonic()
+        self._total = 0
+
+    def run(self, user_id=None, limit=None):
+        after_id = self.state["last_id"]
+        self._total = db.count_diaries_with_image(after_id, user_id)
+        if limit is not None:
+            self._total = min(self._total, limit)
+        logger.info("Re-analyzing %d diaries after id %d with %s", self._total, after_id, self.models)
+        # 中途出錯時也寫回已完成的結果並儲存 checkpoint
+        try:
+            self._process(db.iter_diaries_with_image(after_id, user_id), limit, advance=True)
+        finally:
+            self._finish()
+        return self.state
+
+    def retry_failed(self, limit=None):
+        """只重試 checkpoint 中失敗的日記；不移動 last_id，仍失敗的 id 會重新記回 failed。"""
+        failed, self.state["failed"] = self.state["failed"], []
+        if limit is not None:
+            failed, rest = failed[:limit], failed[limit:]
+            self.state["failed"].extend(rest)
+        self._total = len(failed)
+        logger.info("Retrying %d failed diaries with %s", self._total, self.models)
+        rows = (db.get_diary(diary_id, fields=_RETRY_FIELDS) for diary_id in failed)
+        try:
+            self._process((row for row in rows if row and row["image_base64"]), None, advance=False)
+        finally:
+            self._finish()
+        return self.state
+
+    def _process(self, rows, limit, advance):
+        """advance=True 時依 id 順序推進 checkpoint 的 last_id。"""
+        self._advance = advance
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                for submitted, row in enumerate(rows):
+                    if limit is not None and submitted >= limit:
+                        break
+                    # 背壓：最多只讓 2 倍 worker 數的圖片留在記憶體中
+                    while len(in_flight) >= self.workers * 2:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        self._collect(finished)
+                    if advance:
+                        self._order.append(row["id"])
+                    future = executor.submit(_analyze_row, self.models, row)
+                    self._submitted[future] = row["id"]
+                    in_flight.add(future)
+            finally:
+                # 讀取日記中途失敗時，已送出的分析仍收回，交給 _finish 寫回
+                while in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._collect(finished)
+
+    def _finish(self):
+        self._flush()
+        logger.info(
+            "Done: %d updated, %d failed in total, %.1fs",
+            self.state["updated"], len(self.state["failed"]), time.monotonic() - self._started,
+        )
+
+    def _collect(self, futures):
+        for future in futures:
+            diary_id = self._submitted.pop(future)
+            try:
+                _, result = future.result()
+            except Exception:
+                # 模型錯誤以外的例外（DB、排程）只讓這一筆失敗，不中斷整個執行
+                logger.exception("Diary %s: analysis failed", diary_id)
+                result = None
+            self._processed += 1
+            if result is None:
+                self.state["failed"].append(diary_id)
+                if self._advance:
+                    self._done.add(diary_id)
+            else:
+                self._updates.append((result.get("describe", ""), result.get("main_emotion", ""), diary_id))
+                self._update_ids.append(diary_id)
+        if len(self._updates) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        """寫回累積的結果，並把 checkpoint 推進到連續完成的最大 id。"""
+        db.update_diary_analyses(self._updates)
+        self.state["updated"] += len(self._updates)
+        if self._advance:
+            self._done.update(self._update_ids)
+        self._updates, self._update_ids = [], []
+        while self._order and self._order[0] in self._done:
+            self.state["last_id"] = self._order.popleft()
+            self._done.discard(self.state["last_id"])
+        save_checkpoint(self.checkpoint_path, self.state)
+        self._report()
+
+    def _report(self):
+        elapsed = time.monotonic() - self._started
+        rate = self._processed / elapsed if elapsed > 0 else 0.0
+        remaining = max(self._total - self._processed, 0)
+        eta = remaining / rate if rate > 0 else float("inf")
+        logger.info(
+            "%d/%d processed, %.2f rows/s, ETA %s",
+            self._processed, self._total, rate,
+            time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "?",
+        )
+
+
+def _default_models():
+    cascade = getattr(pet_model_config, "pet_model_cascade", None)
+    return list(cascade) if cascade else pet_model_config.pet_model_name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="重新分析既有日記的 describe_text 與 main_emotion")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="同時分析的日記數；與 web 服務的名額分開計算，會直接加在 Ollama 上")
+    parser.add_argument("--batch-size", type=int, default=50, help="每批寫回的筆數")
+    parser.add_argument("--checkpoint", default=".reanalyze-checkpoint.json")
+    parser.add_argument("--restart", action="store_true", help="忽略既有 checkpoint，從頭開始")
+    parser.add_argument("--model", action="append", help="指定模型（可重複，依序為模型階梯）")
+    parser.add_argument("--user-id", type=int, help="只處理此使用者的日記")
+    parser.add_argument("--limit", type=int, help="最多處理幾筆")
+    parser.add_argument("--retry-failed", action="store_true", help="只重試 checkpoint 中記錄為失敗的日記")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    state = {"last_id": 0, "updated": 0, "failed": []} if args.restart else load_checkpoint(args.checkpoint)
+    models = args.model or _default_models()
+    reanalyzer = Reanalyzer(models, max(1, args.workers), max(1, args.batch_size), args.checkpoint, state)
+    if args.retry_failed:
+        reanalyzer.retry_failed(limit=args.limit)
+    else:
+        reanalyzer.run(user_id=args.user_id, limit=args.limit)
+
+
+if __name__ == "__main__":
+    main()
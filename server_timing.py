@@ -0,0 +1,134 @@
+"""
+每個請求的 DB / 模型耗時統計：Server-Timing 標頭、查詢預算與 N+1 偵測。
+
+db.py 的每個 SQL 陳述式與連線、model_connector 的每次 Ollama 呼叫都記到目前請求的
+RequestStats（contextvar；批次分析以 copy_context 傳入的 worker 也記到同一個物件）。
+回應加上 `Server-Timing: db;dur=…;desc="N queries", model;dur=…, app;dur=…`，
+瀏覽器 DevTools 的 Timing 分頁可直接看到。
+
+超過 QUERY_BUDGET_COUNT 個查詢或 QUERY_BUDGET_DB_MS 毫秒 DB 時間時記錄 warning；
+同一個陳述式（參數化後的 SQL）在一個請求中執行 QUERY_REPEAT_THRESHOLD 次以上時
+視為可能的 N+1 並記錄 warning。
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+BUDGET_COUNT = int(os.getenv("QUERY_BUDGET_COUNT", "20"))
+BUDGET_DB_MS = float(os.getenv("QUERY_BUDGET_DB_MS", "250"))
+REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    """單一請求累計的查詢數、DB 時間與模型時間（秒）。"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.model_seconds = 0.0
+        self.statements = Counter()
+        self._lock = threading.Lock()
+
+    def add_query(self, statement, seconds):
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += seconds
+            self.statements[statement] += 1
+
+    def add_db_time(self, seconds):
+        with self._lock:
+            self.db_seconds += seconds
+
+    def add_model_time(self, seconds):
+        with self._lock:
+            self.model_seconds += seconds
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """回傳執行次數達 threshold 的 (statement, 次數)。"""
+        return [(s, n) for s, n in self.statements.most_common() if n >= threshold]
+
+    def header(self):
+        total = time.perf_counter() - self.started
+        # 批次分析並行呼叫模型時 model 可能超過總時間，app 以 0 為下限
+        app_seconds = max(total - self.db_seconds - self.model_seconds, 0.0)
+        noun = "query" if self.queries == 1 else "queries"
+        return (
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} {noun}", '
+            f"model;dur={self.model_seconds * 1000:.1f}, app;dur={app_seconds * 1000:.1f}"
+        )
+
+
+def current():
+    """目前請求的 RequestStats；不在請求中（CLI、背景工作）時回傳 None。"""
+    return _current.get()
+
+
+def record_query(statement, seconds):
+    stats = _current.get()
+    if stats is not None:
+        stats.add_query(statement, seconds)
+
+
+def record_db_time(seconds):
+    stats = _current.get()
+    if stats is not None:
+        stats.add_db_time(seconds)
+
+
+def record_model_time(seconds):
+    stats = _current.get()
+    if stats is not None:
+        stats.add_model_time(seconds)
+
+
+def _check_budget(stats, endpoint):
+    db_ms = stats.db_seconds * 1000
+    if stats.queries > BUDGET_COUNT or db_ms > BUDGET_DB_MS:
+        logger.warning(
+            "%s %s exceeded query budget: %d queries, %.1f ms DB (budget %d queries, %.0f ms)",
+            request.method, endpoint, stats.queries, db_ms, BUDGET_COUNT, BUDGET_DB_MS,
+        )
+    for statement, count in stats.repeated():
+        logger.warning(
+            "Possible N+1 in %s %s: %d x %s", request.method, endpoint, count, " ".join(statement.split())[:200]
+        )
+
+
+def _before_request():
+    stats = RequestStats()
+    g._request_stats, g._request_stats_token = stats, _current.set(stats)
+
+
+def _after_request(response):
+    stats = g.get("_request_stats")
+    if stats is not None:
+        response.headers.add("Server-Timing", stats.header())
+        _check_budget(stats, request.endpoint or "unmatched")
+    return response
+
+
+def _teardown_request(exc):
+    g.pop("_request_stats", None)
+    token = g.pop("_request_stats_token", None)
+    if token is not None:
+        try:
+            _current.reset(token)
+        except ValueError:  # 在不同的 context 中結束
+            pass
+
+
+def init_app(app):
+    """為每個請求統計 DB / 模型耗時；須在其他 before_request 之前呼叫。"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
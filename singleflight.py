@@ -0,0 +1,57 @@
+"""
+In-flight 請求合併（singleflight）：相同 key 的並行呼叫只真正執行一次。
+"""
+import threading
+
+
+class _Call:
+    """一次進行中的呼叫，供後到的執行緒等待其結果。"""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同一 process 內跨執行緒的 singleflight。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """執行 fn() 並回傳 (result, shared)。
+
+        若已有相同 key 的呼叫進行中，則不再執行 fn，而是等待該呼叫完成並回傳其結果，
+        shared 為 True；fn 拋出的例外也會同樣傳給所有等待者。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """目前進行中的 key 數量。"""
+        with self._lock:
+            return len(self._calls)
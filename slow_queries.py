@@ -0,0 +1,252 @@
+"""
+慢查詢紀錄與報表。
+
+db.py 的每個 SQL 陳述式執行超過 SLOW_QUERY_MS 毫秒時，記錄正規化的 SQL、參數形狀、
+回傳／影響列數，以及 `EXPLAIN FORMAT=JSON` 的執行計畫（同一陳述式每
+SLOW_QUERY_EXPLAIN_INTERVAL 秒最多 EXPLAIN 一次），以 JSONL 附加到 SLOW_QUERY_LOG；
+檔案超過 SLOW_QUERY_LOG_MAX_BYTES 時輪替為 .1，因此最多佔用兩倍大小。
+
+    python slow_queries.py report [--file slow_queries.jsonl] [--limit 20] [--mysql]
+
+依總耗時排序列出陳述式，並標出全表掃描（access_type ALL）、filesort 與暫存表；
+--mysql 另外讀取 MySQL 自己的 mysql.slow_log（需 slow_query_log=ON、log_output=TABLE）。
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from pymysql.cursors import DictCursor
+
+logger = logging.getLogger(__name__)
+
+THRESHOLD_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+LOG_PATH = os.getenv("SLOW_QUERY_LOG", "slow_queries.jsonl")
+LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+
+# MySQL 可 EXPLAIN 的陳述式
+_EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "INSERT", "REPLACE")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)", re.IGNORECASE)
+_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize(statement):
+    """將 SQL 正規化為指紋：壓縮空白、常值與 %s 換成 ?、IN 清單合併為 IN (...)。"""
+    sql = " ".join(statement.split())
+    sql = _LITERAL_RE.sub("?", sql.replace("%s", "?"))
+    return _IN_LIST_RE.sub("IN (...)", sql)
+
+
+def params_shape(args):
+    """參數的型別摘要，例如 "int, str x3, bytes(1048576)"；不記錄實際值。"""
+    if args is None:
+        return ""
+    if isinstance(args, dict):
+        return ", ".join(f"{k}:{type(v).__name__}" for k, v in args.items())
+    if not isinstance(args, (list, tuple)):
+        args = (args,)
+    parts = []
+    for value in args:
+        name = type(value).__name__
+        if isinstance(value, (bytes, bytearray, str)) and len(value) > 1024:
+            name = f"{name}({len(value)})"
+        if parts and parts[-1][0] == name:
+            parts[-1][1] += 1
+        else:
+            parts.append([name, 1])
+    return ", ".join(name if n == 1 else f"{name} x{n}" for name, n in parts)
+
+
+def summarize_plan(plan):
+    """從 EXPLAIN FORMAT=JSON 取出每個資料表的存取方式與索引，並標記全表掃描、filesort、暫存表。"""
+    summary = {"tables": [], "full_scan": [], "filesort": False, "temporary": False, "rows_examined": 0}
+
+    def walk(node):
+        if isinstance(node, dict):
+            if node.get("using_filesort"):
+                summary["filesort"] = True
+            if node.get("using_temporary_table"):
+                summary["temporary"] = True
+            table = node.get("table")
+            if isinstance(table, dict) and "table_name" in table:
+                rows = int(table.get("rows_examined_per_scan") or 0)
+                summary["tables"].append({
+                    "table": table["table_name"], "access_type": table.get("access_type"),
+                    "key": table.get("key"), "rows_examined_per_scan": rows,
+                })
+                summary["rows_examined"] += rows
+                if table.get("access_type") == "ALL":
+                    summary["full_scan"].append(table["table_name"])
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(plan)
+    return summary
+
+
+class SlowQueryLog:
+    """附加寫入 JSONL 並依大小輪替；記錄每個指紋上次 EXPLAIN 的時間。"""
+
+    def __init__(self, path=LOG_PATH, max_bytes=LOG_MAX_BYTES, explain_interval=EXPLAIN_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.explain_interval = explain_interval
+        self._lock = threading.Lock()
+        self._explained = {}
+
+    def should_explain(self, fingerprint):
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained.get(fingerprint)
+            if last is not None and now - last < self.explain_interval:
+                return False
+            if len(self._explained) > 1000:
+                self._explained.clear()
+            self._explained[fingerprint] = now
+            return True
+
+    def write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            try:
+                if os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+            except FileNotFoundError:
+                pass
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+log = SlowQueryLog()
+
+
+def _explain(connection, statement, args):
+    with connection.cursor(DictCursor) as cur:
+        cur.execute("EXPLAIN FORMAT=JSON " + statement, args)
+        row = cur.fetchone()
+    return json.loads(next(iter(row.values())))
+
+
+def capture(connection, statement, args, seconds, rows, function, explain=True):
+    """記錄一個慢查詢；explain=False（例如 server-side cursor 尚有未讀結果）時不 EXPLAIN。失敗只記 log。"""
+    fingerprint = normalize(statement)
+    entry = {
+        "ts": time.time(), "function": function, "statement": fingerprint, "params": params_shape(args),
+        "seconds": round(seconds, 6), "rows": rows, "plan": None,
+    }
+    try:
+        if explain and fingerprint.lstrip("( ").upper().startswith(_EXPLAINABLE) and log.should_explain(fingerprint):
+            entry["plan"] = summarize_plan(_explain(connection, statement, args))
+        log.write(entry)
+    except Exception as e:  # 紀錄失敗不影響原本的查詢
+        logger.warning("Slow query capture failed: %s", e)
+
+
+# ========== Report ==========
+
+
+def read_log(path):
+    """讀取紀錄（含輪替的 .1），略過損毀的行。"""
+    entries = []
+    for candidate in (path + ".1", path):
+        if not os.path.exists(candidate):
+            continue
+        with open(candidate, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    return entries
+
+
+def _mysql_slow_log(limit=10000):
+    """mysql.slow_log 的紀錄，轉成與 read_log 相同的格式。"""
+    import db
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT start_time, query_time, rows_sent, rows_examined, CONVERT(sql_text USING utf8mb4) AS sql_text "
+                "FROM mysql.slow_log ORDER BY start_time DESC LIMIT %s",
+                (limit,),
+            )
+            rows = cur.fetchall()
+    return [{
+        "ts": str(r["start_time"]), "function": "mysql.slow_log", "statement": normalize(r["sql_text"]),
+        "params": "", "seconds": r["query_time"].total_seconds() if hasattr(r["query_time"], "total_seconds")
+        else float(r["query_time"]), "rows": r["rows_sent"], "rows_examined": r["rows_examined"], "plan": None,
+    } for r in rows]
+
+
+def aggregate(entries):
+    """依指紋彙整，回傳依總耗時遞減排序的清單。"""
+    groups = {}
+    for e in entries:
+        g = groups.setdefault(e["statement"], {
+            "statement": e["statement"], "functions": set(), "count": 0, "total": 0.0, "max": 0.0,
+            "params": e.get("params", ""), "plan": None, "rows_examined": None,
+        })
+        g["functions"].add(e.get("function") or "?")
+        g["count"] += 1
+        g["total"] += e["seconds"]
+        g["max"] = max(g["max"], e["seconds"])
+        if e.get("plan"):
+            g["plan"] = e["plan"]
+        examined = e.get("rows_examined")
+        if examined is None and e.get("plan"):
+            examined = e["plan"].get("rows_examined")
+        if examined is not None:
+            g["rows_examined"] = max(g["rows_examined"] or 0, examined)
+    return sorted(groups.values(), key=lambda g: g["total"], reverse=True)
+
+
+def _flags(plan):
+    if not plan:
+        return ""
+    flags = [f"FULL SCAN {t}" for t in plan["full_scan"]]
+    if plan["filesort"]:
+        flags.append("filesort")
+    if plan["temporary"]:
+        flags.append("temporary")
+    return ", ".join(flags)
+
+
+def format_report(groups, limit=20):
+    lines = [f"{'total s':>9} {'count':>6} {'avg ms':>8} {'max ms':>8} {'examined':>9}  flags / function / statement"]
+    for g in groups[:limit]:
+        examined = "" if g["rows_examined"] is None else str(g["rows_examined"])
+        lines.append(
+            f"{g['total']:>9.3f} {g['count']:>6} {g['total'] / g['count'] * 1000:>8.1f} {g['max'] * 1000:>8.1f} "
+            f"{examined:>9}  {_flags(g['plan']) or '-'} | {', '.join(sorted(g['functions']))}"
+        )
+        lines.append(f"{'':>45}{g['statement'][:300]}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="依總耗時列出慢查詢與其執行計畫")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--file", default=LOG_PATH)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--mysql", action="store_true", help="一併讀取 mysql.slow_log")
+    args = parser.parse_args(argv)
+    entries = read_log(args.file)
+    if args.mysql:
+        entries += _mysql_slow_log()
+    if not entries:
+        print(f"No slow queries recorded in {args.file}")
+        return 0
+    print(format_report(aggregate(entries), args.limit))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
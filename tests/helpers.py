@@ -1,6 +1,9 @@
-"""Shared test helpers for db mock connection setup."""
+"""Shared test helpers for db mock connection setup and query budgets."""
+import re
 from unittest.mock import MagicMock
 
+import db
+
 
 def make_conn(fetchone=None, fetchall=None, lastrowid=1):
     """Build a mock PyMySQL connection + cursor pair for db unit tests."""
@@ -15,3 +18,43 @@ def make_conn(fetchone=None, fetchall=None, lastrowid=1):
     conn.__enter__ = MagicMock(return_value=conn)
     conn.__exit__ = MagicMock(return_value=False)
     return conn, cur
+
+
+class _NullCursor:
+    def execute(self, query, args=None):
+        return 0
+
+
+class _CountedCursor(db._TimedQueries, _NullCursor):
+    pass
+
+
+def make_counting_conn(fetchone=None, fetchall=None, lastrowid=1):
+    """Like make_conn, but every execute() goes through db's query instrumentation,
+    so the request's Server-Timing header counts the statements."""
+    conn, cur = make_conn(fetchone, fetchall, lastrowid)
+    cur.execute.side_effect = _CountedCursor().execute
+    return conn, cur
+
+
+def server_timing(response):
+    """Parse Server-Timing into {name: {"dur": float, "desc": str}}."""
+    metrics = {}
+    for entry in response.headers.get("Server-Timing", "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if not name:
+            continue
+        dur = re.search(r"dur=([\d.]+)", params)
+        desc = re.search(r'desc="([^"]*)"', params)
+        metrics[name] = {"dur": float(dur.group(1)) if dur else None, "desc": desc.group(1) if desc else ""}
+    return metrics
+
+
+def query_count(response):
+    return int(server_timing(response)["db"]["desc"].split()[0])
+
+
+def assert_query_budget(response, max_queries):
+    """Fail when a request ran more SQL statements than its budget."""
+    count = query_count(response)
+    assert count <= max_queries, f"{count} queries exceed budget of {max_queries}"
@@ -8,7 +8,7 @@ def test_get_diaries(authed_client, mock_db):
 def test_get_diaries_with_pet_filter(authed_client, mock_db):
     mock_db.get_all_diaries.return_value = []
     authed_client.get("/api/diaries?pet_id=2")
-    mock_db.get_all_diaries.assert_called_with(pet_id=2, user_id=1)
+    mock_db.get_all_diaries.assert_called_with(pet_id=2, user_id=1, fields=None)
 
 
 def test_add_diary_returns_201(authed_client, mock_db):
@@ -43,3 +43,11 @@ def test_add_diary_db_failure_returns_500(authed_client, mock_db):
     mock_db.get_diary.return_value = None  # simulate DB save failure
     res = authed_client.post("/api/diaries", json={"title": "T", "describe_text": "D", "main_emotion": "M", "memo": ""})
     assert res.status_code == 500
+
+
+def test_get_diaries_calendar_fields(authed_client, mock_db):
+    mock_db.get_all_diaries.return_value = []
+    authed_client.get("/api/diaries?fields=id,created_at,main_emotion")
+    mock_db.get_all_diaries.assert_called_with(
+        pet_id=None, user_id=1, fields=("id", "created_at", "main_emotion")
+    )
@@ -45,3 +45,22 @@ def test_update_pet_missing_name_returns_400(authed_client, mock_db):
     mock_db.get_pet.return_value = {"id": 1, "name": "小黑"}
     res = authed_client.put("/api/pets/1", json={"name": ""})
     assert res.status_code == 400
+
+
+def test_get_pets_passes_requested_fields(authed_client, mock_db):
+    mock_db.get_all_pets.return_value = [{"id": 1, "name": "小黑"}]
+    res = authed_client.get("/api/pets?fields=id, name")
+    assert res.get_json() == {"pets": [{"id": 1, "name": "小黑"}]}
+    mock_db.get_all_pets.assert_called_with(user_id=1, fields=("id", "name"))
+
+
+def test_get_pets_unknown_field_returns_400(authed_client, mock_db):
+    mock_db.get_all_pets.side_effect = ValueError("Unknown fields: nope")
+    res = authed_client.get("/api/pets?fields=nope")
+    assert res.status_code == 400
+
+
+def test_delete_pet_existence_check_skips_big_columns(authed_client, mock_db):
+    mock_db.get_pet.return_value = {"id": 1}
+    authed_client.delete("/api/pets/1")
+    mock_db.get_pet.assert_called_once_with(1, user_id=1, fields=("id",))
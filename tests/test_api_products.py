@@ -1,3 +1,7 @@
+import datetime
+from unittest.mock import patch
+
+
 def test_get_products(authed_client, mock_db):
     mock_db.get_all_products.return_value = []
     res = authed_client.get("/api/products")
@@ -9,7 +13,7 @@ def test_get_products_with_pet_filter(authed_client, mock_db):
     mock_db.get_all_products.return_value = []
     res = authed_client.get("/api/products?pet_id=1")
     assert res.status_code == 200
-    mock_db.get_all_products.assert_called_with(pet_id=1, user_id=1)
+    mock_db.get_all_products.assert_called_with(pet_id=1, user_id=1, fields=None)
 
 
 def test_add_product_returns_201(authed_client, mock_db):
@@ -65,3 +69,56 @@ def test_delete_product_not_found_returns_404(authed_client, mock_db):
     mock_db.get_product.return_value = None
     res = authed_client.delete("/api/products/999")
     assert res.status_code == 404
+
+
+def test_get_products_sets_etag_and_last_modified(authed_client, mock_db):
+    mock_db.get_collection_version.return_value = {
+        "version": 3, "updated_at": datetime.datetime(2026, 1, 2, 3, 4, 5),
+    }
+    mock_db.get_all_products.return_value = []
+    res = authed_client.get("/api/products")
+    assert res.headers["ETag"]
+    assert res.headers["Last-Modified"] == "Fri, 02 Jan 2026 03:04:05 GMT"
+    assert res.headers["Cache-Control"] == "private, no-cache"
+    mock_db.get_collection_version.assert_called_with("products", 1)
+
+
+def test_get_products_if_none_match_returns_304_without_query(authed_client, mock_db):
+    mock_db.get_collection_version.return_value = {"version": 3, "updated_at": None}
+    mock_db.get_all_products.return_value = []
+    etag = authed_client.get("/api/products").headers["ETag"]
+    mock_db.get_all_products.reset_mock()
+    res = authed_client.get("/api/products", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.headers["ETag"] == etag
+    mock_db.get_all_products.assert_not_called()
+
+
+def test_get_products_etag_changes_with_version_and_filter(authed_client, mock_db):
+    mock_db.get_all_products.return_value = []
+    mock_db.get_collection_version.return_value = {"version": 3, "updated_at": None}
+    base = authed_client.get("/api/products").headers["ETag"]
+    filtered = authed_client.get("/api/products?pet_id=1").headers["ETag"]
+    mock_db.get_collection_version.return_value = {"version": 4, "updated_at": None}
+    bumped = authed_client.get("/api/products", headers={"If-None-Match": base})
+    assert bumped.status_code == 200
+    assert len({base, filtered, bumped.headers["ETag"]}) == 3
+
+
+def test_get_products_etag_changes_when_the_representation_changes(authed_client, mock_db):
+    mock_db.get_all_products.return_value = []
+    mock_db.get_collection_version.return_value = {"version": 3, "updated_at": None}
+    etag = authed_client.get("/api/products").headers["ETag"]
+    # 新部署改變回應格式時，舊 ETag 不再相符
+    with patch("app._REPRESENTATION_VERSION", "next-deploy"):
+        res = authed_client.get("/api/products", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+
+
+def test_get_products_accepts_weak_etag_from_compressed_response(authed_client, mock_db):
+    mock_db.get_collection_version.return_value = {"version": 3, "updated_at": None}
+    mock_db.get_all_products.return_value = []
+    etag = authed_client.get("/api/products").headers["ETag"]
+    res = authed_client.get("/api/products", headers={"If-None-Match": f"W/{etag}"})
+    assert res.status_code == 304
@@ -1,4 +1,5 @@
 """Tests for page routes and analyze API endpoints."""
+import json
 from io import BytesIO
 from unittest.mock import patch
 
@@ -8,29 +9,73 @@ def test_index_page(authed_client, mock_db):
     assert res.status_code == 200
 
 
+_PETS = [{"id": 1, "name": "小黑"}]
+
+
+def _bootstrap(res):
+    """取出頁面嵌入的 bootstrap JSON。"""
+    html = res.get_data(as_text=True)
+    start = html.index('<script id="bootstrap-data" type="application/json">') + len(
+        '<script id="bootstrap-data" type="application/json">'
+    )
+    return json.loads(html[start:html.index("</script>", start)])
+
+
 def test_product_analyze_page(authed_client, mock_db):
+    mock_db.get_page_data.return_value = {"pets": _PETS}
     res = authed_client.get("/product/analyze")
     assert res.status_code == 200
+    assert _bootstrap(res) == {"pets": _PETS}
+    mock_db.get_page_data.assert_called_once_with(1, {"pets": ("id", "name")}, product_id=None)
 
 
 def test_organize_page(authed_client, mock_db):
+    mock_db.get_page_data.return_value = {"pets": _PETS, "products": [], "diaries": []}
     res = authed_client.get("/organize")
     assert res.status_code == 200
+    assert _bootstrap(res)["products"] == []
+    sections = mock_db.get_page_data.call_args[0][1]
+    assert sections["pets"] == ("id", "name") and sections["products"] is None
+    # 日記圖片不嵌入 HTML，由頁面另外向 /api/diaries 取得
+    assert "image_base64" not in sections["diaries"]
+    assert {"id", "title", "describe_text", "created_at"} <= set(sections["diaries"])
 
 
 def test_organize_edit_page(authed_client, mock_db):
+    product = {"id": 42, "title": "飼料", "summary": "", "pet_id": None}
+    mock_db.get_page_data.return_value = {"pets": _PETS, "product": product}
     res = authed_client.get("/organize/edit/42")
     assert res.status_code == 200
+    assert _bootstrap(res)["product"] == product
+    mock_db.get_page_data.assert_called_once_with(1, {"pets": ("id", "name")}, product_id=42)
+
+
+def test_organize_edit_missing_product_redirects(authed_client, mock_db):
+    mock_db.get_page_data.return_value = {"pets": _PETS, "product": None}
+    res = authed_client.get("/organize/edit/999")
+    assert res.status_code == 302
+    assert res.headers["Location"].endswith("/organize")
 
 
 def test_diary_page(authed_client, mock_db):
+    mock_db.get_page_data.return_value = {"pets": _PETS}
     res = authed_client.get("/diary")
     assert res.status_code == 200
+    assert _bootstrap(res) == {"pets": _PETS}
 
 
 def test_pets_page(authed_client, mock_db):
+    mock_db.get_page_data.return_value = {"pets": []}
     res = authed_client.get("/pets")
     assert res.status_code == 200
+    mock_db.get_page_data.assert_called_once_with(1, {"pets": None}, product_id=None)
+
+
+def test_bootstrap_json_is_html_safe(authed_client, mock_db):
+    mock_db.get_page_data.return_value = {"pets": [{"id": 1, "name": "</script><b>x"}]}
+    res = authed_client.get("/diary")
+    assert "</script><b>" not in res.get_data(as_text=True)
+    assert _bootstrap(res)["pets"][0]["name"] == "</script><b>x"
 
 
 # ===== /api/product/analyze =====
@@ -91,6 +136,91 @@ def test_product_analyze_webp_allowed(authed_client, mock_db):
     assert res.status_code == 200
 
 
+# ===== /api/product/analyze/batch =====
+
+def _post_batch(c, files, **form):
+    data = {"images": [(BytesIO(body), name) for name, body in files], **form}
+    return c.post("/api/product/analyze/batch", data=data, content_type="multipart/form-data")
+
+
+def _ndjson(res):
+    import json
+    return [json.loads(line) for line in res.get_data(as_text=True).splitlines() if line]
+
+
+def test_product_batch_no_images_returns_400(authed_client, mock_db):
+    res = authed_client.post("/api/product/analyze/batch")
+    assert res.status_code == 400
+
+
+def test_product_batch_too_many_images_returns_400(authed_client, mock_db):
+    files = [(f"{i}.jpg", b"x") for i in range(21)]
+    res = _post_batch(authed_client, files)
+    assert res.status_code == 400
+
+
+def test_product_batch_streams_one_line_per_image(authed_client, mock_db):
+    def analyze(models, data, user_id=None):
+        return None if data == b"b" else {"title": data.decode(), "summary": "S"}
+
+    with patch("app.model_connector.get_model_response_by_image", side_effect=analyze):
+        res = _post_batch(authed_client, [("a.jpg", b"a"), ("doc.pdf", b"p"), ("bad.jpg", b"b")])
+        lines = {line["index"]: line for line in _ndjson(res)}
+    assert res.status_code == 200
+    assert res.mimetype == "application/x-ndjson"
+    assert lines[0]["result"]["title"] == "a"
+    assert lines[0]["filename"] == "a.jpg"
+    assert "不支援" in lines[1]["error"]
+    assert "分析失敗" in lines[2]["error"]
+
+
+def test_product_batch_pack_uses_single_multi_image_call(authed_client, mock_db):
+    packed = [{"title": "A", "summary": "S"}, {"title": "B", "summary": "S"}]
+    with patch("app._analysis_models", return_value="qwen3-vl:8b"), \
+         patch("app.model_connector.get_model_response_by_images", return_value=packed) as many, \
+         patch("app.model_connector.get_model_response_by_image") as single:
+        res = _post_batch(authed_client, [("a.jpg", b"a"), ("b.jpg", b"b")], pack="1")
+        lines = _ndjson(res)
+    assert [line["result"]["title"] for line in lines] == ["A", "B"]
+    many.assert_called_once()
+    single.assert_not_called()
+
+
+def test_product_batch_pack_failure_falls_back_to_per_image(authed_client, mock_db):
+    with patch("app._analysis_models", return_value="qwen3-vl:8b"), \
+         patch("app.model_connector.get_model_response_by_images", return_value=None), \
+         patch("app.model_connector.get_model_response_by_image",
+               return_value={"title": "T", "summary": "S"}) as single:
+        res = _post_batch(authed_client, [("a.jpg", b"a"), ("b.jpg", b"b")], pack="1")
+        assert len(_ndjson(res)) == 2
+    assert single.call_count == 2
+
+
+def test_product_batch_pack_reanalyzes_rejected_items_one_by_one(authed_client, mock_db):
+    packed = [{"title": "A", "summary": "S"}, None]
+    with patch("app._analysis_models", return_value="qwen3-vl:8b"), \
+         patch("app.model_connector.get_model_response_by_images", return_value=packed), \
+         patch("app.model_connector.get_model_response_by_image",
+               return_value={"title": "B", "summary": "S"}) as single:
+        res = _post_batch(authed_client, [("a.jpg", b"a"), ("b.jpg", b"b")], pack="1")
+        lines = {line["index"]: line for line in _ndjson(res)}
+    assert lines[0]["result"]["title"] == "A"
+    assert lines[1]["result"]["title"] == "B"
+    assert single.call_count == 1
+    assert single.call_args[0][1] == b"b"
+
+
+def test_product_batch_pack_exception_falls_back_instead_of_breaking_the_stream(authed_client, mock_db):
+    with patch("app._analysis_models", return_value="qwen3-vl:8b"), \
+         patch("app.model_connector.get_model_response_by_images", side_effect=RuntimeError("scheduler")), \
+         patch("app.model_connector.get_model_response_by_image",
+               return_value={"title": "T", "summary": "S"}) as single:
+        res = _post_batch(authed_client, [("a.jpg", b"a"), ("b.jpg", b"b")], pack="1")
+        lines = _ndjson(res)
+    assert [line["result"]["title"] for line in lines] == ["T", "T"]
+    assert single.call_count == 2
+
+
 # ===== /api/diary/analyze =====
 
 def test_diary_analyze_no_image_returns_400(authed_client, mock_db):
@@ -184,3 +314,11 @@ def test_batch_delete_products_empty_ids(authed_client, mock_db):
     res = authed_client.delete("/api/products", json={"ids": []})
     assert res.status_code == 204
     mock_db.remove_products.assert_not_called()
+
+
+def test_analysis_models_uses_cascade_when_configured():
+    import app as app_module
+    with patch("app.pet_model_config.pet_model_cascade", ["qwen3-vl:4b", "qwen3-vl:8b"]):
+        assert app_module._analysis_models() == ["qwen3-vl:4b", "qwen3-vl:8b"]
+    with patch("app.pet_model_config.pet_model_cascade", []):
+        assert app_module._analysis_models() == app_module.pet_model_config.pet_model_name
@@ -0,0 +1,72 @@
+"""Tests for assets.py fingerprinted static URLs."""
+import os
+
+import pytest
+from flask import Flask, render_template_string, url_for
+
+import assets
+import compression
+
+
+@pytest.fixture
+def app(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "site.css").write_text("body { color: #333; }\n" * 200)
+    test_app = Flask(__name__, static_folder=str(tmp_path), static_url_path="/static")
+    compression.init_app(test_app)
+    assets.init_app(test_app)
+    return test_app
+
+
+def _static_url(app, filename):
+    with app.test_request_context():
+        return url_for("static", filename=filename)
+
+
+def test_url_for_static_is_fingerprinted(app):
+    url = _static_url(app, "css/site.css")
+    assert url.startswith("/static/css/site.") and url.endswith(".css")
+    assert url != "/static/css/site.css"
+    with app.test_request_context():
+        assert render_template_string("{{ url_for('static', filename='css/site.css') }}") == url
+
+
+def test_fingerprinted_url_is_immutable(app):
+    res = app.test_client().get(_static_url(app, "css/site.css"))
+    assert res.status_code == 200
+    assert res.data.startswith(b"body")
+    cache = res.cache_control
+    assert cache.public and cache.immutable
+    assert cache.max_age == assets.IMMUTABLE_MAX_AGE
+    res.close()
+
+
+def test_fingerprinted_url_serves_precompressed_file(app):
+    pytest.importorskip("brotli")
+    compression.build_static(app.static_folder)
+    res = app.test_client().get(_static_url(app, "css/site.css"), headers={"Accept-Encoding": "br"})
+    assert res.headers["Content-Encoding"] == "br"
+    assert res.cache_control.immutable
+    res.close()
+
+
+def test_plain_url_still_served_without_immutable(app):
+    res = app.test_client().get("/static/css/site.css")
+    assert res.status_code == 200
+    assert not res.cache_control.immutable
+    res.close()
+
+
+def test_unknown_fingerprint_returns_404(app):
+    res = app.test_client().get("/static/css/site.0000000000.css")
+    assert res.status_code == 404
+
+
+def test_debug_mode_picks_up_changed_file(app):
+    app.debug = True
+    before = _static_url(app, "css/site.css")
+    css = os.path.join(app.static_folder, "css", "site.css")
+    with open(css, "a") as f:
+        f.write("a { color: red; }\n")
+    os.utime(css, (os.path.getmtime(css) + 5,) * 2)
+    assert _static_url(app, "css/site.css") != before
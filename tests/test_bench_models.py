@@ -0,0 +1,104 @@
+"""Tests for the benchmarks.bench_models model/prompt comparison CLI."""
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from benchmarks import bench_models
+
+
+def _ollama(inner, eval_count=120, eval_duration=2_000_000_000, status=200):
+    response = MagicMock(status_code=status)
+    response.json.return_value = {"response": inner, "eval_count": eval_count, "eval_duration": eval_duration,
+                                  "prompt_eval_count": 900, "load_duration": 1000}
+    return response
+
+
+_GOOD = json.dumps({"title": "Orijen Senior 高齡犬飼料", "summary": "以新鮮雞肉與火雞肉製成的高齡犬配方，含 85% 動物性原料"},
+                   ensure_ascii=False)
+
+
+@pytest.fixture
+def images(tmp_path):
+    for name in ("a.png", "b.png"):
+        (tmp_path / name).write_bytes(b"\x89PNG fake")
+    (tmp_path / "labels.json").write_text(json.dumps({"a.png": {"prompt": "product", "keywords": ["orijen", "貓"]}}))
+    return tmp_path
+
+
+def test_parse_prompt_uses_config_or_file(tmp_path):
+    name, kind, text, keys = bench_models.parse_prompt("diary")
+    assert (name, kind, keys) == ("diary", "diary", ("title", "describe", "main_emotion"))
+    assert text
+    variant = tmp_path / "short_v2.txt"
+    variant.write_text("只回傳 JSON", encoding="utf-8")
+    assert bench_models.parse_prompt(f"product={variant}")[:3] == ("product:short_v2", "product", "只回傳 JSON")
+    with pytest.raises(ValueError):
+        bench_models.parse_prompt("nope")
+
+
+def test_completeness_and_keyword_recall():
+    result = {"title": "Orijen 飼料", "summary": "  "}
+    assert bench_models.completeness(result, ("title", "summary")) == 0.5
+    assert bench_models.completeness(None, ("title",)) == 0.0
+    assert bench_models.keyword_recall(result, ["orijen", "senior"]) == 0.5
+    assert bench_models.keyword_recall(result, []) is None
+
+
+def test_call_classifies_outcomes(images):
+    image = str(images / "a.png")
+    cases = [
+        (_ollama(_GOOD), "ok"),
+        (_ollama("抱歉，我無法辨識"), "parse_error"),
+        (_ollama("", status=500), "http_error"),
+        (requests.exceptions.ConnectionError("down"), "network_error"),
+    ]
+    for outcome, expected in cases:
+        kwargs = {"side_effect": outcome} if isinstance(outcome, Exception) else {"return_value": outcome}
+        with patch("benchmarks.bench_models.requests.post", **kwargs):
+            status, seconds, raw, result = bench_models.call("m", "p", image, 5)
+        assert status == expected
+        assert (result is not None) == (expected == "ok")
+
+
+def test_summarize_reports_percentiles_and_rates():
+    def record(seconds, status="ok", completeness=1.0, issue=None, recall=None):
+        return {"model": "m", "prompt": "product", "status": status, "seconds": seconds, "eval_count": 100,
+                "eval_duration": 1_000_000_000, "completeness": completeness, "issue": issue,
+                "keyword_recall": recall}
+
+    records = [record(s / 10) for s in range(1, 10)]
+    records += [record(5.0, "parse_error", 0.0, "parse_error", 0.0), record(30.0, "network_error", 0.0, "network_error")]
+    (row,) = bench_models.summarize(records)
+    assert row["calls"] == 11 and row["errors"] == 1
+    assert row["p50"] == 0.5 and row["p99"] == 5.0
+    assert row["tokens_per_s"] == pytest.approx(100.0)
+    assert row["parse_failure"] == pytest.approx(0.1)
+    assert row["quality_pass"] == pytest.approx(9 / 11)
+    assert row["keyword_recall"] == 0.0
+
+
+def test_run_writes_records_and_prints_table(images, tmp_path, capsys):
+    output = tmp_path / "bench.jsonl"
+    responses = [_ollama(_GOOD) for _ in range(10)]
+    with patch("benchmarks.bench_models.requests.post", side_effect=responses) as post, \
+            patch("benchmarks.bench_models.logging.basicConfig"):
+        assert bench_models.main(["run", "--images", str(images / "*.png"), "--models", "m1,m2",
+                                  "--prompt", "product", "--prompt", "diary", "--output", str(output)]) == 0
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    # 每個模型暖機 1 次；a.png 只跑 product，b.png 兩種 prompt 都跑
+    assert post.call_count == 2 * (1 + 3)
+    assert len(records) == 6
+    assert {(r["prompt"], r["image"].rsplit("/", 1)[-1]) for r in records} == {
+        ("product", "a.png"), ("product", "b.png"), ("diary", "b.png")}
+    product_a = next(r for r in records if r["image"].endswith("a.png"))
+    assert product_a["keyword_recall"] == 0.5
+    assert product_a["issue"] is None
+    assert next(r for r in records if r["prompt"] == "diary")["completeness"] == pytest.approx(1 / 3)
+
+    capsys.readouterr()
+    assert bench_models.main(["report", str(output)]) == 0
+    table = capsys.readouterr().out.splitlines()
+    assert table[0].split()[:2] == ["model", "prompt"]
+    assert len(table) == 1 + 4
@@ -0,0 +1,109 @@
+"""Tests for compression.py response compression and precompressed static files."""
+import gzip
+import os
+import zlib
+
+import pytest
+from flask import Flask, Response, jsonify
+
+import compression
+
+brotli = pytest.importorskip("brotli")
+
+
+@pytest.fixture
+def app(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "site.css").write_text("body { color: #333; }\n" * 200)
+    test_app = Flask(__name__, static_folder=str(tmp_path), static_url_path="/static")
+    compression.init_app(test_app)
+
+    @test_app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    @test_app.route("/large")
+    def large():
+        return jsonify({"diaries": [{"describe_text": "今天散步很開心" * 20}] * 100})
+
+    @test_app.route("/huge")
+    def huge():
+        return jsonify({"diaries": [{"image_base64": "QUJD" * 1000}] * 100})
+
+    @test_app.route("/stream")
+    def stream():
+        return Response((f'{{"index": {i}}}\n' for i in range(3)), mimetype="application/x-ndjson")
+
+    return test_app
+
+
+def test_brotli_preferred_and_vary_set(app):
+    res = app.test_client().get("/large", headers={"Accept-Encoding": "gzip, br"})
+    assert res.headers["Content-Encoding"] == "br"
+    assert "Accept-Encoding" in res.headers["Vary"]
+    assert int(res.headers["Content-Length"]) == len(res.data)
+    assert brotli.decompress(res.data).decode("utf-8").startswith('{"diaries"')
+
+
+def test_gzip_when_brotli_not_accepted(app):
+    res = app.test_client().get("/large", headers={"Accept-Encoding": "gzip"})
+    assert res.headers["Content-Encoding"] == "gzip"
+    assert b"diaries" in gzip.decompress(res.data)
+
+
+def test_small_and_unaccepted_responses_are_not_compressed(app):
+    client = app.test_client()
+    assert "Content-Encoding" not in client.get("/small", headers={"Accept-Encoding": "br"}).headers
+    res = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in res.headers
+    assert res.get_json()["diaries"]
+
+
+def test_large_body_is_compressed_as_a_stream(app):
+    res = app.test_client().get("/huge", headers={"Accept-Encoding": "gzip"})
+    assert res.is_streamed
+    assert "Content-Length" not in res.headers
+    assert len(gzip.decompress(res.data)) > compression.STREAM_SIZE
+
+
+def test_streamed_response_compresses_each_chunk(app):
+    res = app.test_client().get("/stream", headers={"Accept-Encoding": "gzip"})
+    chunks = list(res.response)
+    # 每行都 flush，解壓前幾段就能讀到第一行
+    decoder = zlib.decompressobj(31)
+    assert decoder.decompress(chunks[0]) == b'{"index": 0}\n'
+    assert gzip.decompress(b"".join(chunks)).count(b"\n") == 3
+
+
+def test_strong_etag_is_weakened_when_compressed(app):
+    @app.after_request
+    def add_etag(response):
+        response.set_etag("abc")
+        return response
+
+    res = app.test_client().get("/large", headers={"Accept-Encoding": "br"})
+    assert res.headers["ETag"] == 'W/"abc"'
+
+
+def test_static_serves_precompressed_file(app):
+    assert compression.build_static(app.static_folder) == 2
+    client = app.test_client()
+    res = client.get("/static/css/site.css", headers={"Accept-Encoding": "br, gzip"})
+    assert res.headers["Content-Encoding"] == "br"
+    assert res.mimetype == "text/css"
+    assert brotli.decompress(res.data).startswith(b"body")
+    res.close()
+    plain = client.get("/static/css/site.css")
+    assert "Content-Encoding" not in plain.headers
+    assert plain.data.startswith(b"body")
+    plain.close()
+
+
+def test_static_ignores_stale_precompressed_file(app):
+    compression.build_static(app.static_folder)
+    css = os.path.join(app.static_folder, "css", "site.css")
+    stale = os.path.getmtime(css) - 10
+    os.utime(css + ".br", (stale, stale))
+    res = app.test_client().get("/static/css/site.css", headers={"Accept-Encoding": "br"})
+    assert "Content-Encoding" not in res.headers
+    res.close()
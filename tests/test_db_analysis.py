@@ -0,0 +1,93 @@
+"""Tests for db.py analysis result storage, claims and pruning."""
+import json
+from unittest.mock import patch
+from tests.helpers import make_conn as _make_conn
+
+
+def test_claim_analysis_reports_whether_row_was_claimed():
+    conn, cur = _make_conn()
+    with patch("db.get_connection", return_value=conn):
+        import db
+        cur.rowcount = 1
+        assert db.claim_analysis("k" * 64, 120) is True
+        cur.rowcount = 0
+        assert db.claim_analysis("k" * 64, 120) is False
+    sql, args = cur.execute.call_args[0]
+    assert "ON DUPLICATE KEY UPDATE" in sql
+    assert args == ("k" * 64, 120)
+
+
+def test_release_analysis_claim_deletes_row():
+    conn, cur = _make_conn()
+    with patch("db.get_connection", return_value=conn):
+        import db
+        db.release_analysis_claim("k" * 64)
+    sql, args = cur.execute.call_args[0]
+    assert sql.startswith("DELETE FROM analysis_claims")
+    assert args == ("k" * 64,)
+
+
+def test_prune_analysis_results_deletes_in_batches():
+    conn, cur = _make_conn()
+    counts = iter([2, 2, 1, 0])
+
+    def execute(sql, args=None):
+        cur.rowcount = next(counts)
+
+    cur.execute.side_effect = execute
+    with patch("db.get_connection", return_value=conn):
+        import db
+        assert db.prune_analysis_results(86400, batch_rows=2) == 5
+    sqls = [c[0][0] for c in cur.execute.call_args_list]
+    assert len(sqls) == 4
+    assert all("LIMIT" in s for s in sqls[:3])
+    assert sqls[-1].startswith("DELETE FROM analysis_claims")
+    assert cur.execute.call_args_list[0][0][1] == (86400, 2)
+
+
+
+def test_get_analysis_result_decodes_json():
+    conn, cur = _make_conn(fetchone={"result": '{"title": "罐頭"}'})
+    with patch("db.get_connection", return_value=conn):
+        import db
+        result = db.get_analysis_result("k" * 64, 60)
+    assert result == {"title": "罐頭"}
+    assert cur.execute.call_args[0][1] == ("k" * 64, 60)
+
+
+def test_get_analysis_result_missing_returns_none():
+    conn, cur = _make_conn(fetchone=None)
+    with patch("db.get_connection", return_value=conn):
+        import db
+        assert db.get_analysis_result("k" * 64, 60) is None
+
+
+def test_save_analysis_result_upserts_json():
+    conn, cur = _make_conn()
+    with patch("db.get_connection", return_value=conn):
+        import db
+        db.save_analysis_result("k" * 64, "model", {"title": "罐頭"})
+    sql, args = cur.execute.call_args[0]
+    assert "ON DUPLICATE KEY UPDATE" in sql
+    assert json.loads(args[5]) == {"title": "罐頭"}
+
+
+def test_get_analysis_result_without_max_age():
+    conn, cur = _make_conn(fetchone={"result": "{}"})
+    with patch("db.get_connection", return_value=conn):
+        import db
+        db.get_analysis_result("k" * 64)
+    sql, args = cur.execute.call_args[0]
+    assert "created_at" not in sql
+    assert args == ("k" * 64,)
+
+
+def test_get_analysis_phashes_since():
+    conn, cur = _make_conn(fetchall=[{"phash": 7, "request_key": "a" * 64}])
+    with patch("db.get_connection", return_value=conn):
+        import db
+        result = db.get_analysis_phashes("p" * 64, 3, since=1000)
+    assert result == [(7, "a" * 64)]
+    sql, args = cur.execute.call_args[0]
+    assert "FROM_UNIXTIME" in sql and "user_id = %s" in sql
+    assert args == (3, "p" * 64, 1000)
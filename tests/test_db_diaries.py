@@ -103,3 +103,44 @@ def test_remove_pet_nullifies_references():
     assert any("UPDATE products SET pet_id = NULL" in sql for sql in calls)
     assert any("UPDATE pet_diaries SET pet_id = NULL" in sql for sql in calls)
     assert any("DELETE FROM pets" in sql for sql in calls)
+
+
+def test_iter_diaries_with_image_streams_rows_after_id():
+    conn, cur = _make_conn()
+    cur.__iter__ = lambda self: iter([{"id": 5, "user_id": 1, "image_base64": "x"}])
+    with patch("db.get_connection", return_value=conn):
+        import db
+        rows = list(db.iter_diaries_with_image(after_id=4))
+    assert rows == [{"id": 5, "user_id": 1, "image_base64": "x"}]
+    sqls = [c[0][0] for c in cur.execute.call_args_list]
+    assert "net_write_timeout" in sqls[0]
+    assert "id > %s" in sqls[1] and "ORDER BY id" in sqls[1]
+
+
+def test_update_diary_analyses_uses_executemany():
+    conn, cur = _make_conn()
+    with patch("db.get_connection", return_value=conn):
+        import db
+        db.update_diary_analyses([("d", "e", 1), ("d2", "e2", 2)])
+    sql, rows = cur.executemany.call_args[0]
+    assert sql.startswith("UPDATE pet_diaries SET describe_text")
+    assert len(rows) == 2
+
+
+def test_update_diary_analyses_empty_is_no_op():
+    conn, cur = _make_conn()
+    with patch("db.get_connection", return_value=conn):
+        import db
+        db.update_diary_analyses([])
+    cur.executemany.assert_not_called()
+
+
+def test_get_all_diaries_fields_exclude_image_column():
+    conn, cur = _make_conn(fetchall=[{"id": 1, "created_at": None, "main_emotion": None}])
+    with patch("db.get_connection", return_value=conn):
+        import db
+        result = db.get_all_diaries(user_id=1, fields=("id", "created_at", "main_emotion"))
+    sql = cur.execute.call_args[0][0]
+    assert sql.startswith("SELECT id, main_emotion, created_at FROM pet_diaries")
+    assert "image_base64" not in sql and "describe_text" not in sql
+    assert result == [{"id": 1, "main_emotion": "", "created_at": None}]
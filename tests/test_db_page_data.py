@@ -0,0 +1,88 @@
+"""Tests for db.get_page_data page bootstrap queries."""
+import base64
+import datetime
+import os
+from unittest.mock import patch
+
+import pytest
+
+from tests.helpers import make_conn as _make_conn
+
+
+def test_get_page_data_runs_one_select_per_section_on_one_connection():
+    pets = [{"id": 1, "name": "小黑"}, {"id": 2, "name": "小白"}]
+    diaries = [
+        {"id": 7, "title": "散步", "memo": None, "created_at": datetime.datetime(2026, 3, 3, 9, 0)},
+        {"id": 5, "title": None, "memo": "a", "created_at": datetime.datetime(2026, 3, 1, 9, 0)},
+    ]
+    conn, cur = _make_conn()
+    cur.fetchall.side_effect = [pets, diaries]
+    with patch("db.get_connection", return_value=conn) as get_connection:
+        import db
+        data = db.get_page_data(1, {"pets": ("id", "name"), "diaries": ("id", "title", "memo", "created_at")})
+    assert get_connection.call_count == 1
+    (pets_sql, pets_params), (diaries_sql, diaries_params) = [c.args for c in cur.execute.call_args_list]
+    assert pets_sql == "SELECT id, name FROM pets WHERE user_id = %s ORDER BY created_at ASC"
+    assert diaries_sql == ("SELECT id, title, memo, created_at FROM pet_diaries WHERE user_id = %s"
+                           " ORDER BY created_at DESC, id DESC")
+    assert pets_params == diaries_params == (1,)
+    assert data["pets"] == pets
+    assert [d["id"] for d in data["diaries"]] == [7, 5]
+    assert data["diaries"][0]["memo"] == ""
+    assert data["diaries"][1]["title"] == ""
+
+
+def test_get_page_data_returns_large_images_row_by_row():
+    # 每列 2 MB 圖片、整頁約 60 MB：不可聚合成單一值（會超過 max_allowed_packet）
+    image = "data:image/jpeg;base64," + base64.b64encode(os.urandom(1536 * 1024)).decode()
+    now = datetime.datetime(2026, 3, 1, 12, 0)
+    diaries = [{"id": i, "title": "散步", "describe_text": "", "main_emotion": "", "memo": "",
+                "image_base64": image, "pet_id": None, "user_id": 1, "created_at": now, "updated_at": now}
+               for i in range(30, 0, -1)]
+    conn, cur = _make_conn()
+    cur.fetchall.side_effect = [[], [], diaries]
+    with patch("db.get_connection", return_value=conn):
+        import db
+        data = db.get_page_data(1, {"pets": ("id", "name"), "products": None, "diaries": None})
+    statements = [c.args[0] for c in cur.execute.call_args_list]
+    assert len(statements) == 3
+    assert not any("JSON_ARRAYAGG" in sql or "JSON_OBJECT" in sql for sql in statements)
+    assert "image_base64" in statements[2]
+    assert len(data["diaries"]) == 30
+    assert all(d["image_base64"] is image for d in data["diaries"])
+
+
+def test_get_page_data_empty_collections_and_missing_product():
+    conn, cur = _make_conn(fetchone=None, fetchall=[])
+    with patch("db.get_connection", return_value=conn):
+        import db
+        data = db.get_page_data(1, {"pets": None}, product_id=9)
+    sql, params = cur.execute.call_args[0]
+    assert "FROM products WHERE id = %s AND user_id = %s" in sql
+    assert params == (9, 1)
+    assert data == {"pets": [], "product": None}
+
+
+def test_get_page_data_product_and_pet_birthday():
+    pet = {"id": 1, "name": "小黑", "breed": None, "birthday": datetime.date(2020, 5, 1), "photo_base64": None,
+           "user_id": 1, "created_at": datetime.datetime(2026, 3, 1, 8, 0), "updated_at": None}
+    product = {"id": 9, "title": "罐頭", "summary": None, "pet_id": 1, "user_id": 1,
+               "created_at": datetime.datetime(2026, 3, 1, 8, 0), "updated_at": datetime.datetime(2026, 3, 2, 8, 0)}
+    conn, cur = _make_conn(fetchone=product, fetchall=[pet])
+    with patch("db.get_connection", return_value=conn):
+        import db
+        data = db.get_page_data(1, {"pets": None}, product_id=9)
+    assert data["pets"][0]["birthday"] == "2020-05-01"
+    assert data["pets"][0]["breed"] == ""
+    assert data["product"]["summary"] == ""
+    assert data["product"]["updated_at"] == datetime.datetime(2026, 3, 2, 8, 0)
+
+
+def test_get_page_data_rejects_unknown_fields():
+    conn, cur = _make_conn()
+    with patch("db.get_connection", return_value=conn) as get_connection:
+        import db
+        with pytest.raises(ValueError):
+            db.get_page_data(1, {"pets": ("id", "password_hash")})
+    get_connection.assert_not_called()
+    cur.execute.assert_not_called()
@@ -92,3 +92,22 @@ def test_update_pet_without_photo_excludes_photo_field():
         db.update_pet(1, "小黑", "柴犬", "2020-01-01", photo_base64=None)
     sql = mock_cur.execute.call_args[0][0]
     assert "photo_base64" not in sql
+
+
+def test_get_all_pets_fields_id_and_name_only():
+    conn, cur = _make_conn(fetchall=[{"id": 3, "name": "小黑"}])
+    with patch("db.get_connection", return_value=conn):
+        import db
+        result = db.get_all_pets(user_id=1, fields=("id", "name"))
+    sql = cur.execute.call_args[0][0]
+    assert sql.startswith("SELECT id, name FROM pets")
+    assert result == [{"id": 3, "name": "小黑"}]
+
+
+def test_get_pet_fields_with_birthday_formats_date():
+    import datetime
+    conn, cur = _make_conn(fetchone={"id": 3, "birthday": datetime.date(2020, 1, 2)})
+    with patch("db.get_connection", return_value=conn):
+        import db
+        result = db.get_pet(3, fields=("birthday", "id"))
+    assert result == {"id": 3, "birthday": "2020-01-02"}
@@ -87,3 +87,52 @@ def test_remove_products_empty_list_no_op():
         import db
         db.remove_products([])
     cur.execute.assert_not_called()
+
+
+def test_get_all_products_fields_limit_select_list():
+    conn, cur = _make_conn(fetchall=[{"id": 1, "title": "罐頭"}])
+    with patch("db.get_connection", return_value=conn):
+        import db
+        result = db.get_all_products(user_id=1, fields=("title", "id"))
+    sql = cur.execute.call_args[0][0]
+    assert sql.startswith("SELECT id, title FROM products")
+    assert "summary" not in sql
+    assert result == [{"id": 1, "title": "罐頭"}]
+
+
+def test_get_all_products_unknown_field_raises_before_query():
+    import pytest
+    conn, cur = _make_conn()
+    with patch("db.get_connection", return_value=conn):
+        import db
+        with pytest.raises(ValueError):
+            db.get_all_products(fields=("id", "password_hash"))
+    cur.execute.assert_not_called()
+
+
+def test_add_product_bumps_user_collection_version():
+    conn, cur = _make_conn(lastrowid=7)
+    with patch("db.get_connection", return_value=conn):
+        import db
+        assert db.add_product("罐頭", "", user_id=3) == 7
+    sql, args = cur.execute.call_args_list[0][0]
+    assert "INSERT INTO collection_versions" in sql
+    assert args == (3, "products")
+
+
+def test_remove_products_bumps_owner_versions_before_delete():
+    conn, cur = _make_conn()
+    with patch("db.get_connection", return_value=conn):
+        import db
+        db.remove_products([1, 2])
+    bump_sql, bump_args = cur.execute.call_args_list[0][0]
+    assert "SELECT DISTINCT user_id FROM products WHERE id IN (%s, %s)" in bump_sql
+    assert bump_args == ("products", 1, 2)
+    assert "DELETE FROM products" in cur.execute.call_args_list[1][0][0]
+
+
+def test_get_collection_version_defaults_to_zero():
+    conn, cur = _make_conn(fetchone=None)
+    with patch("db.get_connection", return_value=conn):
+        import db
+        assert db.get_collection_version("products", 1) == {"version": 0, "updated_at": None}
@@ -78,3 +78,15 @@ def test_init_db_creates_pets_table():
     # Verify ALTER TABLE pet_diaries ADD COLUMN pet_id was called
     assert any("ALTER TABLE pet_diaries ADD COLUMN pet_id" in sql for sql in all_sql), \
         "Expected ALTER TABLE pet_diaries ADD COLUMN pet_id in SQL calls"
+
+
+def test_ping_selects_one_with_short_timeouts_and_closes():
+    import db
+    from tests.helpers import make_conn
+    conn, cur = make_conn()
+    with patch("db.pymysql.connect", return_value=conn) as connect:
+        db.ping(timeout=3)
+    kwargs = connect.call_args[1]
+    assert kwargs["connect_timeout"] == 3 and kwargs["read_timeout"] == 3
+    cur.execute.assert_called_once_with("SELECT 1")
+    conn.close.assert_called_once()
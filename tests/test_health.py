@@ -0,0 +1,83 @@
+"""Tests for /healthz, /readyz and health.py probes."""
+import logging
+from unittest.mock import MagicMock, patch
+
+import health
+
+
+def test_healthz_needs_no_login_or_db(client, mock_db):
+    res = client.get("/healthz")
+    assert res.status_code == 200
+    assert res.get_json() == {"status": "ok"}
+    mock_db.init_db.assert_not_called()
+
+
+def test_readyz_reports_per_dependency_checks(client, mock_db):
+    body = {"status": "ready", "checks": {"mysql": {"ok": True, "latency_ms": 1.2, "age_seconds": 0.0}}}
+    with patch("app.health.readiness", return_value=(True, body)):
+        res = client.get("/readyz")
+    assert res.status_code == 200
+    assert res.get_json() == body
+    mock_db.init_db.assert_not_called()
+
+
+def test_readyz_unavailable_returns_503(client, mock_db):
+    with patch("app.health.readiness", return_value=(False, {"status": "unavailable", "checks": {}})):
+        res = client.get("/readyz")
+    assert res.status_code == 503
+
+
+def test_probe_caches_result_within_ttl():
+    now = [100.0]
+    check = MagicMock()
+    probe = health.Probe("mysql", check, ttl=5, clock=lambda: now[0])
+    assert probe.run()["ok"] is True
+    now[0] += 3
+    result = probe.run()
+    assert check.call_count == 1
+    assert result["age_seconds"] == 3.0
+    now[0] += 3
+    probe.run()
+    assert check.call_count == 2
+
+
+def test_probe_reports_error_without_details(caplog):
+    error = ConnectionError("(1045, \"Access denied for user 'app'@'10.0.0.5'\")")
+    probe = health.Probe("mysql", MagicMock(side_effect=error))
+    with caplog.at_level(logging.WARNING, logger="health"):
+        result = probe.run()
+    assert result["ok"] is False
+    assert result["error"] == "unavailable"
+    assert "latency_ms" in result
+    # 細節只留在 log
+    assert "10.0.0.5" in caplog.text
+
+
+def test_readiness_non_critical_failure_is_degraded():
+    probes = (
+        health.Probe("mysql", MagicMock()),
+        health.Probe("ollama", MagicMock(side_effect=OSError("down")), critical=False),
+    )
+    ready, body = health.readiness(probes)
+    assert ready is True
+    assert body["status"] == "degraded"
+    assert body["checks"]["ollama"]["ok"] is False
+
+
+def test_readiness_critical_failure_is_unavailable():
+    probes = (health.Probe("mysql", MagicMock(side_effect=OSError("down"))),)
+    ready, body = health.readiness(probes)
+    assert ready is False
+    assert body["status"] == "unavailable"
+
+
+def test_first_request_prunes_old_analysis_results(authed_client, mock_db):
+    with patch("app._ANALYSIS_RESULT_TTL_DAYS", 7):
+        authed_client.get("/")
+    mock_db.prune_analysis_results.assert_called_once_with(7 * 86400)
+
+
+def test_prune_failure_does_not_block_requests(authed_client, mock_db):
+    mock_db.prune_analysis_results.side_effect = RuntimeError("db down")
+    res = authed_client.get("/")
+    assert res.status_code != 500
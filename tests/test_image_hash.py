@@ -0,0 +1,179 @@
+"""Tests for image_hash.py perceptual hashing and near-duplicate index."""
+import random
+import threading
+from io import BytesIO
+from unittest.mock import patch
+
+import pytest
+
+import image_hash
+from image_hash import BKTree, NearDuplicateIndex, hamming
+
+
+def _photo(size=(320, 240), seed=1):
+    Image = pytest.importorskip("PIL.Image")
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (240, 240, 240))
+    pixels = img.load()
+    for _ in range(12):
+        x0, y0 = rng.randrange(size[0] - 60), rng.randrange(size[1] - 60)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        for x in range(x0, x0 + rng.randrange(20, 60)):
+            for y in range(y0, y0 + rng.randrange(20, 60)):
+                pixels[x, y] = color
+    return img
+
+
+def _encode(img, fmt="PNG", **kwargs):
+    buf = BytesIO()
+    img.save(buf, fmt, **kwargs)
+    return buf.getvalue()
+
+
+def test_bktree_search_matches_brute_force():
+    rng = random.Random(7)
+    values = [rng.getrandbits(64) for _ in range(300)]
+    tree = BKTree()
+    for i, v in enumerate(values):
+        tree.add(v, i)
+    query = values[42] ^ 0b1011  # 3 bits away
+    expected = sorted((hamming(query, v), i) for i, v in enumerate(values) if hamming(query, v) <= 5)
+    assert sorted(tree.search(query, 5)) == expected
+    assert len(tree) == 300
+
+
+def test_dhash_stable_across_recompression_and_resize():
+    img = _photo()
+    original = image_hash.dhash_variants(_encode(img))[0]
+    jpeg = image_hash.dhash_variants(_encode(img.convert("RGB"), "JPEG", quality=60))[0]
+    smaller = image_hash.dhash_variants(_encode(img.resize((200, 150))))[0]
+    other = image_hash.dhash_variants(_encode(_photo(seed=99)))[0]
+    assert hamming(original, jpeg) <= 6
+    assert hamming(original, smaller) <= 6
+    assert hamming(original, other) > 6
+
+
+def test_dhash_variants_cover_rotation():
+    img = _photo()
+    original = image_hash.dhash_variants(_encode(img))[0]
+    rotated = image_hash.dhash_variants(_encode(img.rotate(90, expand=True)))
+    assert min(hamming(original, h) for h in rotated) <= 6
+
+
+def test_dhash_restores_file_position():
+    data = _encode(_photo())
+    f = BytesIO(data)
+    assert image_hash.dhash_variants(f) is not None
+    assert f.tell() == 0
+
+
+def test_dhash_non_image_returns_none():
+    assert image_hash.dhash_variants(b"not an image") is None
+
+
+def test_near_duplicate_index_returns_closest_result():
+    index = NearDuplicateIndex(max_distance=4, refresh_seconds=60)
+    with patch("image_hash.db") as mock_db:
+        mock_db.get_analysis_phashes.return_value = [(0b1111, "far"), (0b0001, "near")]
+        mock_db.get_analysis_result.return_value = {"title": "T"}
+        result = index.lookup([0b0000], "p" * 64, 1)
+    assert result == {"title": "T"}
+    mock_db.get_analysis_result.assert_called_once_with("near")
+    mock_db.get_analysis_phashes.assert_called_once_with("p" * 64, 1, since=None)
+
+
+def test_near_duplicate_index_disabled_with_negative_distance():
+    index = NearDuplicateIndex(max_distance=-1, refresh_seconds=60)
+    with patch("image_hash.db") as mock_db:
+        assert index.lookup([0], "p" * 64, 1) is None
+        index.add(0, "k", "m", "p" * 64, {}, 1)
+    mock_db.get_analysis_phashes.assert_not_called()
+    mock_db.save_analysis_result.assert_not_called()
+
+
+def test_near_duplicate_index_add_makes_entry_searchable():
+    index = NearDuplicateIndex(max_distance=2, refresh_seconds=60)
+    with patch("image_hash.db") as mock_db:
+        mock_db.get_analysis_phashes.return_value = []
+        assert index.lookup([5], "p" * 64, 1) is None
+        index.add(5, "k1", "m", "p" * 64, {"title": "T"}, 1)
+        mock_db.get_analysis_result.return_value = {"title": "T"}
+        assert index.lookup([4], "p" * 64, 1) == {"title": "T"}
+
+
+def test_dhash_shrinks_before_rotating_large_uploads():
+    Image = pytest.importorskip("PIL.Image")
+    big = _photo().resize((4000, 3000))
+    data = _encode(big, "JPEG", quality=80)
+    sizes = []
+    rotate = Image.Image.rotate
+
+    def spy(self, *args, **kwargs):
+        sizes.append(self.size)
+        return rotate(self, *args, **kwargs)
+
+    with patch.object(Image.Image, "rotate", spy):
+        hashes = image_hash.dhash_variants(data)
+    assert sizes and max(max(s) for s in sizes) <= image_hash._THUMBNAIL_SIZE
+    assert hamming(hashes[0], image_hash.dhash_variants(_encode(_photo()))[0]) <= 6
+
+
+def test_near_duplicate_index_is_scoped_per_user():
+    index = NearDuplicateIndex(max_distance=2, refresh_seconds=60)
+    with patch("image_hash.db") as mock_db:
+        mock_db.get_analysis_phashes.return_value = []
+        assert index.lookup([5], "p" * 64, 1) is None
+        index.add(5, "k1", "m", "p" * 64, {"title": "A 的結果"}, 1)
+        mock_db.get_analysis_result.return_value = {"title": "A 的結果"}
+        assert index.lookup([5], "p" * 64, 2) is None
+        assert index.lookup([5], "p" * 64, None) is None
+        assert index.lookup([5], "p" * 64, 1) == {"title": "A 的結果"}
+        index.add(5, "k2", "m", "p" * 64, {}, None)
+    assert mock_db.save_analysis_result.call_args.kwargs["user_id"] == 1
+    assert [c.args[1] for c in mock_db.get_analysis_phashes.call_args_list] == [1, 2]
+
+
+def test_near_duplicate_refresh_does_not_block_other_users():
+    index = NearDuplicateIndex(max_distance=2, refresh_seconds=60)
+    started, release = threading.Event(), threading.Event()
+
+    def phashes(prompt_sha256, user_id, since=None):
+        if user_id == 1:
+            started.set()
+            release.wait(5)
+        return [(5, f"k{user_id}")]
+
+    with patch("image_hash.db") as mock_db:
+        mock_db.get_analysis_phashes.side_effect = phashes
+        mock_db.get_analysis_result.return_value = {"title": "T"}
+        slow = threading.Thread(target=index.lookup, args=([5], "p" * 64, 1))
+        slow.start()
+        assert started.wait(5)
+        try:
+            # 使用者 1 的資料庫查詢尚未返回，使用者 2 仍可完成查詢
+            assert index.lookup([5], "p" * 64, 2) == {"title": "T"}
+        finally:
+            release.set()
+            slow.join(5)
+    assert not slow.is_alive()
+    assert mock_db.get_analysis_phashes.call_count == 2
+
+
+def test_near_duplicate_concurrent_refresh_of_same_key_queries_once():
+    index = NearDuplicateIndex(max_distance=2, refresh_seconds=60)
+    release = threading.Event()
+
+    def phashes(prompt_sha256, user_id, since=None):
+        release.wait(5)
+        return [(5, "k1")]
+
+    with patch("image_hash.db") as mock_db:
+        mock_db.get_analysis_phashes.side_effect = phashes
+        mock_db.get_analysis_result.return_value = {"title": "T"}
+        threads = [threading.Thread(target=index.lookup, args=([5], "p" * 64, 1)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        release.set()
+        for t in threads:
+            t.join(5)
+    assert mock_db.get_analysis_phashes.call_count == 1
@@ -0,0 +1,45 @@
+"""Tests for json_provider.py orjson-backed JSON provider."""
+import datetime
+import decimal
+
+import pytest
+
+pytest.importorskip("orjson")
+
+
+def test_app_uses_orjson_provider():
+    from app import app
+    from json_provider import OrjsonProvider
+    assert isinstance(app.json, OrjsonProvider)
+
+
+def test_datetimes_are_iso8601_utc(authed_client, mock_db):
+    mock_db.get_all_pets.return_value = [{
+        "id": 1, "name": "小黑", "birthday": datetime.date(2020, 5, 1),
+        "created_at": datetime.datetime(2026, 3, 1, 12, 30, 5), "updated_at": None,
+    }]
+    res = authed_client.get("/api/pets")
+    pet = res.get_json()["pets"][0]
+    assert pet["created_at"] == "2026-03-01T12:30:05Z"
+    assert pet["birthday"] == "2020-05-01"
+    assert pet["updated_at"] is None
+    assert "小黑".encode("utf-8") in res.data  # non-ASCII is not \\u-escaped
+
+
+def test_decimal_and_markup_are_serialized():
+    from markupsafe import Markup
+    from app import app
+    assert app.json.dumps({"a": decimal.Decimal("1.50"), "b": Markup("<b>")}) == '{"a":"1.50","b":"<b>"}'
+
+
+def test_request_json_is_parsed_with_provider(authed_client, mock_db):
+    mock_db.add_pet.return_value = 1
+    mock_db.get_pet.return_value = {"id": 1, "name": "小白"}
+    res = authed_client.post("/api/pets", json={"name": "小白"})
+    assert res.status_code == 201
+    assert mock_db.add_pet.call_args.kwargs["name"] == "小白"
+
+
+def test_invalid_request_json_returns_400(authed_client, mock_db):
+    res = authed_client.post("/api/pets", data="{not json", content_type="application/json")
+    assert res.status_code == 400
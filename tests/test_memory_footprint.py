@@ -0,0 +1,186 @@
+"""Memory-footprint regression tests: peak memory of one request, as a function of data size.
+
+Each endpoint is driven through the Flask test client with db.get_connection patched
+(rows come from a mock cursor) and the Ollama HTTP call stubbed. tracemalloc measures
+what Python allocates: row dicts, the JSON body, multipart parsing and the base64
+request body. It cannot see Pillow's native pixel buffers, so the analyze tests also
+sample the process RSS during the request, using high-resolution JPEG uploads whose
+decoded size is many times their file size. The ceilings allow about one copy of the
+payload plus headroom; an extra full copy of the images or the upload, or decoding
+the upload at full resolution, fails them.
+"""
+import base64
+import ctypes
+import datetime
+import gc
+import io
+import json
+import os
+import threading
+import time
+import tracemalloc
+from unittest.mock import MagicMock, patch
+
+import pytest
+from PIL import Image
+
+from tests.helpers import make_conn as _make_conn
+
+MB = 1024 * 1024
+KB = 1024
+_NOW = datetime.datetime(2026, 3, 1, 12, 0, 0)
+
+# 固定成本（Flask 請求、log、metrics 等）
+_BASE_BYTES = 2 * MB
+# 清單 API：每列圖片字串最多約 1.5 份（JSON 本文 + 暫時的緩衝），其餘欄位每列 4 KB
+_LIST_IMAGE_FACTOR = 1.5
+_LIST_ROW_BYTES = 4 * KB
+# 分析 API：base64 請求本文約為上傳的 4/3，另加解碼與縮圖的暫存
+_UPLOAD_FACTOR = 1.75
+# 分析 API 的 RSS 增量：配置器的雜訊，加上不到一次全解析度灰階解碼的 1/4（縮圖應以 draft 縮小解碼）
+_RSS_SLACK = 8 * MB
+_RSS_PIXEL_FACTOR = 0.25
+
+
+def _data_url(kb):
+    return "data:image/jpeg;base64," + base64.b64encode(os.urandom(kb * KB)).decode()
+
+
+def _diary_rows(rows, image_kb):
+    image = _data_url(image_kb)
+    return [{"id": i, "title": "散步日", "describe_text": "今天在公園追著球跑了好幾圈" * 10, "main_emotion": "開心",
+             "memo": "", "image_base64": image, "pet_id": 1, "user_id": 1, "created_at": _NOW, "updated_at": _NOW}
+            for i in range(rows)]
+
+
+def _pet_rows(rows, image_kb):
+    photo = _data_url(image_kb)
+    return [{"id": i, "name": "小黑", "breed": "柴犬", "birthday": datetime.date(2020, 1, 1),
+             "photo_base64": photo, "user_id": 1, "created_at": _NOW, "updated_at": _NOW}
+            for i in range(rows)]
+
+
+def _photo_jpeg(width, height):
+    """接近手機照片的 JPEG：隨機的低頻色塊加上細部雜訊，每次內容（與 dHash）都不同。"""
+    blocks = Image.frombytes("RGB", (8, 6), os.urandom(8 * 6 * 3)).resize((width, height), Image.BILINEAR)
+    grain = Image.merge("RGB", [Image.effect_noise((width, height), 40)] * 3)
+    buf = io.BytesIO()
+    Image.blend(blocks, grain, 0.3).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def _rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _rss_peak(send):
+    """請求期間以背景執行緒取樣 RSS，回傳相對請求前的最大增量（含 Pillow 的原生緩衝區）。"""
+    # 先把 glibc 留著的空閒記憶體還給系統，避免前一個測試釋放的緩衝區被重複使用而掩蓋增量
+    gc.collect()
+    ctypes.CDLL(None).malloc_trim(0)
+    baseline = _rss()
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], _rss())
+            time.sleep(0.0005)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    try:
+        response = send()
+    finally:
+        done.set()
+        sampler.join()
+    return max(peak[0], _rss()) - baseline, response
+
+
+def _peak(send):
+    """先送一次暖機（延遲 import、快取），再量測第二次請求的 tracemalloc 峰值。"""
+    send()
+    tracemalloc.start()
+    try:
+        response = send()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, response
+
+
+@pytest.fixture
+def user_client(authed_client):
+    from app import app
+    app._db_initialized = True
+    yield authed_client
+
+
+def _list_ceiling(rows, image_kb):
+    image_bytes = len(_data_url(image_kb))
+    return _BASE_BYTES + rows * (_LIST_IMAGE_FACTOR * image_bytes + _LIST_ROW_BYTES)
+
+
+@pytest.mark.parametrize("rows,image_kb", [(10, 100), (100, 100), (50, 400)])
+def test_diaries_list_peak(user_client, rows, image_kb):
+    conn, _ = _make_conn(fetchall=_diary_rows(rows, image_kb))
+    with patch("db.get_connection", return_value=conn):
+        peak, response = _peak(lambda: user_client.get("/api/diaries"))
+    assert response.status_code == 200
+    assert len(response.get_json()["diaries"]) == rows
+    assert peak < _list_ceiling(rows, image_kb), f"peak {peak / MB:.1f} MB"
+
+
+@pytest.mark.parametrize("rows,image_kb", [(20, 100), (100, 200)])
+def test_pets_list_peak(user_client, rows, image_kb):
+    conn, _ = _make_conn(fetchall=_pet_rows(rows, image_kb))
+    with patch("db.get_connection", return_value=conn):
+        peak, response = _peak(lambda: user_client.get("/api/pets"))
+    assert response.status_code == 200
+    assert peak < _list_ceiling(rows, image_kb), f"peak {peak / MB:.1f} MB"
+
+
+def test_field_selection_keeps_images_out_of_the_response(user_client):
+    conn, _ = _make_conn(fetchall=_diary_rows(200, 100))
+    with patch("db.get_connection", return_value=conn):
+        peak, response = _peak(lambda: user_client.get("/api/diaries?fields=id,title"))
+    assert response.status_code == 200
+    assert peak < _BASE_BYTES + 200 * _LIST_ROW_BYTES, f"peak {peak / MB:.1f} MB"
+
+
+@pytest.fixture
+def model_ok():
+    """模型 HTTP 呼叫回傳固定結果；回應本身很小，峰值只反映上傳與請求本文。"""
+    response = MagicMock(status_code=200)
+    response.json.return_value = {"response": json.dumps({
+        "title": "低敏配方飼料", "summary": "這是一款適合成犬的低敏配方飼料，含多種營養" * 3,
+        "describe": "在公園裡開心地奔跑", "main_emotion": "開心",
+    }, ensure_ascii=False)}
+    conn, _ = _make_conn()
+    with patch("db.get_connection", return_value=conn), \
+            patch("model_connector.requests.post", return_value=response) as post:
+        yield post
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="needs /proc/self/statm and glibc")
+@pytest.mark.parametrize("endpoint", ["/api/product/analyze", "/api/diary/analyze"])
+@pytest.mark.parametrize("width,height", [(1600, 1200), (4000, 3000)])
+def test_analyze_upload_peak(user_client, model_ok, endpoint, width, height):
+    # 每次上傳不同的圖片，避免量測的請求直接沿用近似重複圖片的結果
+    uploads = [_photo_jpeg(width, height) for _ in range(3)]
+    size = len(uploads[0])
+
+    def send():
+        return user_client.post(endpoint, data={"image": (io.BytesIO(uploads.pop()), "photo.jpg")},
+                                content_type="multipart/form-data")
+
+    peak, response = _peak(send)
+    assert response.status_code == 200
+    assert peak < _BASE_BYTES + _UPLOAD_FACTOR * size, f"peak {peak / MB:.1f} MB for a {size / MB:.1f} MB upload"
+
+    rss, response = _rss_peak(send)
+    assert response.status_code == 200
+    assert model_ok.call_count == 3
+    ceiling = _RSS_SLACK + _RSS_PIXEL_FACTOR * width * height
+    assert rss < ceiling, f"RSS grew {rss / MB:.1f} MB for a {width}x{height} upload"
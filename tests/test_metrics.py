@@ -0,0 +1,104 @@
+"""Tests for metrics.py and the /metrics endpoint."""
+from unittest.mock import patch
+
+import pytest
+import requests
+
+import metrics
+
+
+def test_counter_renders_total_family():
+    registry = metrics.Registry()
+    c = registry.counter("jobs", "Jobs run.", ("kind",))
+    c.inc(kind="a")
+    c.inc(2, kind="a")
+    text = registry.render()
+    assert "# TYPE jobs_total counter" in text
+    assert 'jobs_total{kind="a"} 3' in text
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    h = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    for v in (0.05, 0.5, 5):
+        h.observe(v)
+    text = registry.render()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_sum 5.55" in text
+    assert "latency_seconds_count 3" in text
+
+
+def test_label_values_are_escaped_and_checked():
+    registry = metrics.Registry()
+    c = registry.counter("errors", "Errors.", ("message",))
+    c.inc(message='bad "quote"\n')
+    assert 'errors_total{message="bad \\"quote\\"\\n"} 1' in registry.render()
+    with pytest.raises(ValueError):
+        c.inc(other="x")
+
+
+def test_metrics_endpoint_reports_requests(client, mock_db):
+    client.get("/healthz")
+    with patch("app._METRICS_TOKEN", "s3cret"):
+        res = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert res.status_code == 200
+    assert res.mimetype == "text/plain"
+    text = res.get_data(as_text=True)
+    assert 'http_requests_total{endpoint="healthz",method="GET",status="200"}' in text
+    assert "process_resident_memory_bytes" in text
+    assert "model_scheduler_active" in text
+
+
+def test_metrics_endpoint_requires_token(client, mock_db):
+    with patch("app._METRICS_TOKEN", "s3cret"):
+        assert client.get("/metrics").status_code == 401
+        assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+
+def test_metrics_endpoint_is_disabled_without_token(client, mock_db):
+    with patch("app._METRICS_TOKEN", ""):
+        assert client.get("/metrics", headers={"Authorization": "Bearer "}).status_code == 404
+
+
+def test_upload_size_is_recorded(authed_client, mock_db):
+    before = metrics.HTTP_UPLOAD_BYTES.count(endpoint="api_add_pet")
+    mock_db.add_pet.return_value = 1
+    mock_db.get_pet.return_value = {"id": 1, "name": "小黑"}
+    authed_client.post("/api/pets", json={"name": "小黑"})
+    assert metrics.HTTP_UPLOAD_BYTES.count(endpoint="api_add_pet") == before + 1
+
+
+def test_db_functions_record_calls_and_queries():
+    import db
+    from tests.helpers import make_conn
+
+    class _Base:
+        def execute(self, query, args=None):
+            return 1
+
+    class _Cursor(db._TimedQueries, _Base):
+        pass
+
+    conn, cur = make_conn(fetchone=None)
+    cur.execute.side_effect = _Cursor().execute
+    calls = metrics.DB_CALLS.value(function="get_product", outcome="ok")
+    queries = metrics.DB_QUERY_DURATION.count(function="get_product")
+    with patch("db.get_connection", return_value=conn):
+        db.get_product(1, user_id=1)
+    assert metrics.DB_CALLS.value(function="get_product", outcome="ok") == calls + 1
+    assert metrics.DB_QUERY_DURATION.count(function="get_product") == queries + 1
+
+
+def test_model_retries_and_failures_are_counted():
+    import model_connector
+    retries = metrics.MODEL_RETRIES.value()
+    failures = metrics.MODEL_FAILURES.value(reason="request")
+    attempts = metrics.MODEL_ATTEMPT_DURATION.count(outcome="network_error")
+    with patch("model_connector.requests.post", side_effect=requests.exceptions.ConnectionError("down")), \
+            patch("time.sleep"):
+        assert model_connector._call_model_with_retry(b"{}") is None
+    assert metrics.MODEL_RETRIES.value() == retries + 2
+    assert metrics.MODEL_FAILURES.value(reason="request") == failures + 1
+    assert metrics.MODEL_ATTEMPT_DURATION.count(outcome="network_error") == attempts + 3
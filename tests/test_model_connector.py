@@ -180,3 +180,307 @@ def test_get_model_response_by_image_non_dict_result():
         result = model_connector.get_model_response_by_image("model", b"img")
     assert result is not None
     assert result.get("title") == "解析失敗"
+
+
+def test_build_image_payload_matches_json_encoding():
+    import json
+    import model_connector
+    data = bytes(range(256)) * 3 + b"x"
+    body = model_connector._build_image_payload("model", "提示", data)
+    assert json.loads(body) == {
+        "model": "model",
+        "prompt": "提示",
+        "stream": False,
+        "images": [base64.b64encode(data).decode("utf-8")],
+    }
+
+
+def test_build_image_payload_streams_file_object_in_chunks():
+    import json
+    import model_connector
+    from io import BytesIO
+    data = b"0123456789" * (model_connector._B64_CHUNK_SIZE // 7)
+    body = model_connector._build_image_payload("model", "p", BytesIO(data))
+    assert json.loads(body)["images"] == [base64.b64encode(data).decode("utf-8")]
+
+
+def test_build_image_payload_from_path(tmp_path):
+    import json
+    import model_connector
+    f = tmp_path / "img.png"
+    f.write_bytes(b"pixels")
+    body = model_connector._build_image_payload("model", "p", str(f))
+    assert json.loads(body)["images"] == [base64.b64encode(b"pixels").decode("utf-8")]
+
+
+def test_get_model_response_by_image_posts_prebuilt_body():
+    import json
+    import model_connector
+    mock_resp = MagicMock()
+    mock_resp.status_code = 200
+    mock_resp.json.return_value = {"response": '{"title": "T"}'}
+    with patch("requests.post", return_value=mock_resp) as post:
+        model_connector.get_model_response_by_image("model", b"imgdata", "p")
+    kwargs = post.call_args.kwargs
+    assert "json" not in kwargs
+    assert kwargs["headers"]["Content-Type"] == "application/json"
+    assert json.loads(kwargs["data"])["images"] == [base64.b64encode(b"imgdata").decode("utf-8")]
+
+
+def test_identical_concurrent_image_requests_share_one_model_call():
+    import threading
+    import time
+    import model_connector
+    calls = []
+
+    def slow_call(body, parse_response=False):
+        calls.append(body)
+        time.sleep(0.2)
+        return {"title": "T"}
+
+    results = []
+    with patch("model_connector._call_model_with_retry", side_effect=slow_call):
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                model_connector.get_model_response_by_image("model", b"same", "p")))
+            for _ in range(3)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+    assert len(calls) == 1
+    assert results == [{"title": "T"}] * 3
+
+
+def test_different_prompts_are_not_coalesced():
+    import model_connector
+    with patch("model_connector._call_model_with_retry", return_value={"title": "T"}) as call:
+        model_connector.get_model_response_by_image("model", b"same", "p1")
+        model_connector.get_model_response_by_image("model", b"same", "p2")
+    assert call.call_count == 2
+
+
+def test_cross_worker_mode_reuses_stored_result():
+    import model_connector
+    with patch("model_connector._SINGLEFLIGHT_MYSQL", True), \
+         patch("model_connector.db") as mock_db, \
+         patch("model_connector._call_model_with_retry") as call:
+        mock_db.get_analysis_result.return_value = {"title": "cached"}
+        result = model_connector.get_model_response_by_image("model", b"img", "p")
+    assert result == {"title": "cached"}
+    call.assert_not_called()
+    mock_db.claim_analysis.assert_not_called()
+
+
+def test_cross_worker_mode_stores_new_result():
+    import model_connector
+    with patch("model_connector._SINGLEFLIGHT_MYSQL", True), \
+         patch("model_connector.db") as mock_db, \
+         patch("model_connector._call_model_with_retry", return_value={"title": "new"}):
+        mock_db.get_analysis_result.return_value = None
+        mock_db.claim_analysis.return_value = True
+        result = model_connector.get_model_response_by_image("model", b"img", "p")
+    assert result == {"title": "new"}
+    key, model, stored = mock_db.save_analysis_result.call_args[0]
+    assert len(key) == 64 and model == "model" and stored == {"title": "new"}
+    mock_db.release_analysis_claim.assert_called_once_with(key)
+
+
+def test_cross_worker_mode_waiter_polls_for_result():
+    import model_connector
+    with patch("model_connector._SINGLEFLIGHT_MYSQL", True), \
+         patch("model_connector._SINGLEFLIGHT_POLL_SECONDS", 0), \
+         patch("model_connector.db") as mock_db, \
+         patch("model_connector._call_model_with_retry") as call:
+        mock_db.get_analysis_result.side_effect = [None, None, {"title": "other"}]
+        mock_db.claim_analysis.return_value = False
+        result = model_connector.get_model_response_by_image("model", b"img", "p")
+    assert result == {"title": "other"}
+    call.assert_not_called()
+    mock_db.release_analysis_claim.assert_not_called()
+
+
+def test_cross_worker_mode_calls_model_after_wait_timeout():
+    import model_connector
+    with patch("model_connector._SINGLEFLIGHT_MYSQL", True), \
+         patch("model_connector._SINGLEFLIGHT_LOCK_TIMEOUT", 0), \
+         patch("model_connector.db") as mock_db, \
+         patch("model_connector._call_model_with_retry", return_value={"title": "own"}):
+        mock_db.get_analysis_result.return_value = None
+        mock_db.claim_analysis.return_value = False
+        result = model_connector.get_model_response_by_image("model", b"img", "p")
+    assert result == {"title": "own"}
+    mock_db.save_analysis_result.assert_not_called()
+
+
+def test_cross_worker_mode_releases_claim_on_error():
+    import model_connector
+    with patch("model_connector._SINGLEFLIGHT_MYSQL", True), \
+         patch("model_connector.db") as mock_db, \
+         patch("model_connector._call_model_with_retry", side_effect=RuntimeError("boom")):
+        mock_db.get_analysis_result.return_value = None
+        mock_db.claim_analysis.return_value = True
+        try:
+            model_connector.get_model_response_by_image("model", b"img", "p")
+        except RuntimeError:
+            pass
+    mock_db.release_analysis_claim.assert_called_once()
+
+
+def test_diary_analysis_is_scheduled_with_diary_priority():
+    import model_connector
+    with patch("model_connector.scheduler") as sched, \
+         patch("model_connector._call_model_with_retry", return_value={"main_emotion": "Z"}):
+        model_connector.get_diary_response_by_image("model", b"diary-img", user_id=5)
+    sched.slot.assert_called_once_with(5, "diary")
+
+
+def _models_called(post):
+    import json
+    return [json.loads(c.kwargs["data"])["model"] for c in post.call_args_list]
+
+
+def _ollama_resp(inner):
+    resp = MagicMock()
+    resp.status_code = 200
+    resp.json.return_value = {"response": inner}
+    return resp
+
+
+def test_cascade_stops_at_first_valid_tier():
+    import model_connector
+    good = '{"title": "飼料", "summary": "這是一款適合成犬的低敏配方飼料，含多種營養"}'
+    with patch("requests.post", return_value=_ollama_resp(good)) as post:
+        result = model_connector.get_model_response_by_image(["small", "large"], b"cascade-1", "p")
+    assert result["title"] == "飼料"
+    assert _models_called(post) == ["small"]
+
+
+def test_cascade_escalates_on_missing_field_and_short_text():
+    import metrics
+    import model_connector
+    served_before = metrics.MODEL_CASCADE_CALLS.value(model="l", outcome="served")
+    responses = [
+        _ollama_resp('{"title": "飼料"}'),
+        _ollama_resp('{"title": "飼料", "summary": "太短"}'),
+        _ollama_resp('{"title": "飼料", "summary": "這是一款適合成犬的低敏配方飼料，含多種營養"}'),
+    ]
+    with patch("requests.post", side_effect=responses) as post:
+        result = model_connector.get_model_response_by_image(["s", "m", "l"], b"cascade-2", "p")
+    assert _models_called(post) == ["s", "m", "l"]
+    assert result["summary"].startswith("這是一款")
+    stats = model_connector.cascade_stats()
+    assert stats["s"]["escalated"].get("schema", 0) >= 1
+    assert stats["m"]["escalated"].get("quality", 0) >= 1
+    assert stats["l"]["served"] >= 1
+    assert metrics.MODEL_CASCADE_CALLS.value(model="l", outcome="served") == served_before + 1
+    assert metrics.MODEL_CASCADE_CALLS.value(model="s", outcome="schema") >= 1
+    assert metrics.MODEL_CASCADE_DURATION.count(model="m") >= 1
+    assert 'model_cascade_calls_total{model="m",outcome="quality"}' in metrics.render()
+
+
+def test_cascade_returns_last_non_empty_result_when_all_tiers_fail():
+    import model_connector
+    with patch("model_connector._call_model_with_retry", side_effect=[{"title": "T"}, None]):
+        result = model_connector.get_model_response_by_image(["s", "l"], b"cascade-3", "p")
+    assert result == {"title": "T"}
+
+
+def test_quality_issue_rejects_template_echo():
+    import model_connector
+    assert model_connector._quality_issue({"title": "str", "summary": "str"}, ("title",)) == "quality"
+    assert model_connector._quality_issue(None, ("title",)) == "empty"
+    assert model_connector._quality_issue({"title": "貓砂"}, ("title",)) is None
+
+
+def test_near_duplicate_result_skips_model_call():
+    import model_connector
+    with patch("model_connector.image_hash.dhash_variants", return_value=[1, 2, 3, 4]), \
+         patch("model_connector.image_hash.near_duplicates") as index, \
+         patch("model_connector._call_model_with_retry") as call:
+        index.lookup.return_value = {"title": "既有結果"}
+        result = model_connector.get_model_response_by_image("model", b"img", "p", user_id=7)
+    assert result == {"title": "既有結果"}
+    assert index.lookup.call_args[0][2] == 7
+    call.assert_not_called()
+
+
+def test_valid_result_is_added_to_near_duplicate_index():
+    import model_connector
+    good = {"title": "飼料", "summary": "這是一款適合成犬的低敏配方飼料，含多種營養"}
+    with patch("model_connector.image_hash.dhash_variants", return_value=[9, 8, 7, 6]), \
+         patch("model_connector.image_hash.near_duplicates") as index, \
+         patch("model_connector._call_model_with_retry", return_value=good):
+        index.lookup.return_value = None
+        model_connector.get_model_response_by_image("model", b"img-nd", "p", user_id=7)
+    phash, request_key, model, prompt_sha, stored, user_id = index.add.call_args[0]
+    assert phash == 9 and model == "model" and stored == good and user_id == 7
+
+
+def test_near_duplicate_entry_records_the_tier_that_answered():
+    import hashlib
+    import model_connector
+    good = {"title": "飼料", "summary": "這是一款適合成犬的低敏配方飼料，含多種營養"}
+    with patch("model_connector.image_hash.dhash_variants", return_value=[9, 8, 7, 6]), \
+         patch("model_connector.image_hash.near_duplicates") as index, \
+         patch("model_connector._call_model_with_retry", side_effect=[{"title": "飼料"}, good]) as call:
+        index.lookup.return_value = None
+        model_connector.get_model_response_by_image(["small", "large"], b"img-tier", "p", user_id=7)
+    _, request_key, model, _, stored, _ = index.add.call_args[0]
+    large_body = call.call_args_list[1][0][0]
+    assert model == "large" and stored == good
+    assert request_key == hashlib.sha256(large_body).hexdigest()
+
+
+def test_anonymous_analysis_skips_near_duplicate_index():
+    import model_connector
+    with patch("model_connector.image_hash.dhash_variants") as dhash, \
+         patch("model_connector.image_hash.near_duplicates") as index, \
+         patch("model_connector._call_model_with_retry", return_value={"title": "T", "summary": "S" * 30}):
+        model_connector.get_model_response_by_image("model", b"img-anon", "p")
+    dhash.assert_not_called()
+    index.add.assert_not_called()
+
+
+def test_build_images_payload_packs_images_in_order():
+    import json
+    import model_connector
+    body = model_connector._build_images_payload("model", "p", [b"one", b"two!"])
+    assert json.loads(body)["images"] == [
+        base64.b64encode(b"one").decode("utf-8"),
+        base64.b64encode(b"two!").decode("utf-8"),
+    ]
+
+
+def test_get_model_response_by_images_returns_items():
+    import model_connector
+    summary = "以新鮮雞肉製成的成貓配方，不含穀物與人工色素"
+    items = [{"title": "A", "summary": summary}, {"title": "B", "summary": summary}]
+    with patch("model_connector._call_model_with_retry", return_value={"items": items}):
+        result = model_connector.get_model_response_by_images("model", [b"a", b"b"], "p")
+    assert result == items
+
+
+def test_get_model_response_by_images_rejects_items_that_fail_validation():
+    import model_connector
+    items = [{"title": "A", "summary": "以新鮮雞肉製成的成貓配方，不含穀物與人工色素"},
+             {"title": "", "summary": ""}, "解析不了"]
+    with patch("model_connector._call_model_with_retry", return_value={"items": items}):
+        result = model_connector.get_model_response_by_images("model", [b"a", b"b", b"c"], "p")
+    assert result == [items[0], None, None]
+
+
+def test_get_model_response_by_images_count_mismatch_returns_none():
+    import model_connector
+    with patch("model_connector._call_model_with_retry", return_value={"items": [{"title": "A"}]}):
+        assert model_connector.get_model_response_by_images("model", [b"a", b"b2"], "p") is None
+
+
+def test_ping_queries_tags_endpoint_on_ollama_host():
+    import model_connector
+    with patch.object(model_connector, "url", "http://ollama:11434/api/generate"), \
+            patch("model_connector.requests.get") as get:
+        model_connector.ping(timeout=1.5)
+    get.assert_called_once_with("http://ollama:11434/api/tags", timeout=1.5)
+    get.return_value.raise_for_status.assert_called_once()
@@ -0,0 +1,89 @@
+"""Tests for model_scheduler.py fair, priority-aware scheduling."""
+import threading
+import time
+
+import pytest
+
+from model_scheduler import FairScheduler
+
+
+def _wait_queued(sched, n):
+    deadline = time.monotonic() + 5
+    while sum(sched.stats()["queued"].values()) < n:
+        assert time.monotonic() < deadline, "tickets were not enqueued"
+        time.sleep(0.005)
+
+
+def _run_order(sched, requests):
+    """Hold the only slot, enqueue requests in order, then record the grant order."""
+    order = []
+    blocker = sched.slot(None, "diary")
+    blocker.__enter__()
+    threads = []
+    for label, user, priority in requests:
+        def work(label=label, user=user, priority=priority):
+            with sched.slot(user, priority):
+                order.append(label)
+        t = threading.Thread(target=work)
+        t.start()
+        threads.append(t)
+        _wait_queued(sched, len(threads))
+    blocker.__exit__(None, None, None)
+    for t in threads:
+        t.join(5)
+    return order
+
+
+def test_higher_priority_runs_first():
+    sched = FairScheduler(1)
+    order = _run_order(sched, [
+        ("batch", 1, "batch"),
+        ("product", 1, "product"),
+        ("diary", 2, "diary"),
+    ])
+    assert order == ["diary", "product", "batch"]
+
+
+def test_users_are_served_round_robin_within_priority():
+    sched = FairScheduler(1)
+    order = _run_order(sched, [
+        ("a1", "a", "product"),
+        ("a2", "a", "product"),
+        ("a3", "a", "product"),
+        ("b1", "b", "product"),
+    ])
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_concurrency_cap_is_respected():
+    sched = FairScheduler(2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with sched.slot(None, "product"):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert max(peak) == 2
+    stats = sched.stats()
+    assert stats["active"] == 0
+    assert stats["granted"]["product"] == 6
+    assert stats["wait_seconds_max"]["product"] > 0
+
+
+def test_unknown_priority_raises():
+    sched = FairScheduler(1)
+    with pytest.raises(ValueError):
+        with sched.slot(None, "urgent"):
+            pass
@@ -0,0 +1,136 @@
+"""Tests for profiling.py per-request profiles and /debug/profiles."""
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = profiling.ProfileStore(str(tmp_path), keep=2)
+    with patch("profiling.TOKEN", "s3cret"), patch("profiling.store", store), \
+            patch("profiling.INTERVAL", 0.001):
+        yield store
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_request_profile_samples_target_thread():
+    profile = profiling.RequestProfile(threading.get_ident(), interval=0.001).start()
+    _busy(0.05)
+    profile.stop()
+    assert profile.samples > 0
+    assert any("test_profiling.py:_busy" in stack for stack in profile.views["wall"])
+    assert sum(profile.views["cpu"].values()) > 0
+
+
+def test_profile_header_writes_folded_files(authed_client, mock_db, store):
+    mock_db.get_all_diaries.side_effect = lambda *a, **k: _busy(0.02) or []
+    res = authed_client.get("/api/diaries", headers={"X-Profile": "s3cret"})
+    profile_id = res.headers["X-Profile-Id"]
+    assert "-api_get_diaries-" in profile_id
+    wall = open(os.path.join(store.directory, f"{profile_id}.wall.folded"), encoding="utf-8").read()
+    assert "_busy" in wall
+    stack, weight = wall.splitlines()[0].rsplit(" ", 1)
+    assert int(weight) > 0 and ";" in stack
+
+
+def test_wrong_or_missing_token_is_not_profiled(authed_client, mock_db, store):
+    mock_db.get_all_diaries.return_value = []
+    assert "X-Profile-Id" not in authed_client.get("/api/diaries", headers={"X-Profile": "nope"}).headers
+    assert "X-Profile-Id" not in authed_client.get("/api/diaries").headers
+    # token 不可經由網址參數傳遞（會寫進存取 log 與 Referer）
+    assert "X-Profile-Id" not in authed_client.get("/api/diaries?_profile=s3cret").headers
+    assert os.listdir(store.directory) == []
+
+
+def test_store_keeps_newest_profiles(store):
+    profile = profiling.RequestProfile(0)
+    profile.views["wall"]["a;b"] = 5
+    ids = []
+    for _ in range(3):
+        ids.append(store.save(profile, "api_diaries"))
+        time.sleep(0.01)
+    names = sorted(os.listdir(store.directory))
+    assert len(names) == 2 * len(profiling.VIEWS)
+    assert not any(name.startswith(ids[0]) for name in names)
+
+
+def test_download_requires_token(client, mock_db, store):
+    profile = profiling.RequestProfile(0)
+    profile.views["wall"]["a;b"] = 5
+    name = store.save(profile, "x") + ".wall.folded"
+    assert client.get(f"/debug/profiles/{name}").status_code == 401
+    res = client.get(f"/debug/profiles/{name}", headers={"Authorization": "Bearer s3cret"})
+    assert res.status_code == 200
+    assert res.data == b"a;b 5\n"
+    missing = client.get("/debug/profiles/app.py", headers={"Authorization": "Bearer s3cret"})
+    assert missing.status_code == 404
+    mock_db.init_db.assert_not_called()
+
+
+def _sample_busy_thread(sampler, register):
+    stop = threading.Event()
+
+    def spin():
+        while not stop.is_set():
+            pass
+
+    worker = threading.Thread(target=spin)
+    worker.start()
+    try:
+        if register:
+            sampler.request_started(worker.ident)
+        for _ in range(3):
+            time.sleep(0.02)
+            sampler.sample()
+    finally:
+        stop.set()
+        worker.join()
+
+
+def test_sampler_wall_view_only_counts_request_threads():
+    sampler = profiling.SamplingProfiler(interval=0)
+    _sample_busy_thread(sampler, register=False)
+    assert not any("spin" in stack for stack in sampler.folded("wall"))
+    _sample_busy_thread(sampler, register=True)
+    assert any("spin" in stack for stack in sampler.folded("wall"))
+
+
+@pytest.mark.skipif(profiling._thread_cpu_ns(threading.get_native_id()) is None, reason="needs /proc schedstat")
+def test_sampler_cpu_view_weights_by_thread_cpu_time():
+    sampler = profiling.SamplingProfiler(interval=0)
+    _sample_busy_thread(sampler, register=False)
+    cpu = sampler.folded("cpu")
+    busy = sum(weight for stack, weight in cpu.items() if "test_profiling.py:_sample_busy_thread.<locals>.spin" in stack)
+    assert busy > 0
+
+
+def test_sampler_windows_expire_after_retention():
+    now = [600.0]
+    sampler = profiling.SamplingProfiler(interval=0, retention=120, clock=lambda: now[0])
+    sampler._add({"old;stack": 5}, {})
+    now[0] += 300
+    sampler._add({"new;stack": 7}, {})
+    assert sampler.folded("wall", seconds=600) == {"new;stack": 7}
+    assert sampler.folded("wall", seconds=60) == {"new;stack": 7}
+
+
+def test_debug_profile_serves_aggregate(client, mock_db, store):
+    sampler = profiling.SamplingProfiler(interval=0)
+    sampler._add({"app.py:login;security.py:check_password_hash": 300}, {"a;b": 20})
+    with patch("profiling.sampler", sampler):
+        assert client.get("/debug/profile").status_code == 401
+        headers = {"Authorization": "Bearer s3cret"}
+        res = client.get("/debug/profile?view=wall&seconds=600", headers=headers)
+        assert res.data == b"app.py:login;security.py:check_password_hash 300\n"
+        assert client.get("/debug/profile?view=cpu", headers=headers).data == b"a;b 20\n"
+        assert client.get("/debug/profile?view=heap", headers=headers).status_code == 400
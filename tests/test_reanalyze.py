@@ -0,0 +1,129 @@
+"""Tests for the reanalyze.py bulk re-analysis CLI."""
+import base64
+import json
+from unittest.mock import patch
+
+import pytest
+
+import reanalyze
+
+
+def _row(diary_id, data=b"img"):
+    return {"id": diary_id, "user_id": 1, "image_base64": "data:image/png;base64," + base64.b64encode(data).decode()}
+
+
+def test_decode_image_accepts_data_url_and_plain_base64():
+    assert reanalyze.decode_image("data:image/png;base64," + base64.b64encode(b"abc").decode()) == b"abc"
+    assert reanalyze.decode_image(base64.b64encode(b"xyz").decode()) == b"xyz"
+
+
+def test_run_writes_batches_and_checkpoint(tmp_path):
+    checkpoint = tmp_path / "ckpt.json"
+
+    def analyze(models, image, user_id=None, priority=None, reuse_near_duplicates=True):
+        assert priority == "batch" and reuse_near_duplicates is False
+        return None if image == b"bad" else {"describe": f"desc-{image.decode()}", "main_emotion": "開心"}
+
+    rows = [_row(1, b"a"), _row(2, b"bad"), _row(3, b"c")]
+    with patch("reanalyze.db") as mock_db, \
+         patch("reanalyze.model_connector.get_diary_response_by_image", side_effect=analyze):
+        mock_db.count_diaries_with_image.return_value = 3
+        mock_db.iter_diaries_with_image.return_value = iter(rows)
+        r = reanalyze.Reanalyzer("m", 2, 2, str(checkpoint), reanalyze.load_checkpoint(str(checkpoint)))
+        state = r.run()
+
+    written = [row for c in mock_db.update_diary_analyses.call_args_list for row in c[0][0]]
+    assert sorted(written, key=lambda x: x[2]) == [("desc-a", "開心", 1), ("desc-c", "開心", 3)]
+    assert state["last_id"] == 3
+    assert state["failed"] == [2]
+    assert json.loads(checkpoint.read_text()) == state
+
+
+def test_unexpected_errors_fail_only_that_diary(tmp_path):
+    checkpoint = tmp_path / "ckpt.json"
+
+    def analyze(models, image, **kwargs):
+        if image == b"boom":
+            raise RuntimeError("Lost connection to MySQL server")
+        return {"describe": "ok", "main_emotion": "開心"}
+
+    with patch("reanalyze.db") as mock_db, \
+         patch("reanalyze.model_connector.get_diary_response_by_image", side_effect=analyze):
+        mock_db.count_diaries_with_image.return_value = 3
+        mock_db.iter_diaries_with_image.return_value = iter([_row(1), _row(2, b"boom"), _row(3)])
+        state = reanalyze.Reanalyzer("m", 1, 10, str(checkpoint), reanalyze.load_checkpoint(str(checkpoint))).run()
+    assert state["failed"] == [2]
+    assert state["updated"] == 2
+    assert state["last_id"] == 3
+
+
+def test_run_saves_finished_work_when_reading_rows_fails(tmp_path):
+    checkpoint = tmp_path / "ckpt.json"
+
+    def rows():
+        yield _row(1)
+        yield _row(2)
+        raise RuntimeError("Lost connection to MySQL server")
+
+    with patch("reanalyze.db") as mock_db, \
+         patch("reanalyze.model_connector.get_diary_response_by_image",
+               return_value={"describe": "ok", "main_emotion": "開心"}):
+        mock_db.count_diaries_with_image.return_value = 5
+        mock_db.iter_diaries_with_image.return_value = rows()
+        r = reanalyze.Reanalyzer("m", 1, 50, str(checkpoint), reanalyze.load_checkpoint(str(checkpoint)))
+        with pytest.raises(RuntimeError):
+            r.run()
+
+    written = [row[2] for c in mock_db.update_diary_analyses.call_args_list for row in c[0][0]]
+    assert written == [1, 2]
+    assert json.loads(checkpoint.read_text())["last_id"] == 2
+
+
+def test_main_resumes_from_checkpoint(tmp_path):
+    checkpoint = tmp_path / "ckpt.json"
+    checkpoint.write_text(json.dumps({"last_id": 41, "updated": 5, "failed": []}))
+    with patch("reanalyze.db") as mock_db, patch("reanalyze.logging.basicConfig"):
+        mock_db.count_diaries_with_image.return_value = 0
+        mock_db.iter_diaries_with_image.return_value = iter([])
+        reanalyze.main(["--checkpoint", str(checkpoint), "--model", "qwen3-vl:4b"])
+    mock_db.iter_diaries_with_image.assert_called_once_with(41, None)
+
+
+def test_main_restart_ignores_checkpoint(tmp_path):
+    checkpoint = tmp_path / "ckpt.json"
+    checkpoint.write_text(json.dumps({"last_id": 41, "updated": 5, "failed": []}))
+    with patch("reanalyze.db") as mock_db, patch("reanalyze.logging.basicConfig"):
+        mock_db.count_diaries_with_image.return_value = 0
+        mock_db.iter_diaries_with_image.return_value = iter([])
+        reanalyze.main(["--checkpoint", str(checkpoint), "--restart"])
+    mock_db.iter_diaries_with_image.assert_called_once_with(0, None)
+
+
+def test_retry_failed_keeps_last_id_and_records_remaining_failures(tmp_path):
+    checkpoint = tmp_path / "ckpt.json"
+    state = {"last_id": 90, "updated": 5, "failed": [3, 7, 8]}
+    diaries = {3: _row(3, b"a"), 7: _row(7, b"bad")}
+
+    def analyze(models, image, **kwargs):
+        return None if image == b"bad" else {"describe": "ok", "main_emotion": "開心"}
+
+    with patch("reanalyze.db") as mock_db, \
+         patch("reanalyze.model_connector.get_diary_response_by_image", side_effect=analyze):
+        mock_db.get_diary.side_effect = lambda diary_id, fields=None: diaries.get(diary_id)
+        r = reanalyze.Reanalyzer("m", 2, 10, str(checkpoint), state)
+        state = r.retry_failed()
+
+    written = [row for c in mock_db.update_diary_analyses.call_args_list for row in c[0][0]]
+    assert written == [("ok", "開心", 3)]
+    assert state["last_id"] == 90
+    assert state["failed"] == [7]
+    assert state["updated"] == 6
+    mock_db.iter_diaries_with_image.assert_not_called()
+
+
+def test_main_defaults_to_one_worker(tmp_path):
+    with patch("reanalyze.Reanalyzer") as reanalyzer, patch("reanalyze.logging.basicConfig"):
+        reanalyze.main(["--checkpoint", str(tmp_path / "ckpt.json"), "--retry-failed"])
+    assert reanalyzer.call_args[0][1] == 1
+    reanalyzer.return_value.retry_failed.assert_called_once_with(limit=None)
+    reanalyzer.return_value.run.assert_not_called()
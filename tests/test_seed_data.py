@@ -0,0 +1,130 @@
+"""Tests for benchmarks.seed_data synthetic dataset generation."""
+from collections import Counter
+
+from werkzeug.security import check_password_hash
+
+from benchmarks import seed_data
+from tests.helpers import make_conn as _make_conn
+
+_START = dict.fromkeys(("users", "pets", "products", "pet_diaries"), 1)
+
+
+def _rows(config, start=_START):
+    return list(seed_data.generate(config, start))
+
+
+def test_generation_is_deterministic_per_seed():
+    config = seed_data.SeedConfig(users=5, image_kb=2)
+    assert _rows(config) == _rows(config)
+    assert _rows(config) != _rows(seed_data.SeedConfig(users=5, image_kb=2, seed=7))
+
+
+def test_password_hash_is_reproducible_and_verifiable():
+    rows = _rows(seed_data.SeedConfig(users=2, image_kb=0, password="s3cret"))
+    hashed, other = [row[2] for table, row in rows if table == "users"]
+    assert hashed == other == seed_data.password_hash("s3cret", "bench42")
+    assert check_password_hash(hashed, "s3cret")
+    assert not check_password_hash(hashed, "benchmark")
+
+
+def test_rows_reference_their_owner_and_pets():
+    rows = _rows(seed_data.SeedConfig(users=20, image_kb=2, unassigned_ratio=0.3))
+    pets = {row[0]: row[1] for table, row in rows if table == "pets"}
+    users = {row[0] for table, row in rows if table == "users"}
+    assert users == set(range(1, 21))
+    for table, row in rows:
+        if table == "products":
+            pet_id, user_id = row[3], row[4]
+        elif table == "pet_diaries":
+            pet_id, user_id = row[6], row[7]
+        else:
+            continue
+        assert user_id in users
+        assert pet_id is None or pets[pet_id] == user_id
+
+
+def test_counts_follow_configured_means():
+    config = seed_data.SeedConfig(users=400, products_mean=30, diaries_mean=10, image_kb=0)
+    counts = Counter(table for table, _ in _rows(config))
+    assert 30 * 400 * 0.85 < counts["products"] < 30 * 400 * 1.15
+    assert 10 * 400 * 0.85 < counts["pet_diaries"] < 10 * 400 * 1.15
+    flat = Counter(table for table, _ in _rows(seed_data.SeedConfig(users=10, products_mean=7, skew=0, image_kb=0)))
+    assert flat["products"] == 70
+
+
+def test_summaries_and_images_have_realistic_sizes():
+    rows = _rows(seed_data.SeedConfig(users=30, image_kb=50, image_ratio=1.0, summary_chars=300))
+    summaries = [row[2] for table, row in rows if table == "products"]
+    images = [row[5] for table, row in rows if table == "pet_diaries"]
+    assert min(len(s) for s in summaries) >= 300
+    assert all(i.startswith("data:image/jpeg;base64,") for i in images)
+    mean_kb = sum(len(i) for i in images) / len(images) * 3 / 4 / 1024
+    assert 30 < mean_kb < 80
+
+
+def test_ids_continue_after_existing_rows():
+    start = {"users": 101, "pets": 501, "products": 9001, "pet_diaries": 7001}
+    rows = _rows(seed_data.SeedConfig(users=3, image_kb=0), start)
+    first = {}
+    for table, row in rows:
+        first.setdefault(table, row[0])
+    assert first == start
+
+
+def test_seed_writes_in_multi_row_batches():
+    conn, cur = _make_conn(fetchone=(0,), fetchall=[])
+    config = seed_data.SeedConfig(users=50, products_mean=10, diaries_mean=0, image_kb=0, batch_rows=100)
+    counts = seed_data.seed(conn, config)
+    batches = [c.args for c in cur.executemany.call_args_list]
+    assert counts["users"] == 50
+    assert sum(len(rows) for sql, rows in batches if sql.startswith("INSERT INTO products")) == counts["products"]
+    assert max(len(rows) for _, rows in batches) <= 100
+    assert conn.commit.call_count >= counts["products"] // 100
+
+
+def _written(cur):
+    return [(sql.split()[2], row) for sql, rows in (c.args for c in cur.executemany.call_args_list) for row in rows]
+
+
+# 各資料表中 id 與外鍵欄位的位置
+_ID_COLUMNS = {"users": (0,), "pets": (0, 1), "products": (0, 3, 4), "pet_diaries": (0, 6, 7)}
+
+
+def _without_ids(rows):
+    return [(table, tuple(v for i, v in enumerate(row) if i not in _ID_COLUMNS[table])) for table, row in rows]
+
+
+def test_seed_skips_users_already_seeded_with_the_same_seed():
+    config = seed_data.SeedConfig(users=6, image_kb=2, batch_rows=10)
+    conn, cur = _make_conn(fetchone=(0,), fetchall=[("bench_42_0",), ("bench_42_3",)])
+    counts = seed_data.seed(conn, config)
+    sql, params = cur.execute.call_args_list[0].args
+    assert sql == "SELECT username FROM users WHERE username LIKE %s"
+    assert params == ("bench\\_42\\_%",)
+
+    written = _written(cur)
+    assert [row[:2] for table, row in written if table == "users"] == [
+        (1, "bench_42_1"), (2, "bench_42_2"), (3, "bench_42_4"), (4, "bench_42_5")]
+    assert counts == Counter(table for table, _ in written)
+    # 其餘使用者的資料與完整執行時相同，只有 id 重新連續編號
+    expected, owner = [], None
+    for table, row in _rows(config):
+        owner = row[1] if table == "users" else owner
+        if owner not in ("bench_42_0", "bench_42_3"):
+            expected.append((table, row))
+    assert sorted(_without_ids(written), key=repr) == sorted(_without_ids(expected), key=repr)
+
+
+def test_seed_commits_only_between_users():
+    config = seed_data.SeedConfig(users=30, products_mean=10, diaries_mean=5, image_kb=0, batch_rows=20)
+    conn, cur = _make_conn(fetchone=(0,), fetchall=[])
+    commits = []
+    conn.commit.side_effect = lambda: commits.append(Counter(_written(cur)))
+    seed_data.seed(conn, config)
+    generated = _rows(config)
+    boundaries = [i for i, (table, _) in enumerate(generated) if table == "users"] + [len(generated)]
+    assert len(commits) > 3
+    for committed in commits:
+        n = sum(committed.values())
+        assert n in boundaries
+        assert committed == Counter(generated[:n])
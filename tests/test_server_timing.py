@@ -0,0 +1,94 @@
+"""Tests for server_timing.py: Server-Timing header, query budgets and N+1 warnings."""
+import io
+import logging
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import model_connector
+import server_timing
+from tests.helpers import assert_query_budget, make_counting_conn, query_count, server_timing as parse
+
+_ROW = {
+    "id": 1, "name": "小黑", "breed": "", "birthday": None, "photo_base64": "", "user_id": 1,
+    "title": "罐頭", "summary": "", "pet_id": None, "memo": "", "image_base64": "",
+    "version": 3, "updated_at": None, "created_at": None,
+}
+
+
+def _request(client, method, url, json=None):
+    conn, _ = make_counting_conn(fetchone=_ROW, fetchall=[_ROW])
+    with patch("db.get_connection", return_value=conn), patch("db.init_db"), \
+         patch("db.prune_analysis_results"):
+        return client.open(url, method=method, json=json)
+
+
+# 各 endpoint 的查詢預算；寫入後重新讀取整筆、逐筆查詢等回歸會讓數字變大
+@pytest.mark.parametrize("method,url,json,budget", [
+    ("GET", "/api/pets", None, 2),
+    ("GET", "/api/products", None, 2),
+    ("GET", "/api/diaries", None, 2),
+    ("POST", "/api/pets", {"name": "小黑"}, 3),
+    ("PUT", "/api/pets/1", {"name": "小黑"}, 4),
+    ("PUT", "/api/products/1", {"title": "罐頭"}, 4),
+    ("DELETE", "/api/products/1", None, 3),
+    ("DELETE", "/api/pets/1", None, 7),
+    ("GET", "/organize", None, 3),
+    ("GET", "/organize/edit/1", None, 2),
+])
+def test_endpoint_query_budget(authed_client, method, url, json, budget):
+    res = _request(authed_client, method, url, json)
+    assert res.status_code < 400
+    assert_query_budget(res, budget)
+
+
+def test_server_timing_header_reports_db_model_and_app(authed_client):
+    res = _request(authed_client, "GET", "/api/pets")
+    timing = parse(res)
+    assert set(timing) == {"db", "model", "app"}
+    assert timing["db"]["desc"] == "2 queries"
+    assert all(m["dur"] >= 0 for m in timing.values())
+
+
+def test_model_time_is_attributed(authed_client, mock_db):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {"response": "{}"}
+
+    def slow_post(*args, **kwargs):
+        time.sleep(0.02)
+        return response
+
+    def analyze(*args, **kwargs):
+        model_connector._call_model_with_retry(b"{}")
+        return {"ok": True}
+
+    with patch("model_connector.requests.post", side_effect=slow_post), \
+            patch("app.model_connector.get_model_response_by_image", side_effect=analyze):
+        res = authed_client.post("/api/product/analyze", data={"image": (io.BytesIO(b"x"), "a.png")},
+                                 content_type="multipart/form-data")
+    assert parse(res)["model"]["dur"] >= 20
+
+
+def test_over_budget_and_repeated_statements_are_logged(caplog):
+    stats = server_timing.RequestStats()
+    for _ in range(6):
+        stats.add_query("SELECT * FROM pets WHERE id = %s", 0.001)
+    assert stats.repeated(threshold=5) == [("SELECT * FROM pets WHERE id = %s", 6)]
+    from app import app
+    with app.test_request_context("/api/pets"), patch("server_timing.BUDGET_COUNT", 5), \
+            caplog.at_level(logging.WARNING, logger="server_timing"):
+        server_timing._check_budget(stats, "api_get_pets")
+    messages = [r.getMessage() for r in caplog.records]
+    assert any("exceeded query budget: 6 queries" in m for m in messages)
+    assert any("Possible N+1 in GET api_get_pets: 6 x SELECT * FROM pets WHERE id = %s" in m for m in messages)
+
+
+def test_recording_outside_a_request_is_ignored():
+    assert server_timing.current() is None
+    server_timing.record_query("SELECT 1", 0.1)
+    server_timing.record_model_time(1.0)
+
+
+def test_query_count_helper_handles_single_query(authed_client):
+    assert query_count(_request(authed_client, "GET", "/pets")) == 1
@@ -0,0 +1,50 @@
+"""Tests for singleflight.py in-flight call coalescing."""
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_do_returns_result_not_shared():
+    sf = SingleFlight()
+    assert sf.do("k", lambda: 42) == (42, False)
+    assert sf.in_flight() == 0
+
+
+def test_concurrent_calls_share_one_execution():
+    sf = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"title": "T"}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(sf.do("k", slow)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(sf.do("k", slow))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    time.sleep(0.1)  # let the followers reach the wait on the leader's call
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 4
+    assert all(r[0] == {"title": "T"} for r in results)
+    assert sorted(r[1] for r in results) == [False, True, True, True]
+
+
+def test_error_propagates_to_waiters_and_key_is_released():
+    sf = SingleFlight()
+    with pytest.raises(RuntimeError):
+        sf.do("k", lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+    assert sf.do("k", lambda: "ok") == ("ok", False)
@@ -0,0 +1,112 @@
+"""Tests for slow_queries.py capture, EXPLAIN summary and report."""
+import json
+from unittest.mock import patch
+
+import pytest
+
+import slow_queries
+from tests.helpers import make_conn as _make_conn
+
+_PLAN = {"query_block": {"select_id": 1, "ordering_operation": {
+    "using_filesort": True,
+    "table": {"table_name": "pet_diaries", "access_type": "ALL", "rows_examined_per_scan": 5000, "key": None},
+}}}
+
+
+@pytest.fixture
+def slow_log(tmp_path):
+    log = slow_queries.SlowQueryLog(str(tmp_path / "slow.jsonl"), max_bytes=10_000, explain_interval=300)
+    with patch("slow_queries.log", log):
+        yield log
+
+
+def test_normalize_collapses_whitespace_literals_and_in_lists():
+    sql = """SELECT id FROM products
+             WHERE user_id = %s AND id IN (%s, %s, %s) AND title = 'x' LIMIT 20"""
+    assert slow_queries.normalize(sql) == "SELECT id FROM products WHERE user_id = ? AND id IN (...) AND title = ? LIMIT ?"
+
+
+def test_params_shape_hides_values():
+    assert slow_queries.params_shape((1, 2, 3, "a", b"x" * 2000)) == "int x3, str, bytes(2000)"
+    assert slow_queries.params_shape(None) == ""
+
+
+def test_summarize_plan_flags_full_scan_and_filesort():
+    summary = slow_queries.summarize_plan(_PLAN)
+    assert summary["full_scan"] == ["pet_diaries"]
+    assert summary["filesort"] is True
+    assert summary["rows_examined"] == 5000
+    assert summary["tables"][0]["key"] is None
+
+
+def test_capture_records_plan_once_per_interval(slow_log):
+    conn, cur = _make_conn(fetchone={"EXPLAIN": json.dumps(_PLAN)})
+    sql = "SELECT * FROM pet_diaries WHERE user_id = %s ORDER BY created_at DESC"
+    slow_queries.capture(conn, sql, (1,), 0.5, 20, "get_all_diaries")
+    slow_queries.capture(conn, sql, (2,), 0.7, 20, "get_all_diaries")
+    cur.execute.assert_called_once_with("EXPLAIN FORMAT=JSON " + sql, (1,))
+    first, second = slow_queries.read_log(slow_log.path)
+    assert first["statement"] == "SELECT * FROM pet_diaries WHERE user_id = ? ORDER BY created_at DESC"
+    assert first["params"] == "int"
+    assert first["plan"]["full_scan"] == ["pet_diaries"]
+    assert second["plan"] is None
+
+
+def test_capture_skips_explain_when_not_possible(slow_log):
+    conn, cur = _make_conn()
+    slow_queries.capture(conn, "SELECT * FROM pet_diaries", None, 0.5, 1, "iter_diaries_with_image", explain=False)
+    slow_queries.capture(conn, "ALTER TABLE pets ADD COLUMN x INT", None, 0.5, 0, "init_db")
+    cur.execute.assert_not_called()
+    assert len(slow_queries.read_log(slow_log.path)) == 2
+
+
+def test_capture_failure_is_only_logged(slow_log):
+    conn, cur = _make_conn()
+    cur.execute.side_effect = RuntimeError("gone")
+    slow_queries.capture(conn, "SELECT 1", None, 0.5, 1, "ping")
+    assert slow_queries.read_log(slow_log.path) == []
+
+
+def test_log_rotates_at_max_bytes(slow_log):
+    slow_log.max_bytes = 300
+    for i in range(10):
+        slow_log.write({"statement": "SELECT ?", "seconds": i, "padding": "x" * 50})
+    assert len(slow_queries.read_log(slow_log.path)) < 10
+    assert len(open(slow_log.path).read()) <= 300
+
+
+def test_slow_statement_from_db_cursor_is_captured():
+    import db
+
+    class _Base:
+        connection = object()
+
+        def execute(self, query, args=None):
+            return 7
+
+    class _Cursor(db._TimedQueries, _Base):
+        pass
+
+    with patch("slow_queries.THRESHOLD_MS", 0.000001), patch("slow_queries.capture") as capture:
+        _Cursor().execute("SELECT * FROM products WHERE user_id = %s", (1,))
+    args, kwargs = capture.call_args
+    assert args[1:3] == ("SELECT * FROM products WHERE user_id = %s", (1,))
+    assert args[4] == 7
+    assert kwargs == {"explain": True}
+
+
+def test_report_ranks_by_total_time(slow_log, capsys):
+    for seconds, statement, plan in [
+        (0.3, "SELECT * FROM products WHERE user_id = ?", None),
+        (0.3, "SELECT * FROM products WHERE user_id = ?", None),
+        (0.5, "SELECT * FROM pet_diaries WHERE user_id = ?", slow_queries.summarize_plan(_PLAN)),
+    ]:
+        slow_log.write({"function": "f", "statement": statement, "params": "int", "seconds": seconds,
+                        "rows": 1, "plan": plan})
+    groups = slow_queries.aggregate(slow_queries.read_log(slow_log.path))
+    assert [g["statement"] for g in groups][0] == "SELECT * FROM products WHERE user_id = ?"
+    assert groups[0]["count"] == 2
+    assert slow_queries.main(["report", "--file", slow_log.path]) == 0
+    out = capsys.readouterr().out
+    assert "FULL SCAN pet_diaries, filesort" in out
+    assert out.index("FROM products") < out.index("FROM pet_diaries")
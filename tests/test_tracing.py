@@ -0,0 +1,131 @@
+"""Tests for tracing.py spans and their Flask/db/model wiring."""
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import tracing
+from tests.helpers import make_conn as _make_conn
+
+
+@pytest.fixture
+def exporter():
+    exporter = tracing.InMemoryExporter()
+    tracing.configure(exporter)
+    yield exporter
+    tracing.configure(None)
+
+
+def _spans(exporter):
+    tracing.flush()
+    return {s["name"]: s for s in exporter.spans}
+
+
+def _attributes(span):
+    return {a["key"]: next(iter(a["value"].values())) for a in span["attributes"]}
+
+
+def test_disabled_tracing_yields_noop_span():
+    with tracing.span("work") as span:
+        span.set_attribute("k", 1)
+    assert span is tracing.NOOP_SPAN
+    assert tracing.current_span() is tracing.NOOP_SPAN
+
+
+def test_nested_spans_share_trace_and_link_parent(exporter):
+    with tracing.span("outer"):
+        with tracing.span("inner", tracing.CLIENT, answer=42):
+            pass
+    spans = _spans(exporter)
+    assert spans["inner"]["traceId"] == spans["outer"]["traceId"]
+    assert spans["inner"]["parentSpanId"] == spans["outer"]["spanId"]
+    assert "parentSpanId" not in spans["outer"]
+    assert spans["inner"]["kind"] == tracing.CLIENT
+    assert _attributes(spans["inner"])["answer"] == "42"
+
+
+def test_exception_marks_span_as_error(exporter):
+    with pytest.raises(ValueError):
+        with tracing.span("boom"):
+            raise ValueError("bad")
+    span = _spans(exporter)["boom"]
+    assert span["status"] == {"code": 2, "message": "ValueError: bad"}
+
+
+def test_unsampled_trace_records_no_children(exporter):
+    tracing.configure(exporter, sample_ratio=0)
+    with tracing.span("root"):
+        with tracing.span("child") as child:
+            assert child is tracing.NOOP_SPAN
+    assert _spans(exporter) == {}
+
+
+def test_request_span_continues_incoming_traceparent(client, mock_db, exporter):
+    trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    client.get("/login", headers={"traceparent": f"00-{trace_id}-{parent_id}-01"})
+    span = _spans(exporter)["GET /login"]
+    assert span["traceId"] == trace_id
+    assert span["parentSpanId"] == parent_id
+    assert span["kind"] == tracing.SERVER
+    assert _attributes(span)["http.status_code"] == "200"
+
+
+def test_db_function_span_nests_under_request(authed_client, exporter):
+    conn, _ = _make_conn(fetchall=[])
+    with patch("db.get_connection", return_value=conn), patch("db.init_db"), \
+         patch("db.prune_analysis_results"):
+        authed_client.get("/api/pets")
+    spans = _spans(exporter)
+    assert spans["db.get_all_pets"]["parentSpanId"] == spans["GET /api/pets"]["spanId"]
+
+
+def test_statement_span_records_sql_and_rows(exporter):
+    import db
+
+    class _Base:
+        def execute(self, query, args=None):
+            return 3
+
+    class _Cursor(db._TimedQueries, _Base):
+        pass
+
+    with tracing.span("db.get_all_pets"):
+        _Cursor().execute("SELECT * FROM pets WHERE user_id = %s", (1,))
+    spans = _spans(exporter)
+    attrs = _attributes(spans["mysql.query"])
+    assert spans["mysql.query"]["parentSpanId"] == spans["db.get_all_pets"]["spanId"]
+    assert attrs["db.statement"] == "SELECT * FROM pets WHERE user_id = %s"
+    assert attrs["db.rows"] == "3"
+
+
+def test_ollama_attempt_span_carries_model_timings(exporter):
+    import model_connector
+    response = MagicMock(status_code=200)
+    response.json.return_value = {"response": "{}", "eval_count": 12, "total_duration": 3000000000}
+    with patch("model_connector.requests.post", return_value=response):
+        model_connector._call_model_with_retry(b'{"model": "m"}')
+    attrs = _attributes(_spans(exporter)["ollama.generate"])
+    assert attrs["ollama.attempt"] == "1"
+    assert attrs["ollama.eval_count"] == "12"
+    assert attrs["http.request_content_length"] == str(len(b'{"model": "m"}'))
+
+
+def test_jsonl_exporter_writes_one_span_per_line(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(tracing.JsonlExporter(str(path)))
+    try:
+        with tracing.span("a"):
+            pass
+        with tracing.span("b"):
+            pass
+        tracing.flush()
+    finally:
+        tracing.configure(None)
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [s["name"] for s in lines] == ["a", "b"]
+    assert lines[0]["service"] == tracing.SERVICE_NAME
+
+
+def test_parse_traceparent_rejects_malformed_headers():
+    assert tracing._parse_traceparent("garbage") == (None, None)
+    assert tracing._parse_traceparent("00-abc-def-01") == (None, None)
@@ -0,0 +1,350 @@
+"""
+OpenTelemetry 形式的追蹤 span：Flask 請求、db.py 函式與 SQL 陳述式、每次 Ollama 呼叫。
+
+以 TRACING_EXPORTER 選擇輸出（預設 none，不產生任何 span）：
+    jsonl  每個 span 一行寫入 TRACING_FILE，離線也能用 `jq` 分析
+    otlp   以 OTLP/HTTP JSON 批次送往 TRACING_OTLP_ENDPOINT（例如本機的 OpenTelemetry Collector）
+
+span 結構與 OTLP JSON 相同（traceId、spanId、startTimeUnixNano、attributes…）。
+結束的 span 放入佇列，由背景執行緒批次輸出，請求本身不等待 I/O；佇列滿時捨棄並記錄數量。
+請求帶有 W3C traceparent 標頭時沿用其 trace id。
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "pet-adorable-life")
+_MAX_QUEUE = 10000
+_BATCH_SIZE = 512
+_FLUSH_INTERVAL = 2.0
+# 屬性字串的長度上限（SQL 陳述式等）
+_MAX_ATTRIBUTE_LENGTH = 1000
+
+# OTLP SpanKind
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+_current = contextvars.ContextVar("tracing_span", default=None)
+
+
+def _random_hex(nbytes):
+    return random.getrandbits(nbytes * 8).to_bytes(nbytes, "big").hex()
+
+
+def _attribute_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)[:_MAX_ATTRIBUTE_LENGTH]}
+
+
+class Span:
+    """進行中的 span；結束時轉為 OTLP JSON dict 交給 processor。"""
+
+    recording = True
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, kind=INTERNAL):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = _random_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.error = message
+
+    def record_error(self, exc):
+        self.error = f"{type(exc).__name__}: {exc}"
+        self.attributes["exception.type"] = type(exc).__name__
+
+    def to_dict(self, end_ns):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": [
+                {"key": k, "value": _attribute_value(v)} for k, v in self.attributes.items() if v is not None
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """未啟用或未取樣時使用；所有操作皆不做事。"""
+
+    recording = False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, message):
+        pass
+
+    def record_error(self, exc):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+# ========== Exporters ==========
+
+
+class JsonlExporter:
+    """每個 span 一行 JSON，附加寫入檔案。"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(dict(span, service=SERVICE_NAME), ensure_ascii=False) + "\n")
+
+
+class OtlpHttpExporter:
+    """OTLP/HTTP JSON（/v1/traces）。"""
+
+    def __init__(self, endpoint, timeout=5):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, spans):
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "pet-adorable-life"}, "spans": spans}],
+        }]}
+        requests.post(self.endpoint, json=body, timeout=self.timeout).raise_for_status()
+
+
+class InMemoryExporter:
+    """保留輸出的 span，供測試使用。"""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+class _BatchProcessor:
+    """以背景執行緒批次輸出結束的 span。"""
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=_MAX_QUEUE)
+        self._export_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tracing-export", daemon=True)
+        self._thread.start()
+
+    def submit(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning("Tracing queue full, %d spans dropped so far", self.dropped)
+
+    def _drain(self, block):
+        batch = []
+        try:
+            if block:
+                batch.append(self._queue.get(timeout=_FLUSH_INTERVAL))
+            while len(batch) < _BATCH_SIZE:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _export(self, batch):
+        if not batch:
+            return
+        with self._export_lock:
+            try:
+                self.exporter.export(batch)
+            except Exception as e:  # 追蹤輸出失敗不影響服務
+                logger.warning("Dropped %d spans: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._export(self._drain(block=True))
+
+    def flush(self):
+        """同步輸出佇列中所有 span，並等待背景執行緒手上的批次完成。"""
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                break
+            self._export(batch)
+        self._queue.join()
+
+    def shutdown(self):
+        self._stopped.set()
+        self.flush()
+
+
+def _exporter_from_env():
+    kind = os.getenv("TRACING_EXPORTER", "none").lower()
+    if kind == "jsonl":
+        return JsonlExporter(os.getenv("TRACING_FILE", "traces.jsonl"))
+    if kind == "otlp":
+        return OtlpHttpExporter(os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"))
+    if kind != "none":
+        logger.warning("Unknown TRACING_EXPORTER %r, tracing disabled", kind)
+    return None
+
+
+_processor = None
+_sample_ratio = 1.0
+
+
+def configure(exporter, sample_ratio=1.0):
+    """設定 exporter（None 表示停用）；回傳新的 processor。"""
+    global _processor, _sample_ratio
+    if _processor is not None:
+        _processor.shutdown()
+    _processor = _BatchProcessor(exporter) if exporter is not None else None
+    _sample_ratio = sample_ratio
+    return _processor
+
+
+def flush():
+    if _processor is not None:
+        _processor.flush()
+
+
+def enabled():
+    return _processor is not None
+
+
+# ========== Span API ==========
+
+
+def start_span(name, attributes=None, traceparent=None, kind=INTERNAL):
+    """開始 span 並設為目前 span，回傳 (span, token)；須以 end_span 結束。"""
+    parent = _current.get()
+    if _processor is None or parent is NOOP_SPAN:
+        return NOOP_SPAN, None
+    if parent is None:
+        trace_id, parent_id = _parse_traceparent(traceparent)
+        if trace_id is None:
+            if random.random() >= _sample_ratio:
+                return NOOP_SPAN, _current.set(NOOP_SPAN)
+            trace_id = _random_hex(16)
+    else:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    span = Span(name, trace_id, parent_id, attributes, kind)
+    return span, _current.set(span)
+
+
+def end_span(span, token):
+    if token is not None:
+        try:
+            _current.reset(token)
+        except ValueError:  # 在不同的 context 中結束（例如串流回應）
+            pass
+    if span.recording and _processor is not None:
+        _processor.submit(span.to_dict(time.time_ns()))
+
+
+@contextmanager
+def span(name, kind=INTERNAL, **attributes):
+    """以 with 包住一段程式；例外會記錄在 span 上並照常拋出。"""
+    current, token = start_span(name, attributes, kind=kind)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        end_span(current, token)
+
+
+def current_span():
+    return _current.get() or NOOP_SPAN
+
+
+def _parse_traceparent(header):
+    """W3C traceparent：00-<trace id>-<parent id>-<flags>。"""
+    if not header:
+        return None, None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+# ========== Flask ==========
+
+
+def _before_request():
+    g._trace_span, g._trace_token = start_span(
+        f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+        {"http.method": request.method, "http.route": request.endpoint, "http.target": request.path,
+         "http.request_content_length": request.content_length},
+        traceparent=request.headers.get("traceparent"),
+        kind=SERVER,
+    )
+
+
+def _after_request(response):
+    span_ = g.get("_trace_span")
+    if span_ is not None:
+        span_.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span_.set_error(f"HTTP {response.status_code}")
+    return response
+
+
+def _teardown_request(exc):
+    span_ = g.pop("_trace_span", None)
+    if span_ is None:
+        return
+    if exc is not None:
+        span_.record_error(exc)
+    end_span(span_, g.pop("_trace_token", None))
+
+
+def init_app(app):
+    """依環境變數設定 exporter，並為每個請求建立根 span；須在其他 before_request 之前呼叫。"""
+    if _processor is None:
+        exporter = _exporter_from_env()
+        if exporter is not None:
+            configure(exporter, float(os.getenv("TRACING_SAMPLE_RATIO", "1.0")))
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+atexit.register(flush)